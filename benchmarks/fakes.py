@@ -0,0 +1,539 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import asyncio
+import hashlib
+import importlib
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+## Local stand-ins for FastF1, Ollama, SQL Server and Telegram, so the whole
+## pipeline runs offline with configurable latencies. They are configured with
+## BENCH_* environment variables so spawned worker processes pick up the same
+## setup; install_fakes() must run before the bot modules are imported.
+
+## Seconds a stand-in takes for each kind of external call
+DEFAULT_LATENCIES = {
+    'BENCH_LOAD_SECONDS': '2.0',       ##FastF1 session not in the disk cache (API download and parsing)
+    'BENCH_DISK_LOAD_SECONDS': '0.3',  ##FastF1 session read from the disk cache
+    'BENCH_LLM_SECONDS': '1.0',        ##Ollama chat completion
+    'BENCH_TELEGRAM_SECONDS': '0.05',  ##Telegram API call
+}
+
+## 2024 grid: number, code, first name, last name, team, team color
+GRID = [
+    ('1', 'VER', 'Max', 'Verstappen', 'Red Bull Racing', '3671C6'),
+    ('11', 'PER', 'Sergio', 'Perez', 'Red Bull Racing', '3671C6'),
+    ('16', 'LEC', 'Charles', 'Leclerc', 'Ferrari', 'E8002D'),
+    ('55', 'SAI', 'Carlos', 'Sainz', 'Ferrari', 'E8002D'),
+    ('4', 'NOR', 'Lando', 'Norris', 'McLaren', 'FF8000'),
+    ('81', 'PIA', 'Oscar', 'Piastri', 'McLaren', 'FF8000'),
+    ('44', 'HAM', 'Lewis', 'Hamilton', 'Mercedes', '27F4D2'),
+    ('63', 'RUS', 'George', 'Russell', 'Mercedes', '27F4D2'),
+    ('14', 'ALO', 'Fernando', 'Alonso', 'Aston Martin', '229971'),
+    ('18', 'STR', 'Lance', 'Stroll', 'Aston Martin', '229971'),
+    ('10', 'GAS', 'Pierre', 'Gasly', 'Alpine', 'FF87BC'),
+    ('31', 'OCO', 'Esteban', 'Ocon', 'Alpine', 'FF87BC'),
+    ('23', 'ALB', 'Alexander', 'Albon', 'Williams', '64C4FF'),
+    ('43', 'COL', 'Franco', 'Colapinto', 'Williams', '64C4FF'),
+    ('22', 'TSU', 'Yuki', 'Tsunoda', 'RB', '6692FF'),
+    ('30', 'LAW', 'Liam', 'Lawson', 'RB', '6692FF'),
+    ('27', 'HUL', 'Nico', 'Hulkenberg', 'Haas F1 Team', 'B6BABD'),
+    ('20', 'MAG', 'Kevin', 'Magnussen', 'Haas F1 Team', 'B6BABD'),
+    ('77', 'BOT', 'Valtteri', 'Bottas', 'Kick Sauber', '52E252'),
+    ('24', 'ZHO', 'Guanyu', 'Zhou', 'Kick Sauber', '52E252'),
+]
+
+RACE_LAPS = 57
+SESSION_NAMES = {'R': 'Race', 'Q': 'Qualifying'}
+
+_installed = False
+
+def latency(name):
+    return float(os.getenv(name, DEFAULT_LATENCIES[name]))
+
+def _seed(*parts):
+    return int(hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:8], 16)
+
+def bench_dir():
+    return os.environ['BENCH_DIR']
+
+## FastF1
+
+def event_locations():
+    from llm.query_parser import CIRCUIT_ALIASES
+    return list(dict.fromkeys(CIRCUIT_ALIASES.values()))
+
+def make_schedule(year, include_testing=False, **kwargs):
+    """Synthetic event schedule with one conventional weekend per known circuit."""
+    from fastf1.events import EventSchedule
+    rows = []
+    for round_number, location in enumerate(event_locations(), start=1):
+        race_day = pd.Timestamp(year, 3, 2) + pd.Timedelta(weeks=round_number - 1)
+        row = {
+            'RoundNumber': round_number,
+            'Country': location,
+            'Location': location,
+            'OfficialEventName': f"Formula 1 {location} Grand Prix {year}",
+            'EventDate': race_day,
+            'EventName': f"{location} Grand Prix",
+            'EventFormat': 'conventional',
+            'F1ApiSupport': True,
+        }
+        sessions = [('Practice 1', -2, 11), ('Practice 2', -2, 15), ('Practice 3', -1, 11),
+                    ('Qualifying', -1, 15), ('Race', 0, 14)]
+        for i, (name, day, hour) in enumerate(sessions, start=1):
+            start = race_day + pd.Timedelta(days=day, hours=hour)
+            row[f'Session{i}'] = name
+            row[f'Session{i}Date'] = start.tz_localize('UTC')
+            row[f'Session{i}DateUtc'] = start
+        rows.append(row)
+    return EventSchedule(pd.DataFrame(rows), year=year)
+
+def _driver_info(api_path):
+    return {
+        number: {'RacingNumber': number, 'Tla': code, 'FirstName': first, 'LastName': last,
+                 'TeamName': team, 'TeamColour': color}
+        for number, code, first, last, team, color in GRID
+    }
+
+def _personal_bests(laps):
+    best = laps.groupby('Driver')['LapTime'].cummin()
+    return laps['LapTime'] <= best
+
+def make_race_data(year, track):
+    rng = np.random.default_rng(_seed(year, track, 'R'))
+    pace = {code: 92.0 + i * 0.12 + rng.normal(0, 0.15) for i, (_, code, *_) in enumerate(GRID)}
+    rows = []
+    for number, code, first, last, team, color in GRID:
+        pit_lap = int(rng.integers(18, 32))
+        elapsed = 0.0
+        for lap in range(1, RACE_LAPS + 1):
+            stint = 1 if lap <= pit_lap else 2
+            tyre_life = lap if stint == 1 else lap - pit_lap
+            lap_time = pace[code] - 0.05 * lap + 0.06 * tyre_life + rng.normal(0, 0.3)
+            if lap == 1:
+                lap_time += 6.0
+            if lap == pit_lap:
+                lap_time += 21.0
+            elapsed += lap_time
+            rows.append({
+                'Time': pd.Timedelta(seconds=elapsed), 'Driver': code, 'DriverNumber': number,
+                'LapTime': pd.Timedelta(seconds=lap_time), 'LapNumber': float(lap), 'Stint': float(stint),
+                'Compound': 'MEDIUM' if stint == 1 else 'HARD', 'TyreLife': float(tyre_life),
+                'FreshTyre': True, 'Team': team, 'IsAccurate': True, 'Deleted': False,
+            })
+    laps = pd.DataFrame(rows)
+    laps['Position'] = laps.groupby('LapNumber')['Time'].rank(method='first')
+    laps['IsPersonalBest'] = _personal_bests(laps)
+    finish = laps[laps['LapNumber'] == RACE_LAPS].sort_values('Position')
+    return laps, [finish['DriverNumber'].tolist(), finish['Time'].tolist()]
+
+def make_qualifying_data(year, track):
+    rng = np.random.default_rng(_seed(year, track, 'Q'))
+    rows = []
+    for i, (number, code, first, last, team, color) in enumerate(GRID):
+        pace = 78.0 + i * 0.08 + rng.normal(0, 0.2)
+        for lap in range(1, int(rng.integers(4, 9)) + 1):
+            lap_time = pd.Timedelta(seconds=pace + abs(rng.normal(0.4, 0.3)))
+            rows.append({
+                'Time': pd.Timedelta(minutes=lap * 3), 'LapStartTime': pd.Timedelta(minutes=lap * 3) - lap_time,
+                'Driver': code, 'DriverNumber': number, 'LapTime': lap_time,
+                'LapNumber': float(lap), 'Stint': 1.0, 'Compound': 'SOFT', 'TyreLife': float(lap),
+                'FreshTyre': True, 'Team': team, 'IsAccurate': True, 'Deleted': False,
+            })
+    laps = pd.DataFrame(rows)
+    laps['IsPersonalBest'] = _personal_bests(laps)
+    best = laps.groupby('DriverNumber')['LapTime'].min().sort_values()
+    return laps, [best.index.tolist(), best.tolist()]
+
+RACE_POINTS = (25, 18, 15, 12, 10, 8, 6, 4, 2, 1)
+
+TELEMETRY_HZ = 4
+
+def make_telemetry(laps):
+    """
+    Car and position data at TELEMETRY_HZ for every lap of a qualifying
+    session, from one speed profile of the track scaled by each lap's time.
+
+    Returns:
+        tuple: (car data, pos data) DataFrames per driver number
+    """
+    car_data, pos_data = {}, {}
+    start_date = pd.Timestamp('2024-01-01')
+    for number, driver_laps in laps.groupby('DriverNumber'):
+        car_frames, pos_frames = [], []
+        for lap in driver_laps.itertuples():
+            seconds = lap.LapTime.total_seconds()
+            start = lap.LapStartTime.total_seconds()
+            t = np.arange(0, seconds, 1 / TELEMETRY_HZ)
+            fraction = t / seconds
+            corners = 0.5 + 0.5 * np.cos(2 * np.pi * 7 * fraction) * np.cos(2 * np.pi * 2 * fraction)
+            speed = (120 + 200 * corners) * 80 / seconds
+            braking = np.gradient(speed) < -2
+            session_time = pd.to_timedelta(start + t, unit='s')
+            car_frames.append(pd.DataFrame({
+                'Date': start_date + session_time, 'SessionTime': session_time, 'Time': session_time,
+                'RPM': 9000 + speed * 20, 'Speed': speed, 'nGear': np.clip(speed // 40 + 1, 1, 8).astype(int),
+                'Throttle': np.where(braking, 0, np.clip((speed - 100) / 1.5, 0, 100)),
+                'Brake': braking, 'DRS': 0, 'Source': 'car',
+            }))
+            pos_time = pd.to_timedelta(start + t + 0.5 / TELEMETRY_HZ, unit='s')
+            angle = 2 * np.pi * (fraction + 0.5 / TELEMETRY_HZ / seconds)
+            pos_frames.append(pd.DataFrame({
+                'Date': start_date + pos_time, 'SessionTime': pos_time, 'Time': pos_time, 'Status': 'OnTrack',
+                'X': 4000 * np.cos(angle) + 800 * np.cos(3 * angle), 'Y': 2500 * np.sin(angle), 'Z': 0.0,
+                'Source': 'pos',
+            }))
+        car_data[number] = pd.concat(car_frames, ignore_index=True)
+        pos_data[number] = pd.concat(pos_frames, ignore_index=True)
+    return car_data, pos_data
+
+def _make_synthetic_session_class():
+    from fastf1.core import Session, Laps, SessionResults, Telemetry
+
+    class SyntheticSession(Session):
+        """
+        FastF1 session whose data is generated instead of downloaded. Loading
+        takes BENCH_LOAD_SECONDS the first time and BENCH_DISK_LOAD_SECONDS
+        once a marker file exists in the FastF1 cache directory, like a
+        session that was parsed before.
+        """
+        def load(self, *, laps=True, telemetry=True, weather=True, messages=True, livedata=None):
+            from data.cache import disk_cache
+            session_dir = disk_cache.session_dir(self)
+            marker = os.path.join(session_dir, 'synthetic.ff1pkl')
+            if os.path.exists(marker):
+                time.sleep(latency('BENCH_DISK_LOAD_SECONDS'))
+            else:
+                time.sleep(latency('BENCH_LOAD_SECONDS'))
+                os.makedirs(session_dir, exist_ok=True)
+                with open(marker, 'w'):
+                    pass
+
+            year, track = self.event.year, self.event['Location']
+            grid = {}
+            if self.name == 'Race':
+                lap_data, (order, times) = make_race_data(year, track)
+                grid = {number: float(i) for i, number in enumerate(make_qualifying_data(year, track)[1][0], start=1)}
+            else:
+                lap_data, (order, times) = make_qualifying_data(year, track)
+            drivers = {number: (code, first, last, team, color) for number, code, first, last, team, color in GRID}
+            results = pd.DataFrame([
+                {
+                    'DriverNumber': number, 'Abbreviation': drivers[number][0],
+                    'FirstName': drivers[number][1], 'LastName': drivers[number][2],
+                    'FullName': f"{drivers[number][1]} {drivers[number][2]}",
+                    'TeamName': drivers[number][3], 'TeamColor': drivers[number][4],
+                    'Position': float(position), 'ClassifiedPosition': str(position),
+                    'GridPosition': grid.get(number, np.nan),
+                    'Points': float(RACE_POINTS[position - 1]) if self.name == 'Race' and position <= len(RACE_POINTS) else 0.0,
+                    'Time': lap_time, 'Status': 'Finished',
+                }
+                for position, (number, lap_time) in enumerate(zip(order, times), start=1)
+            ])
+            self._results = SessionResults(results, _force_default_cols=True)
+            self._laps = Laps(lap_data, session=self, _force_default_cols=True)
+            if telemetry and self.name == 'Qualifying':
+                car_data, pos_data = make_telemetry(lap_data)
+                self._car_data = {n: Telemetry(d, session=self, driver=n) for n, d in car_data.items()}
+                self._pos_data = {n: Telemetry(d, session=self, driver=n) for n, d in pos_data.items()}
+            self._total_laps = RACE_LAPS if self.name == 'Race' else None
+
+    return SyntheticSession
+
+_session_class = None
+
+def get_session(year, gp, identifier=None, **kwargs):
+    global _session_class
+    if _session_class is None:
+        _session_class = _make_synthetic_session_class()
+    schedule = make_schedule(year)
+    matches = schedule[schedule['Location'].str.lower() == str(gp).lower()]
+    if matches.empty:
+        raise ValueError(f"No synthetic event for '{gp}'")
+    event = matches.iloc[0]
+    event.year = year
+    return _session_class(event, SESSION_NAMES.get(identifier, identifier), f1_api_support=True)
+
+## Ollama
+
+class FakeOllama:
+    """
+    Answers chat requests after BENCH_LLM_SECONDS with canned content. With
+    stream=True the content comes in chunks spread over the same time.
+    """
+    @staticmethod
+    def chat(model=None, messages=None, stream=False, **kwargs):
+        prompt = messages[-1]['content'] if messages else ''
+        if '"pilot"' in prompt:
+            content = '{"pilot": "Colapinto", "year": 2024, "track": "Monaco"}'
+        else:
+            content = "Resumen de prueba: ritmo constante, buena gestión de neumáticos y sin incidentes."
+        if stream:
+            return FakeOllama._stream(content)
+        time.sleep(latency('BENCH_LLM_SECONDS'))
+        return {'message': {'role': 'assistant', 'content': content}}
+
+    @staticmethod
+    def _stream(content):
+        words = content.split(' ')
+        for i, word in enumerate(words):
+            time.sleep(latency('BENCH_LLM_SECONDS') / len(words))
+            yield {'message': {'role': 'assistant', 'content': word if i == 0 else ' ' + word}, 'done': i == len(words) - 1}
+
+## SQL Server
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS EventF1 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    season INT NOT NULL,
+    gp TEXT NOT NULL,
+    driver TEXT NOT NULL,
+    UNIQUE (season, gp, driver)
+);
+CREATE TABLE IF NOT EXISTS Graph (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INT NOT NULL REFERENCES EventF1(id),
+    name TEXT NOT NULL,
+    graph_path TEXT NOT NULL,
+    description TEXT,
+    telegram_file_id TEXT NULL
+);
+CREATE TABLE IF NOT EXISTS Resume (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INT NOT NULL REFERENCES EventF1(id),
+    type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    input_hash TEXT NULL,
+    model TEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS EventStats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INT NOT NULL UNIQUE REFERENCES EventF1(id),
+    version INT NOT NULL,
+    round INT NOT NULL,
+    event_name TEXT NOT NULL,
+    grid_position INT NULL,
+    finish_position INT NULL,
+    status TEXT NULL,
+    points REAL NULL,
+    teammate TEXT NULL,
+    teammate_finish_position INT NULL,
+    teammate_quali_gap REAL NULL,
+    teammate_pace_gap REAL NULL,
+    pole_gap REAL NULL,
+    pole_gap_pct REAL NULL,
+    pace_percentile REAL NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+OUTPUT_PATTERN = re.compile(r'\bOUTPUT\s+((?:INSERTED\.\w+\s*,?\s*)+)', re.IGNORECASE)
+TOP_PATTERN = re.compile(r'\bSELECT\s+TOP\s+(\d+)\s+', re.IGNORECASE)
+HINT_PATTERN = re.compile(r'\bWITH\s*\(\s*UPDLOCK\s*,\s*HOLDLOCK\s*\)', re.IGNORECASE)
+
+def translate_sql(query):
+    """
+    Rewrites the T-SQL the bot uses into SQLite. Returns None for the
+    schema migrations, which the stand-in applies itself.
+    """
+    stripped = query.strip()
+    if stripped.upper().startswith('IF '):
+        return None
+    stripped = HINT_PATTERN.sub('', stripped)
+    output = OUTPUT_PATTERN.search(stripped)
+    if output:
+        columns = output.group(1).replace('INSERTED.', '').strip().rstrip(',')
+        stripped = OUTPUT_PATTERN.sub('', stripped) + f" RETURNING {columns}"
+    top = TOP_PATTERN.search(stripped)
+    if top:
+        stripped = TOP_PATTERN.sub('SELECT ', stripped) + f" LIMIT {top.group(1)}"
+    return stripped
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    def execute(self, query, params=()):
+        translated = translate_sql(query)
+        if translated is None:
+            return self
+        if 'UPDLOCK' in query.upper() and not self.connection.raw.in_transaction:
+            ## Closest SQLite has to UPDLOCK: take the write lock for the rest of the transaction
+            self._cursor.execute('BEGIN IMMEDIATE')
+        self._cursor.execute(translated, tuple(params))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(translate_sql(query), [tuple(p) for p in seq_of_params])
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class SQLiteConnection:
+    """DB-API connection over a SQLite file that accepts the bot's T-SQL."""
+    def __init__(self, path):
+        self.raw = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+def database_path():
+    return os.path.join(bench_dir(), 'bench.sqlite')
+
+def connect(*args, **kwargs):
+    return SQLiteConnection(database_path())
+
+def create_database():
+    connection = sqlite3.connect(database_path())
+    connection.executescript(SCHEMA)
+    connection.close()
+
+def reset_database():
+    connection = sqlite3.connect(database_path(), timeout=30)
+    connection.executescript("DELETE FROM EventStats; DELETE FROM Resume; DELETE FROM Graph; DELETE FROM EventF1;")
+    connection.close()
+
+def _install_sql_server():
+    import sqlalchemy
+    try:
+        import pyodbc
+    except ImportError:
+        ## No ODBC driver manager on this machine, the stand-in replaces the driver entirely
+        import types
+        pyodbc = types.ModuleType('pyodbc')
+        pyodbc.Error = sqlite3.Error
+        sys.modules['pyodbc'] = pyodbc
+    pyodbc.connect = connect
+
+    real_create_engine = sqlalchemy.create_engine
+    def create_engine(url, *args, **kwargs):
+        if str(url).startswith('mssql'):
+            url = 'sqlite://'
+        return real_create_engine(url, *args, **kwargs)
+    sqlalchemy.create_engine = create_engine
+
+## Telegram
+
+class FakePhotoSize:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+class FakeMessage:
+    """Message whose replies and edits take BENCH_TELEGRAM_SECONDS each."""
+    _file_ids = itertools.count(1)
+
+    def __init__(self, text=None, photo=None):
+        self.text = text
+        self.photo = photo or []
+
+    async def _api_call(self):
+        await asyncio.sleep(latency('BENCH_TELEGRAM_SECONDS'))
+
+    async def reply_text(self, text, **kwargs):
+        await self._api_call()
+        return FakeMessage(text)
+
+    async def edit_text(self, text, **kwargs):
+        await self._api_call()
+        self.text = text
+        return self
+
+    async def delete(self):
+        await self._api_call()
+        return True
+
+    def _photo_message(self, media):
+        file_id = media if isinstance(media, str) else f"bench-file-{next(self._file_ids)}"
+        return FakeMessage(photo=[FakePhotoSize(file_id)])
+
+    async def reply_photo(self, photo, caption=None, **kwargs):
+        await self._api_call()
+        return self._photo_message(photo)
+
+    async def reply_media_group(self, media, **kwargs):
+        await self._api_call()
+        return [self._photo_message(item.media) for item in media]
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+class FakeUpdate:
+    def __init__(self, chat_id, text):
+        self.effective_chat = FakeChat(chat_id)
+        self.message = FakeMessage(text)
+
+class FakeContext:
+    def __init__(self):
+        self.user_data = {}
+
+## Setup
+
+def configure(directory, **latencies):
+    """
+    Stores the benchmark setup in the environment, where install_fakes and
+    the worker processes read it.
+
+    Args:
+        directory (str): Directory for the SQLite database, FastF1 cache and images
+        **latencies: Overrides of DEFAULT_LATENCIES, e.g. BENCH_LLM_SECONDS=0.5
+    """
+    os.environ['BENCH_DIR'] = directory
+    os.environ['FASTF1_CACHE_DIR'] = os.path.join(directory, 'fastf1_cache')
+    os.environ['LAP_STORE_DIR'] = os.path.join(directory, 'lap_store')
+    os.environ['DRIVER_REGISTRY_DIR'] = os.path.join(directory, 'driver_registry')
+    os.environ['FASTF1_CACHE_SEED'] = ''
+    os.environ['FASTF1_OFFLINE'] = 'false'
+    os.environ['PREWARM_ENABLED'] = 'false'
+    for name, default in DEFAULT_LATENCIES.items():
+        os.environ[name] = str(latencies.get(name, os.getenv(name, default)))
+    create_database()
+
+def install_fakes():
+    """
+    Points FastF1, Ollama, the database layer and graph archival at the
+    stand-ins. Safe to call many times; must run before the bot modules are
+    imported, which it then imports.
+    """
+    global _installed
+    if _installed:
+        return
+    if os.getenv('BENCH_QUIET', '').lower() in ('1', 'true', 'yes') and multiprocessing.parent_process():
+        sys.stdout = open(os.devnull, 'w') ##Worker processes print every step
+
+    import fastf1
+    import fastf1._api
+    import ollama
+    fastf1.get_session = get_session
+    fastf1.get_event_schedule = make_schedule
+    fastf1._api.driver_info = _driver_info
+    ollama.chat = FakeOllama.chat
+    _install_sql_server()
+
+    import data.driver_analysis as driver_analysis
+    media_dir = os.path.join(bench_dir(), 'media')
+    def get_graph_filepath(name, driver, track, year):
+        extension = driver_analysis.get_render_profile()['extension']
+        return os.path.join(media_dir, f"{name}_{driver}_{track}_{year}.{extension}")
+    driver_analysis.get_graph_filepath = get_graph_filepath
+    _installed = True
+
+def call_installed(module_name, function_name, *args, **kwargs):
+    """Runs module.function in a process with the stand-ins installed. Picklable for worker processes."""
+    install_fakes()
+    return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
@@ -0,0 +1,53 @@
+import os
+import sys
+import argparse
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Import-time profile of the bot's modules, from python -X importtime.
+## Usage: python -m benchmarks.imports --top 15 --max-seconds 0.5
+##        python -m benchmarks.imports --module data.driver_analysis
+
+def profile_imports(module):
+    """
+    Imports module in a fresh interpreter with -X importtime.
+
+    Returns:
+        list: (cumulative seconds, self seconds, module name) of every imported module
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not import {module}:\n{result.stderr.strip().splitlines()[-1]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, name.rstrip()))
+    return imports
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show which imports slow down the bot's startup")
+    parser.add_argument('--module', default='bot.botHandler', help="Module to import (default bot.botHandler)")
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports shown")
+    parser.add_argument('--max-seconds', type=float, help="Fail if importing the module takes longer")
+    args = parser.parse_args(argv)
+
+    imports = profile_imports(args.module)
+    total = next((cumulative for cumulative, _, name in imports if name.strip() == args.module), 0.0)
+    print(f"import {args.module}: {total:.3f}s")
+    print(f"  {'cumulative':>10} {'self':>8}  module")
+    for cumulative, own, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {cumulative:>9.3f}s {own:>7.3f}s {name}")
+
+    if args.max_seconds is not None and total > args.max_seconds:
+        print(f"❌ Import takes {total:.3f}s, over the {args.max_seconds:.3f}s budget")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import contextlib
+from functools import partial
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from benchmarks import fakes
+
+## Offline benchmarks of the analysis pipeline and the bot.
+## Usage: python -m benchmarks.run --events 4 --users 8 --save baseline.json
+##        python -m benchmarks.run --events 4 --users 8 --baseline baseline.json
+
+YEAR = 2024
+DRIVER = {'name': 'COL', 'number': '43', 'pilot': 'Colapinto'}
+
+## Metrics compared against a baseline, and whether higher values are better
+TRACKED_METRICS = {
+    'analysis.cold.p50': False,
+    'analysis.disk_warm.p50': False,
+    'analysis.store_warm.p50': False,
+    'analysis.memory_warm.p50': False,
+    'analysis.db_warm.p50': False,
+    'bot.p50': False,
+    'bot.p95': False,
+    'bot.throughput': True,
+}
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {'n': 0}
+    return {
+        'n': len(values),
+        'mean': statistics.fmean(values),
+        'p50': values[len(values) // 2],
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max': values[-1],
+    }
+
+@contextlib.contextmanager
+def quiet(enabled):
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def clear_disk_cache():
+    from data.cache import disk_cache
+    if not os.path.isdir(disk_cache.cache_dir):
+        return
+    for season in os.listdir(disk_cache.cache_dir):
+        if season.isdigit():
+            shutil.rmtree(os.path.join(disk_cache.cache_dir, season), ignore_errors=True)
+
+def clear_lap_store():
+    from data.lap_store import lap_store
+    lap_store.clear()
+    shutil.rmtree(lap_store.store_dir, ignore_errors=True)
+
+def bench_analysis(tracks, verbose):
+    """
+    Runs get_full_analysis for every track in five states: nothing cached,
+    sessions in the FastF1 disk cache, tables in the lap store, sessions and
+    tables in memory, and graphs already in the database.
+
+    Returns:
+        dict: Seconds per phase, render seconds per graph and session load seconds per cache level
+    """
+    from data.driver_analysis import get_full_analysis
+    from data.session_provider import session_provider
+    from data.lap_store import lap_store
+    from metrics.metrics import collect_spans
+
+    phases = {}
+    renders = {}
+    loads = {}
+
+    def run_phase(name, reset_db, reset_memory, reset_disk, reset_store):
+        if reset_db:
+            fakes.reset_database()
+        if reset_memory:
+            session_provider.clear()
+            lap_store.clear()
+        if reset_disk:
+            clear_disk_cache()
+        if reset_store:
+            clear_lap_store()
+        durations = []
+        for track in tracks:
+            start = time.perf_counter()
+            with quiet(not verbose):
+                _, spans = collect_spans(get_full_analysis, YEAR, track, DRIVER['name'], DRIVER['number'])
+            durations.append(time.perf_counter() - start)
+            for s in spans:
+                if s['stage'] == 'render':
+                    renders.setdefault(s['labels']['graph'], []).append(s['seconds'])
+                elif s['stage'] == 'session_load':
+                    loads.setdefault(s['labels'].get('cache', 'unknown'), []).append(s['seconds'])
+        phases[name] = summarize(durations)
+        print(f"  {name:<12} p50 {phases[name]['p50']:.3f}s  max {phases[name]['max']:.3f}s")
+
+    print(f"get_full_analysis over {len(tracks)} events:")
+    run_phase('cold', reset_db=True, reset_memory=True, reset_disk=True, reset_store=True)
+    run_phase('disk_warm', reset_db=True, reset_memory=True, reset_disk=False, reset_store=True)
+    run_phase('store_warm', reset_db=True, reset_memory=True, reset_disk=False, reset_store=False)
+    run_phase('memory_warm', reset_db=True, reset_memory=False, reset_disk=False, reset_store=False)
+    run_phase('db_warm', reset_db=False, reset_memory=False, reset_disk=False, reset_store=False)
+
+    render = {name: summarize(values) for name, values in renders.items()}
+    print("Render time per graph:")
+    for name, stats in sorted(render.items()):
+        print(f"  {name:<28} mean {stats['mean']:.3f}s  p95 {stats['p95']:.3f}s")
+    session_load = {level: summarize(values) for level, values in loads.items()}
+    return {**phases, 'render': render, 'session_load': session_load}
+
+async def _user(bot, user_id, queries, latencies):
+    from bot.botHandler import F1TelegramBot
+    for track in queries:
+        update = fakes.FakeUpdate(user_id, f"Como le fue a {DRIVER['pilot']} en {track} {YEAR}")
+        start = time.perf_counter()
+        await F1TelegramBot.handle_f1_query(bot, update, fakes.FakeContext())
+        latencies.append(time.perf_counter() - start)
+
+def bench_bot(tracks, users, queries_per_user, verbose):
+    """
+    Sends queries from concurrent users through handle_f1_query, starting
+    with nothing cached. Users ask for overlapping events, so coalescing and
+    the caches take part as they would in production.
+
+    Returns:
+        dict: Latency stats, throughput and mean milliseconds per stage from the request log
+    """
+    import bot.botHandler as botHandler
+    ## Analysis worker processes install the stand-ins before importing the pipeline
+    botHandler.get_full_analysis = partial(fakes.call_installed, 'data.driver_analysis', 'get_full_analysis')
+
+    fakes.reset_database()
+    ## The driver registry is built once per season, like the bot does at startup
+    from data.driver_registry import driver_registry
+    with contextlib.redirect_stdout(io.StringIO() if not verbose else sys.stdout):
+        driver_registry.refresh(YEAR)
+    clear_disk_cache()
+    clear_lap_store()
+    bot = botHandler.F1TelegramBot()
+    latencies = []
+    log = io.StringIO()
+
+    async def run_users():
+        await asyncio.gather(*(
+            _user(bot, user_id, [tracks[(user_id + i) % len(tracks)] for i in range(queries_per_user)], latencies)
+            for user_id in range(users)
+        ))
+
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log if not verbose else sys.stdout):
+            asyncio.run(run_users())
+    finally:
+        bot.analysis_executor.shutdown()
+        bot.io_executor.shutdown()
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    statuses = {}
+    for line in log.getvalue().splitlines():
+        if not line.startswith('{'):
+            continue
+        entry = json.loads(line)
+        if entry.get('event') != 'request':
+            continue
+        statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+        for stage, ms in entry['stages_ms'].items():
+            stages.setdefault(stage, []).append(ms)
+
+    result = summarize(latencies)
+    result['throughput'] = len(latencies) / elapsed
+    result['statuses'] = statuses
+    result['stages_ms'] = {stage: statistics.fmean(values) for stage, values in stages.items()}
+    print(f"handle_f1_query, {users} users x {queries_per_user} queries over {len(tracks)} events:")
+    print(f"  p50 {result['p50']:.3f}s  p95 {result['p95']:.3f}s  {result['throughput']:.2f} queries/s  {statuses}")
+    for stage, ms in sorted(result['stages_ms'].items(), key=lambda item: -item[1]):
+        print(f"  {stage:<16} {ms:.1f} ms per request")
+    return result
+
+def get_metric(results, path):
+    value = results
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare(results, baseline, tolerance):
+    """
+    Returns:
+        list: Descriptions of the tracked metrics that got worse than the baseline by more than tolerance
+    """
+    regressions = []
+    for path, higher_is_better in TRACKED_METRICS.items():
+        current, previous = get_metric(results, path), get_metric(baseline, path)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append(f"{path}: {previous:.3f} -> {current:.3f} ({change:+.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks with stand-ins for FastF1, Ollama, SQL Server and Telegram")
+    parser.add_argument('--events', type=int, default=3, help="Distinct events analysed")
+    parser.add_argument('--users', type=int, default=8, help="Concurrent users in the bot benchmark")
+    parser.add_argument('--queries', type=int, default=2, help="Queries sent by each user")
+    parser.add_argument('--only', choices=('analysis', 'bot'), help="Run a single benchmark")
+    parser.add_argument('--load-seconds', type=float, help="FastF1 download latency (default 2.0)")
+    parser.add_argument('--disk-load-seconds', type=float, help="FastF1 disk cache latency (default 0.3)")
+    parser.add_argument('--llm-seconds', type=float, help="Ollama latency (default 1.0)")
+    parser.add_argument('--telegram-seconds', type=float, help="Telegram API latency (default 0.05)")
+    parser.add_argument('--save', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against the results of a previous run")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown against the baseline (default 0.2)")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    args = parser.parse_args(argv)
+
+    latencies = {
+        'BENCH_LOAD_SECONDS': args.load_seconds,
+        'BENCH_DISK_LOAD_SECONDS': args.disk_load_seconds,
+        'BENCH_LLM_SECONDS': args.llm_seconds,
+        'BENCH_TELEGRAM_SECONDS': args.telegram_seconds,
+    }
+    directory = tempfile.mkdtemp(prefix='f1bot_bench_')
+    os.environ['BENCH_QUIET'] = 'false' if args.verbose else 'true'
+    fakes.configure(directory, **{k: v for k, v in latencies.items() if v is not None})
+    with quiet(not args.verbose):
+        fakes.install_fakes()
+
+    tracks = fakes.event_locations()[:max(1, args.events)]
+    results = {'config': {k: os.environ[k] for k in fakes.DEFAULT_LATENCIES}}
+    try:
+        if args.only in (None, 'analysis'):
+            results['analysis'] = bench_analysis(tracks, args.verbose)
+        if args.only in (None, 'bot'):
+            results['bot'] = bench_bot(tracks, args.users, args.queries, args.verbose)
+    finally:
+        from data.render import shutdown_render_pool
+        shutdown_render_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions over {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"✅ No regressions over {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import os
+import sys
+import signal
+import socket
+import asyncio
+import argparse
+import threading
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from db.jobHandler import (
+    claim_job, complete_job, fail_job, bury_job, extend_lease,
+    job_counts, dead_jobs, requeue_dead_jobs
+)
+from metrics.metrics import request_trace, start_metrics_server
+
+## Runs the analyses the bot enqueues when JOB_QUEUE_ENABLED is set. Any number of
+## workers can run, on any node that reaches the database and Telegram.
+## Usage: python -m bot.analysis_worker
+##        python -m bot.analysis_worker --stats
+##        python -m bot.analysis_worker --requeue-dead 12 15
+
+def chat_message(telegram, payload, message_id):
+    """Message of the chat that asked for a job, bound to telegram so it can be edited or replied to."""
+    from telegram import Chat, Message
+    chat = Chat(id=payload['chat_id'], type=payload.get('chat_type', Chat.PRIVATE))
+    message = Message(message_id=message_id, date=datetime.now(timezone.utc), chat=chat)
+    message.set_bot(telegram)
+    return message
+
+class AnalysisWorker:
+    """
+    Takes jobs from the Job table and runs them one at a time.
+
+    A claimed job is leased for lease_seconds and the lease is renewed while
+    it runs, so if the worker dies another one claims the job once the lease
+    expires. Failed jobs are retried with backoff and dead-lettered after
+    their last attempt; the chat that asked is then told about the error.
+    Results are sent to the chat by the worker itself, so a job whose worker
+    died after sending them may be sent twice.
+
+    Job kinds:
+        analysis: Graphs and summary of one event, sent to the chat in the
+            payload if there is one
+        warm_qualifying: Builds the qualifying graphs of one event
+        season_stats: Stores the figures of the events of a season that a
+            season report found missing
+    """
+    def __init__(self, worker_id=None, lease_seconds=None, poll_seconds=None):
+        """
+        Args:
+            worker_id (str): Name stored in the jobs it leases (default WORKER_ID or host:pid)
+            lease_seconds (float): Lease of a claimed job (default JOB_LEASE_SECONDS or 300)
+            poll_seconds (float): Wait when the queue is empty (default JOB_POLL_SECONDS or 2)
+        """
+        self.worker_id = worker_id or os.getenv('WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds or float(os.getenv('JOB_LEASE_SECONDS', '300'))
+        self.poll_seconds = poll_seconds or float(os.getenv('JOB_POLL_SECONDS', '2'))
+        self.handlers = {
+            'analysis': self.run_analysis,
+            'warm_qualifying': self.run_warm_qualifying,
+            'season_stats': self.run_season_stats,
+        }
+        self._stop = threading.Event()
+        self._bot = None
+        self._telegram = None
+        # One loop for the worker's life, the bot's executors and the Telegram client stay bound to it
+        self._loop = asyncio.new_event_loop()
+
+    @property
+    def bot(self):
+        if self._bot is None:
+            from bot.botHandler import F1TelegramBot
+            self._bot = F1TelegramBot()
+        return self._bot
+
+    def telegram(self):
+        if self._telegram is None:
+            from telegram import Bot
+            self._telegram = Bot(self.bot.token)
+            self._loop.run_until_complete(self._telegram.initialize())
+        return self._telegram
+
+    def stop(self, *args):
+        """Stops after the current job."""
+        self._stop.set()
+
+    def run(self, once=False):
+        """
+        Runs jobs until stopped.
+
+        Args:
+            once (bool): Return as soon as the queue is empty
+        """
+        print(f"🛠️ Worker {self.worker_id} started")
+        while not self._stop.is_set():
+            try:
+                job = claim_job(self.worker_id, self.lease_seconds, list(self.handlers))
+            except Exception as e:
+                print(f"Could not claim a job: {str(e)}")
+                self._stop.wait(self.poll_seconds)
+                continue
+            if job is None:
+                if once:
+                    break
+                self._stop.wait(self.poll_seconds)
+                continue
+            try:
+                self.process(job)
+            except Exception as e:
+                # Usually the database is down, the job runs again when its lease expires
+                print(f"Job {job['id']} could not be finished: {str(e)}")
+        self.shutdown()
+
+    def process(self, job):
+        if job['attempts'] > job['max_attempts']:
+            # Every worker that claimed it died before finishing it
+            error = job['last_error'] or "The worker stopped before finishing the job"
+            bury_job(job['id'], error)
+            print(f"💀 Job {job['id']} dead-lettered: {error}")
+            self.notify_failure(job['payload'], error)
+            return
+
+        renewing = threading.Event()
+        renewer = threading.Thread(target=self._renew_lease, args=(job['id'], renewing), daemon=True)
+        renewer.start()
+        with request_trace(job_id=job['id'], kind=job['kind'], attempt=job['attempts'], worker=self.worker_id) as trace:
+            try:
+                result = self.handlers[job['kind']](job['payload'])
+            except Exception as e:
+                renewing.set()
+                renewer.join()
+                status = fail_job(job['id'], self.worker_id, e)
+                trace.update(status='dead' if status == 'dead' else 'retry', error=str(e))
+                if status == 'dead':
+                    print(f"💀 Job {job['id']} dead-lettered after {job['attempts']} attempts: {str(e)}")
+                    self.notify_failure(job['payload'], e)
+                return
+            finally:
+                renewing.set()
+                renewer.join()
+            if not complete_job(job['id'], self.worker_id, result):
+                trace['status'] = 'lease_lost'
+                print(f"Job {job['id']} finished after its lease was taken by another worker")
+
+    def _renew_lease(self, job_id, stopped):
+        while not stopped.wait(self.lease_seconds / 3):
+            try:
+                if not extend_lease(job_id, self.worker_id, self.lease_seconds):
+                    print(f"Lost the lease of job {job_id}")
+                    return
+            except Exception as e:
+                print(f"Could not renew the lease of job {job_id}: {str(e)}")
+
+    def run_analysis(self, payload):
+        from data.driver_analysis import get_full_analysis
+        params = {'pilot': payload['pilot'], 'year': payload['year'], 'track': payload['track']}
+        driver_info = {'name': payload['driver'], 'number': payload['number']}
+        analysis = get_full_analysis(payload['year'], payload['track'], payload['driver'], payload['number'])
+        graphs = self.bot.attach_images(
+            self.bot.get_event_graphs(payload['year'], payload['track'], payload['driver']), analysis
+        )
+
+        if payload.get('chat_id'):
+            telegram = self.telegram()
+            self._loop.run_until_complete(self.bot.deliver_results(
+                chat_message(telegram, payload, payload['reply_to']),
+                chat_message(telegram, payload, payload['message_id']),
+                params, driver_info, graphs
+            ))
+        elif payload.get('summary', True):
+            self.bot.get_event_summary(params, payload['driver'], graphs)
+        return {'graphs': len(graphs)}
+
+    def run_warm_qualifying(self, payload):
+        from data.driver_analysis import get_full_analysis
+        get_full_analysis(payload['year'], payload['track'], payload['driver'], payload.get('number'), sessions=('Q',))
+        return {}
+
+    def run_season_stats(self, payload):
+        from data.season_progress import fill_event_stats
+        return {'events': fill_event_stats(payload['year'], payload['driver'], payload['number'])}
+
+    def notify_failure(self, payload, error):
+        if not payload.get('chat_id'):
+            return
+        try:
+            message = chat_message(self.telegram(), payload, payload['message_id'])
+            self._loop.run_until_complete(message.edit_text(f"❌ Error generando análisis: {str(error)}"))
+        except Exception as e:
+            print(f"Could not notify chat {payload['chat_id']} of the failure: {str(e)}")
+
+    def shutdown(self):
+        if self._telegram is not None:
+            self._loop.run_until_complete(self._telegram.shutdown())
+        if self._bot is not None:
+            self._bot.analysis_executor.shutdown()
+            self._bot.io_executor.shutdown()
+        self._loop.close()
+        print(f"Worker {self.worker_id} stopped")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the analyses of the job queue")
+    parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    parser.add_argument('--stats', action='store_true', help="Show the jobs in each status and exit")
+    parser.add_argument('--dead', action='store_true', help="Show the latest dead-lettered jobs and exit")
+    parser.add_argument('--requeue-dead', type=int, nargs='*', metavar='JOB_ID',
+                        help="Queue dead-lettered jobs again, all of them or the given ids, and exit")
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        for status, count in job_counts().items():
+            print(f"{status:>8}: {count}")
+        return 0
+    if args.dead:
+        for job in dead_jobs():
+            print(f"{job['id']:>6} {job['kind']} {job['payload']} after {job['attempts']} attempts: {job['last_error']}")
+        return 0
+    if args.requeue_dead is not None:
+        print(f"{requeue_dead_jobs(args.requeue_dead)} jobs queued again")
+        return 0
+
+    from db.dbHandler import init_db
+    init_db()
+    start_metrics_server(port=int(os.getenv('WORKER_METRICS_PORT', '0')))
+
+    worker = AnalysisWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(once=args.once)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
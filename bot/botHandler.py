@@ -1,7 +1,13 @@
-from telegram import Update
+import time
+STARTUP_BEGAN = time.perf_counter() ##Startup time is measured from the first import
+
+from telegram import Update, InputMediaPhoto
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 import os
 import sys
+import asyncio
+import unicodedata
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
@@ -10,10 +16,23 @@ sys.path.append(BASE_DIR)
 
 from llm.llm import F1AnalysisLLM
 from data.driver_analysis import get_full_analysis
-from db.dbHandler import get_db_connection
+from data.season_progress import season_report, fill_event_stats
+from data.driver_registry import driver_registry
+from db.dbHandler import fetch_all, db_cursor, init_db
+from db.resumeHandler import get_resume, save_resume
+from db.jobHandler import enqueue_job, get_job, jobs_ahead, PRIORITY_INTERACTIVE, PRIORITY_BACKFILL
+from bot.workers import BoundedExecutor, QueueFullError, SingleFlight
+from bot.prewarm import PrewarmScheduler
+from metrics.metrics import span, record, request_trace, start_metrics_server
 
 load_dotenv()
 
+## Telegram allows about one edit per second in a chat, streamed summaries are edited at most this often
+SUMMARY_EDIT_INTERVAL = float(os.getenv('SUMMARY_EDIT_INTERVAL_SECONDS', '1.5'))
+
+## Longest text of a Telegram message
+MAX_MESSAGE_LENGTH = 4096
+
 class F1TelegramBot:
     def __init__(self):
         """
@@ -23,9 +42,34 @@ class F1TelegramBot:
         Functions:
         - Creates an instance of the LLM model for text analysis
         - Loads the Telegram authentication token from environment variables
+        - Creates the executors that run blocking work off the event loop
         """
         self.llm = F1AnalysisLLM()
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
+        # FastF1 loads and matplotlib rendering run in worker processes
+        self.analysis_executor = BoundedExecutor(
+            'analysis',
+            max_workers=int(os.getenv('ANALYSIS_WORKERS', '2')),
+            max_queue=int(os.getenv('ANALYSIS_MAX_QUEUE', '10')),
+            use_processes=True
+        )
+        # LLM and database calls mostly wait on I/O, threads are enough
+        self.io_executor = BoundedExecutor(
+            'io',
+            max_workers=int(os.getenv('IO_WORKERS', '4')),
+            max_queue=int(os.getenv('IO_MAX_QUEUE', '50'))
+        )
+        # Identical analyses requested at the same time run only once, and so do their summaries
+        self.inflight_analyses = SingleFlight()
+        self.inflight_summaries = SingleFlight()
+        # Work started for a request that goes on after it is answered
+        self.background_tasks = set()
+        # With the job queue, analyses run in separate worker processes (bot/analysis_worker.py)
+        # that send the results to the chat themselves
+        self.job_queue = os.getenv('JOB_QUEUE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.job_poll_interval = float(os.getenv('JOB_POLL_SECONDS', '2'))
+        # Analyses of new race weekends are computed before users ask
+        self.prewarm = PrewarmScheduler(self) if os.getenv('PREWARM_ENABLED', 'true').lower() in ('1', 'true', 'yes') else None
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -43,7 +87,8 @@ class F1TelegramBot:
             "Pregúntame sobre su rendimiento en algún circuito:\n"
             "- 'Cómo le fue a Colapinto en Imola 2025'\n"
             "- 'Analiza el rendimiento de Colapinto en Monaco 2024'\n"
-            "- 'Cómo le fue a Colapinto en Monaco 2024'"
+            "- 'Cómo le fue a Colapinto en Monaco 2024'\n"
+            "- 'Cómo viene Colapinto en la temporada 2025'"
         )
         last_query_time = context.user_data.get('last_query_time')
         if last_query_time and datetime.now() - last_query_time < timedelta(seconds=30):
@@ -56,79 +101,522 @@ class F1TelegramBot:
         Processes user queries about F1.
         
         Steps:
-        1. Extracts parameters (driver, year, circuit) using LLM
+        1. Extracts parameters (driver, year, circuit) with the local parser, or the LLM if unsure
         2. Maps driver name to code and number
         3. Generates analysis graphs
         4. Gets graphs from database
-        5. Generates analysis summary using LLM
-        6. Sends summary and graphs to user
+        5. Sends the graphs as soon as they are ready
+        6. At the same time, streams the LLM summary into the status message
         
         Functions:
         - Processes user message
         - Shows status messages during process
+        - Runs blocking work in the executors so other chats keep being served
+        - Reports the queue position when the analysis workers are busy
+        - Reuses the result of an identical analysis that is already running
+        - With JOB_QUEUE_ENABLED, enqueues the analysis for the workers instead of running it
+        - Answers questions about a whole season with the season report
         - Handles errors at each step
         - Sends results in text and image format
+        - Times every stage and logs one line per request with the timings
         """
         user_message = update.message.text
         chat_id = update.effective_chat.id
         
+        with request_trace(chat_id=chat_id) as trace:
+            await self._handle_f1_query(update, user_message, trace)
+    
+    async def _handle_f1_query(self, update: Update, user_message, trace):
+        if self.analysis_executor.is_full():
+            trace['status'] = 'rejected'
+            await update.message.reply_text("🚦 Estoy analizando muchas carreras a la vez, proba de nuevo en unos minutos.")
+            return
+        
         processing_msg = await update.message.reply_text("🔄 Espera un momento que lo analizo...")
         
         try:
-            params = self.llm.extract_analysis_params(user_message)
+            params = await self.io_executor.run(self.llm.parse_query, user_message)
             
             if not params:
+                trace['status'] = 'not_understood'
                 await processing_msg.edit_text("❌ No pude entender tu pregunta. Intenta ser más específico.")
                 return
+            trace.update(year=params['year'], track=params['track'], pilot=params['pilot'])
             
-            driver_mapping = {
-                'colapinto': {'name': 'COL', 'number': '43'},
-                'COL': {'name': 'COL', 'number': '43'}, 
-                'franco': {'name': 'COL', 'number': '43'}, 
-            }
+            driver_info = await self.io_executor.run(self.get_driver_info, params['pilot'], params['year'])
+            if not driver_info and driver_registry.is_building(params['year']):
+                trace['status'] = 'registry_loading'
+                await processing_msg.edit_text(f"⏳ Estoy cargando los pilotos de {params['year']}, proba de nuevo en un par de minutos.")
+                return
+            if not driver_info:
+                trace['status'] = 'unknown_driver'
+                await processing_msg.edit_text(f"❌ No encontre el piloto '{params['pilot']}' en {params['year']}, proba con su apellido o su número.")
+                return
             
-            pilot_key = params['pilot'].lower()
-            if pilot_key not in driver_mapping:
-                await processing_msg.edit_text(f"❌ No encontre el piloto '{params['pilot']}', proba escribirlo con mayuscula.")
+            if params['track'] is None:
+                await self.deliver_season(update, processing_msg, params, driver_info, trace)
                 return
             
-            driver_info = driver_mapping[pilot_key]
+            if self.job_queue:
+                await self.enqueue_analysis(update, processing_msg, params, driver_info, trace)
+                return
             
-            await processing_msg.edit_text("📊 Generando gráficos...")
+            event_key = self.make_event_key(params['year'], params['track'], driver_info['name'])
+            
+            if self.inflight_analyses.is_running(event_key):
+                # The analysis spans are logged by the request already running it
+                trace['coalesced'] = True
+                await processing_msg.edit_text("⏳ Ya estoy analizando esa carrera para otra consulta, ya te aviso...")
+            elif self.analysis_executor.is_busy():
+                await processing_msg.edit_text(
+                    f"⏳ Tu análisis está en la posición {self.analysis_executor.queue_depth + 1} de la cola, ya te aviso..."
+                )
+            else:
+                await processing_msg.edit_text("📊 Generando gráficos...")
             
             try:
-                get_full_analysis(
-                    params['year'], 
-                    params['track'], 
-                    driver_info['name'], 
-                    driver_info['number']
+                graphs = await self.inflight_analyses.run(
+                    event_key, self.run_graphs, params, driver_info
                 )
                 
-                graphs = self.get_event_graphs(params['year'], params['track'], driver_info['name'])
-                
-                summary = self.llm.generate_analysis_summary(params, graphs)
-                
-                await processing_msg.edit_text("📱 Enviando resultados...")
-                
-                await update.message.reply_text(f"📊 **Análisis de {params['pilot']}**\n\n{summary}")
-                
-                for graph in graphs:
-                    if os.path.exists(graph['path']):
-                        with open(graph['path'], 'rb') as photo:
-                            await update.message.reply_photo(
-                                photo=photo,
-                                caption=graph['description']
-                            )
-                
-                await processing_msg.delete()
+                await self.deliver_results(update.message, processing_msg, params, driver_info, graphs)
                 
+            except QueueFullError:
+                trace['status'] = 'rejected'
+                await processing_msg.edit_text("🚦 Estoy analizando muchas carreras a la vez, proba de nuevo en unos minutos.")
             except Exception as e:
+                trace.update(status='error', error=str(e))
                 await processing_msg.edit_text(f"❌ Error generando análisis: {str(e)}")
                 
+        except QueueFullError:
+            trace['status'] = 'rejected'
+            await processing_msg.edit_text("🚦 Estoy con muchas consultas a la vez, proba de nuevo en unos minutos.")
         except Exception as e:
+            trace.update(status='error', error=str(e))
             await processing_msg.edit_text(f"❌ Error procesando solicitud: {str(e)}")
     
-    def get_event_graphs(self, year, track, driver):
+    async def deliver_season(self, update: Update, processing_msg, params, driver_info, trace):
+        """
+        Answers a question about a whole season. The report is built only
+        from the stored figures of each event, so it runs in the analysis
+        executor even with the job queue; the events not stored yet are
+        computed afterwards in the background (see fill_season_stats). The
+        graph is sent while the summary is streamed; season summaries are not
+        cached, they change after every race.
+        """
+        trace['scope'] = 'season'
+        await processing_msg.edit_text("📈 Armando el resumen de la temporada...")
+        try:
+            report = await self.inflight_analyses.run(
+                ('season', int(params['year']), driver_info['name']),
+                self.analysis_executor.run, season_report, params['year'], driver_info['name'], driver_info['number']
+            )
+        except QueueFullError:
+            trace['status'] = 'rejected'
+            await processing_msg.edit_text("🚦 Estoy analizando muchas carreras a la vez, proba de nuevo en unos minutos.")
+            return
+        if report['missing']:
+            self.fill_season_stats(params['year'], driver_info)
+        if not report['events']:
+            if report['missing']:
+                trace['status'] = 'filling'
+                await processing_msg.edit_text(
+                    f"⏳ Estoy procesando las {len(report['missing'])} carreras de {params['pilot']} en {params['year']}, proba de nuevo en unos minutos."
+                )
+                return
+            trace['status'] = 'no_events'
+            await processing_msg.edit_text(f"❌ No encontre carreras de {params['pilot']} en {params['year']}.")
+            return
+        
+        trace.update(events=len(report['events']), missing=len(report['missing']))
+        graphs_info = [{'path': None, 'name': 'season_progress', 'description': report['description']}]
+        analysis_data = {**params, 'season': report['summary'], 'events': report['events']}
+        header = f"📈 **Temporada {params['year']} de {params['pilot']}**\n\n"
+        if report['missing']:
+            header += f"_Todavía estoy procesando {len(report['missing'])} carreras, no están en este resumen._\n\n"
+        
+        async def send_graph():
+            with span('telegram_upload', kind='photos', cached=False):
+                await update.message.reply_photo(photo=report['image'], caption=report['description'][:1024])
+        
+        async def write_summary():
+            await processing_msg.edit_text("📝 Escribiendo el análisis...")
+            text = await self.stream_text(processing_msg, header, self.llm.stream_analysis_summary, analysis_data, graphs_info)
+            with span('telegram_upload', kind='text'):
+                await self.show_text(processing_msg, header + text, final=True)
+        
+        results = await asyncio.gather(send_graph(), write_summary(), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    
+    def fill_season_stats(self, year, driver_info):
+        """
+        Computes, without waiting for it, the stored figures of the events of
+        a season that have none, so the next season report has them. With the
+        job queue the workers do it below user requests, otherwise it runs in
+        the analysis executor, once per season and driver at a time.
+        """
+        key = ('season_fill', int(year), driver_info['name'])
+        if self.inflight_analyses.is_running(key):
+            return
+        if self.job_queue:
+            payload = {'year': int(year), 'driver': driver_info['name'], 'number': driver_info['number']}
+            work = self.inflight_analyses.run(key, self.io_executor.run, enqueue_job, 'season_stats', payload, PRIORITY_BACKFILL)
+        else:
+            work = self.inflight_analyses.run(
+                key, self.analysis_executor.run, fill_event_stats, int(year), driver_info['name'], driver_info['number']
+            )
+        task = asyncio.ensure_future(work)
+        self.background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+    
+    def _background_done(self, task):
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Background task failed: {str(task.exception())}")
+    
+    async def enqueue_analysis(self, update: Update, processing_msg, params, driver_info, trace):
+        """
+        Adds the analysis to the job queue with interactive priority. The
+        worker that runs it edits processing_msg and replies to the query.
+        """
+        payload = {
+            **params,
+            'driver': driver_info['name'],
+            'number': driver_info['number'],
+            'chat_id': update.effective_chat.id,
+            'chat_type': update.effective_chat.type,
+            'message_id': processing_msg.message_id,
+            'reply_to': update.message.message_id,
+        }
+        job_id = await self.io_executor.run(enqueue_job, 'analysis', payload, PRIORITY_INTERACTIVE)
+        trace.update(status='queued', job_id=job_id)
+        ahead = await self.io_executor.run(jobs_ahead, job_id)
+        if ahead:
+            await processing_msg.edit_text(f"⏳ Tu análisis está en la posición {ahead + 1} de la cola, ya te aviso...")
+        else:
+            await processing_msg.edit_text("📊 Generando gráficos...")
+    
+    async def run_job(self, kind, payload, priority, max_attempts=1):
+        """
+        Enqueues a job and waits until a worker finishes it.
+        
+        Returns:
+            The result of the job
+            
+        Raises:
+            RuntimeError: If the job ends dead-lettered
+        """
+        job_id = await self.io_executor.run(enqueue_job, kind, payload, priority, max_attempts)
+        while True:
+            await asyncio.sleep(self.job_poll_interval)
+            job = await self.io_executor.run(get_job, job_id)
+            if job['status'] == 'done':
+                return job['result']
+            if job['status'] == 'dead':
+                raise RuntimeError(job['last_error'] or f"Job {job_id} failed")
+    
+    async def deliver_results(self, query_msg, status_msg, params, driver_info, graphs):
+        """
+        Sends the graphs of an event as replies to query_msg and, at the same
+        time, writes the summary in status_msg, above the graphs.
+        """
+        await status_msg.edit_text("📝 Escribiendo el análisis...")
+        results = await asyncio.gather(
+            self.send_graphs(query_msg, graphs),
+            self.deliver_summary(status_msg, params, driver_info, graphs),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    
+    async def send_graphs(self, message, graphs):
+        """
+        Sends the graphs of an event as a single album.
+        
+        Graphs already uploaded are sent by their Telegram file_id, so they
+        are not uploaded again. New graphs are uploaded from the rendered image
+        in memory, or from disk if there is none. The file_ids of new uploads
+        are stored in the Graph table for the next requests.
+        
+        Args:
+            message: Telegram message to reply to
+            graphs (list): Graphs of the event
+        """
+        missing = [g for g in graphs if not (g.get('file_id') or g.get('image') or os.path.exists(g['path']))]
+        for graph in missing:
+            print(f"❌ Graph ({graph['name']}) has no file at {graph['path']}, not sent")
+        graphs = [g for g in graphs if g not in missing]
+        # Telegram albums hold between 2 and 10 items
+        for start in range(0, len(graphs), 10):
+            chunk = graphs[start:start + 10]
+            try:
+                with span('telegram_upload', kind='photos', cached=all(g.get('file_id') for g in chunk)):
+                    file_ids = await self._send_graph_chunk(message, chunk)
+            except BadRequest as e:
+                if not any(g.get('file_id') for g in chunk):
+                    raise
+                # A stored file_id is no longer valid (e.g. the bot token changed), upload again
+                print(f"Cached Telegram file_id rejected, uploading again: {str(e)}")
+                for graph in chunk:
+                    graph['file_id'] = None
+                chunk = [g for g in chunk if g.get('image') or os.path.exists(g['path'])]
+                with span('telegram_upload', kind='photos', cached=False):
+                    file_ids = await self._send_graph_chunk(message, chunk)
+            
+            uploaded = []
+            for graph, file_id in zip(chunk, file_ids):
+                if file_id and graph.get('file_id') != file_id:
+                    graph['file_id'] = file_id
+                    uploaded.append((file_id, graph['id']))
+            if uploaded:
+                await self.io_executor.run(self.save_graph_file_ids, uploaded)
+    
+    async def _send_graph_chunk(self, message, graphs):
+        media = []
+        for graph in graphs:
+            if graph.get('file_id'):
+                photo = graph['file_id']
+            elif graph.get('image'):
+                photo = graph['image']
+            else:
+                with open(graph['path'], 'rb') as f:
+                    photo = f.read()
+            media.append(InputMediaPhoto(media=photo, caption=graph['description']))
+        
+        if len(media) == 1:
+            messages = [await message.reply_photo(photo=media[0].media, caption=media[0].caption)]
+        else:
+            messages = await message.reply_media_group(media=media)
+        
+        return [sent.photo[-1].file_id if sent.photo else None for sent in messages]
+    
+    def save_graph_file_ids(self, file_ids):
+        """
+        Stores the Telegram file_ids of uploaded graphs.
+        
+        Args:
+            file_ids (list): Tuples of (file_id, graph id)
+        """
+        with db_cursor(commit=True) as cursor:
+            cursor.executemany("UPDATE Graph SET telegram_file_id = ? WHERE id = ?", file_ids)
+    
+    @staticmethod
+    def get_driver_info(pilot, year=None):
+        """
+        Maps a driver name, nickname, code or number to the driver of that season.
+        
+        Args:
+            pilot (str): Driver as asked by the user
+            year (int): Season (default the latest one)
+        
+        Returns:
+            dict: Driver code (name), number, first and last name and team, or None if the driver is unknown
+        """
+        if not pilot:
+            return None
+        return driver_registry.resolve(pilot, year)
+    
+    @staticmethod
+    def make_event_key(year, track, driver):
+        """
+        Builds the key that identifies an analysis, so 'Mónaco', 'monaco '
+        and 'Monaco' asked in the same season for the same driver match.
+        """
+        track = unicodedata.normalize('NFKD', str(track))
+        track = ''.join(c for c in track if not unicodedata.combining(c))
+        track = ' '.join(track.lower().split())
+        return (int(year), track, driver.upper())
+    
+    async def run_graphs(self, params, driver_info):
+        """
+        Generates the graphs for one event.
+        
+        Args:
+            params (dict): Extracted parameters (pilot, year, track)
+            driver_info (dict): Driver code and number
+            
+        Returns:
+            list: Graphs of the event, the new ones with their rendered image
+        """
+        analysis = await self.analysis_executor.run(
+            get_full_analysis,
+            params['year'], 
+            params['track'], 
+            driver_info['name'], 
+            driver_info['number']
+        )
+        
+        graphs = await self.io_executor.run(self.get_event_graphs, params['year'], params['track'], driver_info['name'])
+        return self.attach_images(graphs, analysis)
+    
+    @staticmethod
+    def attach_images(graphs, analysis):
+        """
+        Adds to the graphs of an event the images rendered by get_full_analysis,
+        so freshly rendered graphs are sent from memory, before their disk copy is written.
+        """
+        images = {graph['id']: graph['image'] for graph in analysis if graph['image']}
+        for graph in graphs:
+            graph['image'] = images.get(graph['id'])
+        return graphs
+    
+    async def run_analysis(self, params, driver_info):
+        """
+        Generates the graphs and the summary for one event, without streaming.
+        
+        Args:
+            params (dict): Extracted parameters (pilot, year, track)
+            driver_info (dict): Driver code and number
+            
+        Returns:
+            Tuple with the list of graphs and the summary text
+        """
+        event_key = self.make_event_key(params['year'], params['track'], driver_info['name'])
+        graphs = await self.inflight_analyses.run(event_key, self.run_graphs, params, driver_info)
+        summary = await self.inflight_summaries.run(
+            event_key, self.io_executor.run, self.get_event_summary, params, driver_info['name'], graphs
+        )
+        return graphs, summary
+    
+    def get_cached_summary(self, params, driver, graphs):
+        """
+        Looks up the summary of an event in the Resume table.
+        
+        Returns:
+            tuple: (summary, or None if there is none for the same inputs and model; input hash)
+        """
+        input_hash = self.llm.summary_input_hash(
+            {'event': self.make_event_key(params['year'], params['track'], driver)}, graphs
+        )
+        summary = get_resume(params['year'], params['track'], driver, 'summary', input_hash, self.llm.model)
+        if summary:
+            print(f"Summary cache hit for {driver} in {params['year']} {params['track']}")
+        return summary, input_hash
+    
+    @staticmethod
+    def graphs_info(graphs):
+        return [{k: g[k] for k in ('path', 'description', 'name')} for g in graphs]
+    
+    def get_event_summary(self, params, driver, graphs):
+        """
+        Gets the summary of an event from the Resume table, generating and
+        storing it only if there is none for the same inputs and model.
+        
+        Args:
+            params (dict): Extracted parameters (pilot, year, track)
+            driver (str): Driver code
+            graphs (list): Graphs of the event
+            
+        Returns:
+            str: Analysis summary
+        """
+        summary, input_hash = self.get_cached_summary(params, driver, graphs)
+        if summary:
+            return summary
+        
+        summary = self.llm.generate_analysis_summary(params, self.graphs_info(graphs))
+        save_resume(params['year'], params['track'], driver, 'summary', summary, input_hash, self.llm.model)
+        return summary
+    
+    async def deliver_summary(self, message, params, driver_info, graphs):
+        """
+        Writes the summary of an event in message. A cached summary is shown
+        at once; otherwise it is streamed from the LLM and the message is
+        edited as the text grows. Identical requests running at the same time
+        wait for the summary being streamed and show it when it is complete.
+        """
+        header = f"📊 **Análisis de {params['pilot']}**\n\n"
+        event_key = self.make_event_key(params['year'], params['track'], driver_info['name'])
+        summary = await self.inflight_summaries.run(
+            event_key, self.stream_summary, message, header, params, driver_info['name'], graphs
+        )
+        with span('telegram_upload', kind='text'):
+            await self.show_text(message, header + summary, final=True)
+    
+    async def stream_summary(self, message, header, params, driver, graphs):
+        """
+        Returns the summary of an event, streaming it into message while the
+        LLM writes it.
+        """
+        summary, input_hash = await self.io_executor.run(self.get_cached_summary, params, driver, graphs)
+        if summary:
+            return summary
+        
+        text = await self.stream_text(message, header, self.llm.stream_analysis_summary, params, self.graphs_info(graphs))
+        await self.io_executor.run(
+            save_resume, params['year'], params['track'], driver, 'summary', text, input_hash, self.llm.model
+        )
+        return text
+    
+    async def stream_text(self, message, header, func, *args):
+        """
+        Shows in message the text yielded by a blocking generator as it grows.
+        Edits are spaced by SUMMARY_EDIT_INTERVAL to stay within Telegram's limits.
+        
+        Returns:
+            str: The whole text
+        """
+        text = ''
+        last_edit = time.monotonic()
+        async for piece in self.iterate_in_io(func, *args):
+            text += piece
+            if time.monotonic() - last_edit >= SUMMARY_EDIT_INTERVAL and text.strip():
+                await self.show_text(message, header + text + ' ▌')
+                last_edit = time.monotonic()
+        return text
+    
+    async def iterate_in_io(self, func, *args):
+        """
+        Iterates a blocking generator in the I/O executor, yielding its items
+        on the event loop as they are produced.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        
+        def produce():
+            try:
+                for item in func(*args):
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+        
+        producer = asyncio.ensure_future(self.io_executor.run(produce))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Raises the generator's exception, if any
+            await producer
+    
+    async def show_text(self, message, text, final=False):
+        """
+        Shows text in message. Progress edits that Telegram rejects (rate
+        limits, unchanged text) are skipped; the final text is always shown,
+        with what does not fit in one message sent as replies.
+        """
+        try:
+            await message.edit_text(text[:MAX_MESSAGE_LENGTH])
+        except RetryAfter as e:
+            if not final:
+                return
+            await asyncio.sleep(e.retry_after)
+            await message.edit_text(text[:MAX_MESSAGE_LENGTH])
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                raise
+        if final:
+            for start in range(MAX_MESSAGE_LENGTH, len(text), MAX_MESSAGE_LENGTH):
+                await message.reply_text(text[start:start + MAX_MESSAGE_LENGTH])
+    
+    @staticmethod
+    def get_event_graphs(year, track, driver):
         """
         Gets graphs for an event from the database.
         
@@ -141,35 +629,70 @@ class F1TelegramBot:
             List of dictionaries with graph information
             
         Functions:
-        - Connects to database
+        - Borrows a connection from the database pool
         - Executes SQL query to get graphs
         - Formats results in list of dictionaries
-        - Closes database connection
         """
-        conn, cursor = get_db_connection()
-        
         query = """
-        SELECT g.graph_path, g.description, g.name
+        SELECT g.graph_path, g.description, g.name, g.id, g.telegram_file_id
         FROM Graph g
         JOIN EventF1 e ON g.event_id = e.id
         WHERE e.season = ? AND e.gp = ? AND e.driver = ?
+        ORDER BY g.id
         """
         
-        cursor.execute(query, (year, track, driver))
-        results = cursor.fetchall()
+        results = fetch_all(query, (year, track, driver))
         
-        conn.close()
-        
-        return [{'path': row[0], 'description': row[1], 'name': row[2]} for row in results]
+        return [
+            {'path': row[0], 'description': row[1], 'name': row[2], 'id': row[3], 'file_id': row[4]}
+            for row in results
+        ]
+    
+    async def init_database(self):
+        """
+        Brings the database schema up to date without delaying the start of
+        polling. If the database is down the bot keeps running and every
+        request reports its own database error.
+        """
+        try:
+            await self.io_executor.run(init_db)
+        except Exception as e:
+            print(f"❌ Could not update the database schema: {str(e)}")
+    
+    async def warm_driver_registry(self):
+        """
+        Updates the driver registry of the latest season in the background,
+        so the first questions find the drivers of the races run since the
+        last start.
+        """
+        try:
+            await self.io_executor.run(driver_registry.refresh)
+        except Exception as e:
+            print(f"❌ Could not build the driver registry: {str(e)}")
+    
+    async def post_init(self, application: Application):
+        application.create_task(self.init_database())
+        application.create_task(self.warm_driver_registry())
+        if self.prewarm:
+            application.create_task(self.prewarm.run())
+        startup = time.perf_counter() - STARTUP_BEGAN
+        record('startup', startup)
+        print(f"⏱️ Bot listo en {startup:.2f}s")
     
     def run(self):
-        application = Application.builder().token(self.token).build()
+        application = Application.builder().token(self.token).post_init(self.post_init).build()
         
         application.add_handler(CommandHandler("start", self.start))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_f1_query))
         
+        start_metrics_server()
+        
         print("🚀 Bot iniciado...")
-        application.run_polling()
+        try:
+            application.run_polling()
+        finally:
+            self.analysis_executor.shutdown()
+            self.io_executor.shutdown()
 
 if __name__ == "__main__":
     bot = F1TelegramBot()
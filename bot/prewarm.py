@@ -0,0 +1,126 @@
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+## Sessions that are pre-warmed and how long after their start their data is expected
+PREWARM_SESSIONS = {
+    'Qualifying': timedelta(hours=1),
+    'Race': timedelta(hours=2),
+}
+
+def _load_schedule(year):
+    from data.cache import get_event_schedule
+    return get_event_schedule(year)
+
+def _warm_qualifying(year, track, driver):
+    from data.driver_analysis import get_full_analysis
+    ## Every qualifying graph, the race ones wait for the race
+    get_full_analysis(year, track, driver['name'], driver['number'], sessions=('Q',))
+
+class PrewarmScheduler:
+    """
+    Runs the analysis pipeline ahead of time for new race weekends.
+
+    Reads the FastF1 event schedule and, once a qualifying or race session
+    of the tracked drivers should have its data published, renders the
+    graphs (and, after the race, the summary) so the first users after the
+    session are served from cache. While the data is not published yet the
+    job is retried with exponential backoff.
+    """
+    def __init__(self, bot, drivers=None):
+        """
+        Args:
+            bot (F1TelegramBot): Bot whose executors and pipeline are used
+            drivers (list): Driver names to pre-warm (default PREWARM_DRIVERS, comma separated)
+        """
+        self.bot = bot
+        if drivers is None:
+            drivers = [d.strip() for d in os.getenv('PREWARM_DRIVERS', 'colapinto').split(',') if d.strip()]
+        self.drivers = drivers
+        self.poll_interval = float(os.getenv('PREWARM_INTERVAL_SECONDS', '600'))
+        self.publish_delay = timedelta(minutes=float(os.getenv('PREWARM_DELAY_MINUTES', '30')))
+        self.lookback = timedelta(days=float(os.getenv('PREWARM_LOOKBACK_DAYS', '3')))
+        self.retry_initial = float(os.getenv('PREWARM_RETRY_SECONDS', '300'))
+        self.retry_max = float(os.getenv('PREWARM_RETRY_MAX_SECONDS', '7200'))
+        self.done = set()
+        self.retries = {}
+
+    def due_sessions(self, schedule, now):
+        """
+        Returns the (year, track, session name) of sessions whose data should
+        be available by now and that are recent enough to pre-warm.
+        """
+        import pandas as pd
+        due = []
+        for _, event in schedule.iterrows():
+            for i in range(1, 6):
+                name = event.get(f'Session{i}')
+                start = event.get(f'Session{i}DateUtc')
+                if name not in PREWARM_SESSIONS or pd.isna(start):
+                    continue
+                start = start.to_pydatetime().replace(tzinfo=timezone.utc)
+                ready_at = start + PREWARM_SESSIONS[name] + self.publish_delay
+                if ready_at <= now <= ready_at + self.lookback:
+                    due.append((start.year, event['Location'], name))
+        return due
+
+    async def warm(self, year, track, session_name, driver_name):
+        driver_info = await self.bot.io_executor.run(self.bot.get_driver_info, driver_name, year)
+        if not driver_info:
+            from data.driver_registry import driver_registry
+            if driver_registry.is_building(year):
+                raise RuntimeError(f"the {year} driver registry is still loading") ##Retried with backoff
+            print(f"Pre-warm skipped, unknown driver '{driver_name}' in {year}")
+            return
+        driver = {'name': driver_info['name'], 'number': driver_info['number']}
+        if self.bot.job_queue:
+            # The workers do the work; a failed job raises here and is retried with this scheduler's backoff
+            from db.jobHandler import PRIORITY_PREWARM
+            if session_name == 'Qualifying':
+                payload = {'year': year, 'track': track, 'driver': driver_info['name'], 'number': driver_info['number']}
+                await self.bot.run_job('warm_qualifying', payload, PRIORITY_PREWARM)
+            else:
+                payload = {'pilot': driver_info['last_name'], 'year': year, 'track': track,
+                           'driver': driver_info['name'], 'number': driver_info['number']}
+                await self.bot.run_job('analysis', payload, PRIORITY_PREWARM)
+            return
+        if session_name == 'Qualifying':
+            await self.bot.analysis_executor.run(_warm_qualifying, year, track, driver)
+            return
+        params = {'pilot': driver_info['last_name'], 'year': year, 'track': track}
+        # Joins a user request for the same event instead of running it again
+        await self.bot.run_analysis(params, driver_info)
+
+    async def run_once(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        schedule = await self.bot.io_executor.run(_load_schedule, now.year)
+        for year, track, session_name in self.due_sessions(schedule, now):
+            for driver_name in self.drivers:
+                job = (year, track, session_name, driver_name)
+                if job in self.done:
+                    continue
+                attempt, next_try = self.retries.get(job, (0, now))
+                if now < next_try:
+                    continue
+                try:
+                    print(f"Pre-warming {session_name} of {track} {year} for {driver_name}...")
+                    await self.warm(year, track, session_name, driver_name)
+                    self.done.add(job)
+                    self.retries.pop(job, None)
+                    print(f"Pre-warmed {session_name} of {track} {year} for {driver_name}")
+                except Exception as e:
+                    # Usually the data is not published yet, try again later
+                    delay = min(self.retry_initial * 2 ** attempt, self.retry_max)
+                    self.retries[job] = (attempt + 1, now + timedelta(seconds=delay))
+                    print(f"Pre-warm of {session_name} of {track} {year} failed ({str(e)}), retrying in {delay:.0f}s")
+
+    async def run(self):
+        print(f"🔥 Pre-warm scheduler started for {', '.join(self.drivers)}")
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Pre-warm scheduler error: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
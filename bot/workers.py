@@ -0,0 +1,155 @@
+import time
+import asyncio
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from metrics.metrics import record, collect_spans, merge_spans
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to an executor whose queue is full."""
+
+class BoundedExecutor:
+    """
+    Runs blocking functions in a thread or process pool so they never block
+    the Telegram event loop.
+
+    At most max_workers jobs run at the same time. Jobs over that limit wait
+    in the queue, and the queue holds at most max_queue jobs, so the bot can
+    tell users how many analyses are ahead of theirs or that it is busy.
+
+    Spans recorded by the jobs end up in the request that submitted them:
+    threads run in a copy of the caller's context and process jobs send
+    their spans back with the result.
+    """
+    def __init__(self, name, max_workers, max_queue, use_processes=False):
+        """
+        Args:
+            name (str): Name used in log messages
+            max_workers (int): Jobs running at the same time
+            max_queue (int): Jobs allowed to wait for a free worker
+            use_processes (bool): Use a process pool instead of threads (default False)
+        """
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.use_processes = use_processes
+        self._executor = None
+        self._semaphore = None
+        self._waiting = 0
+        self._running = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.use_processes:
+                ## Spawn avoids forking a process that already runs the event loop and threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name
+                )
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._executor
+
+    @property
+    def queue_depth(self):
+        """Jobs waiting for a free worker."""
+        return self._waiting
+
+    @property
+    def running(self):
+        """Jobs currently running."""
+        return self._running
+
+    def is_busy(self):
+        """True if a new job would have to wait."""
+        return self._running + self._waiting >= self.max_workers
+
+    def is_full(self):
+        """True if a new job would not fit in the queue."""
+        return self._running >= self.max_workers and self._waiting >= self.max_queue
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) in the pool and waits for its result.
+
+        Raises:
+            QueueFullError: If the queue already holds max_queue jobs
+        """
+        if self.is_full():
+            raise QueueFullError(f"{self.name} queue is full ({self._waiting} waiting)")
+
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+
+        self._waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        record('queue_wait', time.perf_counter() - queued_at, executor=self.name)
+
+        self._running += 1
+        try:
+            if self.use_processes:
+                result, spans = await loop.run_in_executor(executor, partial(collect_spans, func, *args, **kwargs))
+                merge_spans(spans)
+                return result
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(executor, partial(context.run, func, *args, **kwargs))
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key. The first caller runs the
+    work; callers arriving while it runs wait for and reuse its result (or
+    its exception) instead of running the same work again.
+    """
+    def __init__(self):
+        self._inflight = {}
+
+    def is_running(self, key):
+        return key in self._inflight
+
+    async def run(self, key, func, *args, **kwargs):
+        """
+        Awaits func(*args, **kwargs) once per key among overlapping callers.
+
+        Args:
+            key: Hashable key identifying the work
+            func: Coroutine function doing the work
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            # Shield so a cancelled waiter does not cancel the shared work
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
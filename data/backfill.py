@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+## Backfills whole seasons, or some of their events and drivers, into EventF1/Graph/Resume.
+## Usage: python -m data.backfill --seasons 2024 2025 --drivers COL:43 --workers 4
+##        python -m data.backfill --seasons 2025 --drivers colapinto verstappen (numbers from the driver registry)
+##        python -m data.backfill --seasons 2024 --summaries --enqueue (run by the analysis workers)
+
+DEFAULT_CHECKPOINT = os.path.join(BASE_DIR, 'data', 'backfill_checkpoint.json')
+
+_llm = None
+
+def job_key(job):
+    return f"{job['year']}|{job['track']}|{job['driver']}"
+
+def load_events(seasons, events=None, rounds=None):
+    """
+    Returns (year, track) of every past event of the seasons, optionally
+    filtered by event name or location and by round number.
+    """
+    import pandas as pd
+    from data.cache import get_event_schedule
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    selected = []
+    for year in seasons:
+        schedule = get_event_schedule(year)
+        for _, event in schedule.iterrows():
+            if rounds and int(event['RoundNumber']) not in rounds:
+                continue
+            if events and not any(
+                e.lower() in str(event['Location']).lower() or e.lower() in str(event['EventName']).lower()
+                for e in events
+            ):
+                continue
+            if pd.isna(event['Session5DateUtc']) or event['Session5DateUtc'] > now:
+                continue ##Race not run yet
+            selected.append((year, event['Location']))
+    return selected
+
+def missing_graphs(job):
+    """
+    Returns the event id of a job and the names of the graphs it still needs. A
+    driver without a timed qualifying lap, which the stored event figures tell by
+    their pole gap, has no telemetry graph to draw.
+    """
+    from data.driver_analysis import get_event_graph_ids, GRAPH_REQUIREMENTS
+    from db.dbHandler import fetch_one
+    event_id, graph_ids = get_event_graph_ids(job['year'], job['track'], job['driver'])
+    if event_id is None:
+        return None, list(GRAPH_REQUIREMENTS)
+    missing = [name for name in GRAPH_REQUIREMENTS if name not in graph_ids]
+    if 'qualy_telemetry' in missing:
+        row = fetch_one("SELECT pole_gap FROM EventStats WHERE event_id = ?", (event_id,))
+        if row is not None and row[0] is None:
+            missing.remove('qualy_telemetry')
+    return event_id, missing
+
+def is_complete(job, summaries):
+    event_id, missing = missing_graphs(job)
+    if event_id is None or missing:
+        return False
+    if summaries:
+        from db.dbHandler import fetch_one
+        row = fetch_one("SELECT TOP 1 id FROM Resume WHERE event_id = ? AND type = 'summary'", (event_id,))
+        return row is not None
+    return True
+
+def run_job(job, summaries):
+    """Runs in a worker process. Returns the seconds the job took."""
+    from data.driver_analysis import get_full_analysis
+    start = time.perf_counter()
+    get_full_analysis(job['year'], job['track'], job['driver'], job['number'])
+    ## Graphs that failed are left out by get_full_analysis, the job is retried for them
+    _, missing = missing_graphs(job)
+    if missing:
+        raise RuntimeError(f"Graphs not built: {', '.join(missing)}")
+    if summaries:
+        write_summary(job)
+    return time.perf_counter() - start
+
+def write_summary(job):
+    """
+    Stores the LLM summary of a job as the bot's get_event_summary does, unless
+    there is one for the same inputs and model. The summary hash leaves the
+    pilot out, so pilot is the last name users see, not the driver code.
+    """
+    global _llm
+    from llm.llm import F1AnalysisLLM
+    from bot.botHandler import F1TelegramBot
+    from db.resumeHandler import get_resume, save_resume
+    if _llm is None:
+        _llm = F1AnalysisLLM()
+    params = {'pilot': job['pilot'], 'year': job['year'], 'track': job['track']}
+    graphs = F1TelegramBot.get_event_graphs(job['year'], job['track'], job['driver'])
+    input_hash = _llm.summary_input_hash(
+        {'event': F1TelegramBot.make_event_key(job['year'], job['track'], job['driver'])}, graphs
+    )
+    if get_resume(job['year'], job['track'], job['driver'], 'summary', input_hash, _llm.model):
+        return
+    summary = _llm.generate_analysis_summary(params, F1TelegramBot.graphs_info(graphs))
+    save_resume(job['year'], job['track'], job['driver'], 'summary', summary, input_hash, _llm.model)
+
+def run_event(jobs, summaries):
+    """
+    Runs in a worker process the jobs of one event, one after the other, so
+    its sessions are loaded once and only this process writes them to the
+    FastF1 cache and the lap store.
+
+    Returns:
+        list: (job key, seconds, error message or None) of each job
+    """
+    results = []
+    for job in jobs:
+        start = time.perf_counter()
+        try:
+            results.append((job_key(job), run_job(job, summaries), None))
+        except Exception as e:
+            results.append((job_key(job), time.perf_counter() - start, str(e)))
+    return results
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {'done': [], 'failed': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+def parse_driver(value):
+    code, _, number = value.partition(':')
+    if not number:
+        return {'driver': value, 'number': None} ##Resolved per season, see resolve_driver
+    return {'driver': code.upper(), 'number': number}
+
+def resolve_driver(driver, year):
+    """
+    Code, number and last name of a --drivers entry in a season, or None if no
+    driver of the season matches. A CODE:NUMBER entry keeps its number, and its
+    code as the last name if the registry does not know it.
+    """
+    from data.driver_registry import driver_registry
+    entry = driver_registry.resolve(driver['driver'], year)
+    if driver['number'] is not None:
+        return {**driver, 'pilot': entry['last_name'] if entry else driver['driver']}
+    if entry is None:
+        return None
+    return {'driver': entry['name'], 'number': entry['number'], 'pilot': entry['last_name']}
+
+def parse_rounds(value):
+    rounds = set()
+    for part in value.split(','):
+        first, _, last = part.partition('-')
+        rounds.update(range(int(first), int(last or first) + 1))
+    return rounds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill analyses and summaries for whole seasons")
+    parser.add_argument('--seasons', type=int, nargs='+', required=True)
+    parser.add_argument('--events', nargs='*', help="Only events whose name or location contains these words")
+    parser.add_argument('--rounds', type=parse_rounds, help="Only these rounds, e.g. 1-5,8")
+    parser.add_argument('--drivers', type=parse_driver, nargs='+', default=[parse_driver('COL:43')],
+                        help="Drivers as CODE:NUMBER or a name, code or number of the driver registry (default COL:43)")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--summaries', action='store_true', help="Also generate the LLM summaries")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of a previous run")
+    parser.add_argument('--enqueue', action='store_true',
+                        help="Add the jobs to the job queue, below user requests, instead of running them")
+    args = parser.parse_args(argv)
+
+    from db.dbHandler import init_db
+    init_db()
+
+    checkpoint = {'done': [], 'failed': {}} if args.restart else load_checkpoint(args.checkpoint)
+    done = set(checkpoint['done'])
+
+    ## Names are resolved, and summaries written, with the drivers of each season
+    from data.driver_registry import driver_registry
+    for year in args.seasons:
+        driver_registry.refresh(year)
+
+    jobs = []
+    for year, track in load_events(args.seasons, args.events, args.rounds):
+        for driver in args.drivers:
+            resolved = resolve_driver(driver, year)
+            if resolved is None:
+                print(f"Driver '{driver['driver']}' not found in {year}, skipping {track}")
+                continue
+            jobs.append({'year': year, 'track': track, **resolved})
+    pending = []
+    skipped = 0
+    for job in jobs:
+        if job_key(job) in done or is_complete(job, args.summaries):
+            done.add(job_key(job))
+            skipped += 1
+        else:
+            pending.append(job)
+    checkpoint['done'] = sorted(done)
+    save_checkpoint(args.checkpoint, checkpoint)
+
+    if args.enqueue:
+        from db.jobHandler import enqueue_job, PRIORITY_BACKFILL
+        for job in pending:
+            payload = {'pilot': job['pilot'], 'year': job['year'], 'track': job['track'],
+                       'driver': job['driver'], 'number': job['number'], 'summary': args.summaries}
+            enqueue_job('analysis', payload, PRIORITY_BACKFILL)
+        print(f"{len(jobs)} jobs, {skipped} already complete, {len(pending)} added to the job queue")
+        return 0
+
+    ## The drivers of an event run in one process, so no two processes load the same session
+    events = {}
+    for job in pending:
+        events.setdefault((job['year'], job['track']), []).append(job)
+    print(f"{len(jobs)} jobs, {skipped} already complete, {len(pending)} to run "
+          f"({len(events)} events) with {args.workers} workers")
+
+    start = time.perf_counter()
+    completed = failed = 0
+    busy_seconds = 0.0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(run_event, event_jobs, args.summaries): event_jobs for event_jobs in events.values()}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e: ##The worker process died
+                results = [(job_key(job), 0.0, str(e)) for job in futures[future]]
+            for key, seconds, error in results:
+                busy_seconds += seconds
+                if error is None:
+                    completed += 1
+                    done.add(key)
+                    checkpoint['failed'].pop(key, None)
+                else:
+                    failed += 1
+                    checkpoint['failed'][key] = error
+                    print(f"❌ {key} failed: {error}")
+            checkpoint['done'] = sorted(done)
+            save_checkpoint(args.checkpoint, checkpoint)
+
+            elapsed = time.perf_counter() - start
+            finished = completed + failed
+            rate = finished / elapsed * 60 if elapsed else 0.0
+            eta = (len(pending) - finished) / (finished / elapsed) if finished else 0.0
+            print(f"[{finished}/{len(pending)}] {results[0][0].rsplit('|', 1)[0]} - {rate:.1f} jobs/min, ETA {eta / 60:.1f} min")
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {completed} completed, {failed} failed, {skipped} skipped in {elapsed:.1f}s")
+    if completed:
+        print(f"Throughput: {completed / elapsed * 60:.1f} jobs/min, "
+              f"{busy_seconds / completed:.1f}s per job, "
+              f"{busy_seconds / elapsed:.1f}x parallel speedup")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import os
+import sys
+import shutil
+import argparse
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Marker touched every time a session of an event is used, for LRU eviction
+LAST_USED_MARKER = '.last_used'
+
+class SessionDiskCache:
+    """
+    Manages FastF1's on-disk cache so repeat loads of a race come from local
+    disk instead of the upstream API.
+
+    The cache directory has one folder per season and event (FastF1's own
+    layout). Whole events are evicted, least recently used first, when the
+    cache grows over its size budget. A container can start from a
+    pre-populated archive and, in offline mode, serve past races without
+    network access.
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, seed_archive=None, offline=None):
+        """
+        Args:
+            cache_dir (str): Cache directory (default FASTF1_CACHE_DIR or data/cache)
+            max_bytes (int): Size budget in bytes (default FASTF1_CACHE_MAX_MB, 2048 MB)
+            seed_archive (str): Archive or directory copied into an empty cache
+                (default FASTF1_CACHE_SEED)
+            offline (bool): Only serve cached data, never hit the network
+                (default FASTF1_OFFLINE)
+        """
+        self.cache_dir = cache_dir or os.getenv('FASTF1_CACHE_DIR', os.path.join(BASE_DIR, 'data', 'cache'))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('FASTF1_CACHE_MAX_MB', '2048')) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.seed_archive = seed_archive if seed_archive is not None else os.getenv('FASTF1_CACHE_SEED')
+        if offline is None:
+            offline = os.getenv('FASTF1_OFFLINE', '').lower() in ('1', 'true', 'yes')
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._enabled = False
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """Seeds the cache if needed and points FastF1 at it. Safe to call many times."""
+        import fastf1
+        with self._lock:
+            if self._enabled:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.seed_archive and not self.list_events():
+                self.seed(self.seed_archive)
+            fastf1.Cache.enable_cache(self.cache_dir)
+            if self.offline:
+                fastf1.Cache.offline_mode(True)
+                print(f"FastF1 cache in offline mode, serving only {self.cache_dir}")
+            self._enabled = True
+        self.evict()
+
+    def seed(self, source):
+        """
+        Copies a pre-populated cache into the cache directory.
+
+        Args:
+            source (str): Directory or archive (.zip, .tar, .tar.gz, ...) with FastF1's cache layout
+        """
+        print(f"Seeding FastF1 cache from {source}...")
+        if os.path.isdir(source):
+            shutil.copytree(source, self.cache_dir, dirs_exist_ok=True)
+        else:
+            shutil.unpack_archive(source, self.cache_dir)
+        print(f"FastF1 cache seeded with {len(self.list_events())} events")
+
+    def export(self, archive_path, seasons=None):
+        """
+        Writes the cache, or only some seasons of it, to a .tar.gz archive usable as a seed.
+
+        Returns:
+            str: Path of the written archive
+        """
+        base_name = archive_path[:-len('.tar.gz')] if archive_path.endswith('.tar.gz') else archive_path
+        if seasons is None:
+            return shutil.make_archive(base_name, 'gztar', root_dir=self.cache_dir)
+
+        staging = base_name + '_staging'
+        try:
+            for season in seasons:
+                season_dir = os.path.join(self.cache_dir, str(season))
+                if os.path.isdir(season_dir):
+                    shutil.copytree(season_dir, os.path.join(staging, str(season)))
+            return shutil.make_archive(base_name, 'gztar', root_dir=staging)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def session_dir(self, session):
+        ## FastF1 stores a session under its api path without the leading '/static/'
+        return os.path.join(self.cache_dir, session.api_path[8:])
+
+    def is_cached(self, session):
+        """True if the session was already parsed into the cache."""
+        session_dir = self.session_dir(session)
+        return os.path.isdir(session_dir) and any(f.endswith('.ff1pkl') for f in os.listdir(session_dir))
+
+    def record_load(self, session, hit):
+        """Counts a cache hit or miss and marks the session's event as recently used."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        event_dir = os.path.dirname(os.path.normpath(self.session_dir(session)))
+        if os.path.isdir(event_dir):
+            with open(os.path.join(event_dir, LAST_USED_MARKER), 'w'):
+                pass
+        if not hit:
+            self.evict(keep=event_dir)
+
+    def list_events(self):
+        """
+        Returns:
+            list: (last used timestamp, size in bytes, path) of every cached event
+        """
+        import fastf1
+        events = []
+        if not os.path.isdir(self.cache_dir):
+            return events
+        for season in os.listdir(self.cache_dir):
+            season_dir = os.path.join(self.cache_dir, season)
+            if not season.isdigit() or not os.path.isdir(season_dir):
+                continue
+            for event in os.listdir(season_dir):
+                event_dir = os.path.join(season_dir, event)
+                if not os.path.isdir(event_dir):
+                    continue
+                marker = os.path.join(event_dir, LAST_USED_MARKER)
+                last_used = os.path.getmtime(marker if os.path.exists(marker) else event_dir)
+                events.append((last_used, fastf1.Cache._get_size(event_dir), event_dir))
+        return events
+
+    def size(self):
+        """Bytes used on disk, including FastF1's HTTP request cache."""
+        import fastf1
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        return fastf1.Cache._get_size(self.cache_dir)
+
+    def evict(self, keep=None):
+        """
+        Deletes least recently used events until the cache fits its budget.
+
+        Args:
+            keep (str): Event directory that must not be evicted
+        """
+        if self.max_bytes <= 0:
+            return
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        for last_used, event_size, event_dir in sorted(self.list_events()):
+            if total <= self.max_bytes:
+                break
+            if keep and os.path.normpath(event_dir) == os.path.normpath(keep):
+                continue
+            shutil.rmtree(event_dir, ignore_errors=True)
+            total -= event_size
+            print(f"Evicted {os.path.relpath(event_dir, self.cache_dir)} from the FastF1 cache")
+            season_dir = os.path.dirname(event_dir)
+            if not os.listdir(season_dir):
+                os.rmdir(season_dir)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hits, misses and hit rate of this process, plus events and bytes on disk
+        """
+        loads = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / loads if loads else 0.0,
+            'events': len(self.list_events()),
+            'bytes_on_disk': self.size(),
+            'max_bytes': self.max_bytes,
+        }
+
+## Shared cache for the whole process
+disk_cache = SessionDiskCache()
+
+def get_event_schedule(year):
+    """
+    FastF1 event schedule of a season, without testing, read through the
+    shared disk cache. Every FastF1 call must enable the cache first, or
+    FastF1 falls back to its default cache and ignores offline mode.
+    """
+    import fastf1
+    disk_cache.enable()
+    return fastf1.get_event_schedule(year, include_testing=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the FastF1 on-disk cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show cached events and bytes on disk")
+    seed_parser = subparsers.add_parser('seed', help="Copy an archive or directory into the cache")
+    seed_parser.add_argument('source')
+    export_parser = subparsers.add_parser('export', help="Write the cache to a .tar.gz seed archive")
+    export_parser.add_argument('archive')
+    export_parser.add_argument('--seasons', type=int, nargs='*')
+    subparsers.add_parser('evict', help="Evict events until the cache fits its budget")
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        for last_used, event_size, event_dir in sorted(disk_cache.list_events(), reverse=True):
+            print(f"{os.path.relpath(event_dir, disk_cache.cache_dir)}: {event_size / 1024 / 1024:.1f} MB")
+        stats = disk_cache.stats()
+        print(f"{stats['events']} events, {stats['bytes_on_disk'] / 1024 / 1024:.1f} MB "
+              f"of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    elif args.command == 'seed':
+        os.makedirs(disk_cache.cache_dir, exist_ok=True)
+        disk_cache.seed(args.source)
+    elif args.command == 'export':
+        print(f"Cache written to {disk_cache.export(args.archive, args.seasons)}")
+    elif args.command == 'evict':
+        disk_cache.evict()
+
+if __name__ == "__main__":
+    sys.exit(main())
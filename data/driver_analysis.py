@@ -1,391 +1,488 @@
 import os
 import sys
-import seaborn as sns
-import numpy as np
-import pandas as pd
-from pandas import to_timedelta
-import fastf1
-import fastf1.plotting
-from fastf1.core import Laps
-from matplotlib import pyplot as plt
-import matplotlib.dates as mdates
-from timple.timedelta import strftimedelta
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) ##Add the base directory to the path to fix the import error
 sys.path.append(BASE_DIR)
-from db.dbHandler import get_db_connection
+from db.dbHandler import db_cursor, fetch_all
+from data.session_provider import load_session, load_uncached, needs_to_load_flags
+from data.lap_stats import quick_laps_of
+from data.lap_store import lap_store
+from data.tyre_degradation import fit_stints, degradation_stats, describe_degradation
+from data.telemetry import MINISECTORS, minisector_winners
+from data.season_progress import EVENT_STATS_VERSION, event_stats
+from db.eventStatsHandler import write_event_stats
+from data.render import submit_render, archive_image, get_render_profile
+from metrics.metrics import merge_spans
+
+## Builders read the slim tables of the lap store, never a FastF1 session, so
+## importing this module (e.g. from the bot) stays cheap and a session is only
+## loaded the first time one of its graphs is built
+
+## Session and data each graph needs. Sessions are loaded with only the union
+## of the needs of the graphs being built
+GRAPH_REQUIREMENTS = {
+    'race_positions_changes': {'session': 'R', 'needs': ('laps', 'results')},
+    'race_laps_times': {'session': 'R', 'needs': ('laps', 'results')},
+    'race_laptimes_distribution': {'session': 'R', 'needs': ('laps', 'results')},
+    'qualy_results': {'session': 'Q', 'needs': ('laps', 'results', 'messages')}, ##Messages flag deleted laps
+    'race_tyre_degradation': {'session': 'R', 'needs': ('laps', 'results')},
+    ## Telemetry is only loaded for laps whose reduced traces are not in the lap store yet
+    'qualy_telemetry': {'session': 'Q', 'needs': ('laps', 'results', 'messages')},
+}
+
+## Sessions and data the per-event figures of the season reports are computed from
+EVENT_STATS_REQUIREMENTS = {'R': ('laps', 'results'), 'Q': ('laps', 'results', 'messages')}
+
+## Lap the telemetry graph compares with: 'pole', or 'teammate' for the teammate's fastest lap.
+## A driver on pole is always compared with their teammate
+TELEMETRY_RIVAL = os.getenv('TELEMETRY_RIVAL', 'pole').lower()
+
+class GraphSkipped(Exception):
+    """Raised by a graph builder when the graph does not apply to the driver, e.g. no timed lap."""
+
+## Get the load flags for every session used by the given graphs
+def get_session_load_flags(graph_names):
+    needs_by_session = {}
+    for name in graph_names:
+        requirement = GRAPH_REQUIREMENTS[name]
+        needs_by_session.setdefault(requirement['session'], []).append(requirement['needs'])
+    return {session_type: needs_to_load_flags(*needs) for session_type, needs in needs_by_session.items()}
+
+## Get the lap store tables of a session. If the session is not in the store
+## it is loaded with the given flags, or only the given needs, to build them
+def load_session_tables(year, track, session_type, needs, load_flags=None):
+    if load_flags is None:
+        load_flags = needs_to_load_flags(needs)
+    return lap_store.get(
+        year, track, session_type,
+        lambda: load_session(year, track, session_type, **load_flags)
+    )
 
-fastf1.plotting.setup_mpl(mpl_timedelta_support=True, misc_mpl_mods=False, color_scheme='fastf1') ##Dark mode
+## Get the lap store tables of the session of a graph
+def load_graph_tables(year, track, graph_name, load_flags=None):
+    requirement = GRAPH_REQUIREMENTS[graph_name]
+    return load_session_tables(year, track, requirement['session'], requirement['needs'], load_flags)
 
-driver_number = '43'
-driver_name = 'COL'
+## Get the event and every graph it already has in a single query.
+## Returns (event_id, {graph name: graph id}), event_id is None if the event does not exist
+def get_event_graph_ids(year, track, driver):
+    query = """
+    SELECT e.id, g.id, g.name
+    FROM EventF1 e
+    LEFT JOIN Graph g ON g.event_id = e.id
+    WHERE e.season = ? AND e.gp = ? AND e.driver = ?
+    """
+    rows = fetch_all(query, (year, track, driver))
+    if not rows:
+        return None, {}
+    return rows[0][0], {row[2]: row[1] for row in rows if row[1] is not None}
+
+## Check if the event and the graph already exist. Returns (event_id, graph_id), None when missing
+def find_graph(year, track, driver, name, existing=None):
+    event_id, graph_ids = existing if existing is not None else get_event_graph_ids(year, track, driver)
+    if event_id is not None:
+        if name in graph_ids:
+            print(f"Graph ({name}) already exists for {driver} in {year} {track}")
+            print(f"Graph ID: {graph_ids[name]}")
+            return event_id, graph_ids[name]
+        print(f"Event exists but graph ({name}) does not exist, creating graph...")
+        return event_id, None
 
-conn, cursor = get_db_connection()
+    print(f"Event does not exist for {driver} in {year} {track}, creating event...")
+    return None, None
 
-## Get the event data from the database
-def get_event_data(year, track, driver):
-    query = "SELECT id FROM EventF1 WHERE season = ? AND gp = ? AND driver = ?"
+def get_graph_filepath(name, driver, track, year):
+    filename = f"{name}_{driver}_{track}_{year}.{get_render_profile()['extension']}"
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, "media", filename)
+
+## Categorical columns back to plain values, as the renderers and seaborn expect them
+def plain(frame):
+    return frame.astype({c: 'object' for c in frame.columns if str(frame[c].dtype) == 'category'})
+
+## Queue the graph in the render pool. Returns a pending graph for save_graph
+def submit_graph(name, year, track, driver, payload, description):
+    filepath = get_graph_filepath(name, driver, track, year)
+    return {
+        'name': name,
+        'year': year,
+        'track': track,
+        'driver': driver,
+        'filepath': filepath,
+        'description': description,
+        'future': submit_render(name, payload),
+    }
+
+## Get the event id, creating the event if needed. The row stays locked until the
+## transaction ends so concurrent writers of the same event run one after another
+def lock_event(cursor, year, track, driver):
+    cursor.execute(
+        "SELECT id FROM EventF1 WITH (UPDLOCK, HOLDLOCK) WHERE season = ? AND gp = ? AND driver = ?",
+        (year, track, driver)
+    )
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    query = """
+    INSERT INTO EventF1 (season, gp, driver) 
+    OUTPUT INSERTED.id
+    VALUES (?, ?, ?)
+    """
     cursor.execute(query, (year, track, driver))
-    result = cursor.fetchall()
-    return result
-
-## Get the graph data from the database
-def get_graph_data(event_id, name):
-    query = "SELECT id FROM Graph WHERE event_id = ? AND name = ?"
-    cursor.execute(query, (event_id, name))
-    result = cursor.fetchall()
-    return result
+    return int(cursor.fetchone()[0])
+
+## Wait for pending graphs to be rendered and store all of them in one transaction.
+## Items that are ints are graphs that already existed and are returned as they are.
+## The rendered image is kept in pending['image']; it is written to disk in the
+## background while the other renders finish, and a row is only stored once its
+## file exists, so every Graph row points to a file.
+## Waiting for the last write keeps one small file write on the request path. It is
+## kept because callers get the new rows' ids here, and sending or caching a graph
+## whose row could later point to a missing file would break that invariant
+def save_graphs(pending_graphs):
+    errors = []
+    archived = []
+    for pending in pending_graphs:
+        if isinstance(pending, dict):
+            try:
+                pending['image'], spans = pending['future'].result()
+                merge_spans(spans)
+                archived.append((pending, archive_image(pending['image'], pending['filepath'])))
+            except Exception as e:
+                print(f"Graph ({pending['name']}) could not be rendered: {str(e)}")
+                errors.append(e)
+
+    rendered = []
+    for pending, archive in archived:
+        try:
+            archive.result()
+            rendered.append(pending)
+        except Exception as e:
+            print(f"Graph ({pending['name']}) could not be written to {pending['filepath']}: {str(e)}")
+            errors.append(e)
+
+    graph_ids = {}
+    if rendered:
+        with db_cursor(commit=True) as cursor:
+            by_event = {}
+            for pending in rendered:
+                by_event.setdefault((pending['year'], pending['track'], pending['driver']), []).append(pending)
+
+            for (year, track, driver), graphs in by_event.items():
+                event_id = lock_event(cursor, year, track, driver)
+
+                # Another writer may have stored some of the graphs since they were looked up
+                cursor.execute("SELECT id, name FROM Graph WHERE event_id = ?", (event_id,))
+                stored = {row[1]: row[0] for row in cursor.fetchall()}
+                new_graphs = [g for g in graphs if g['name'] not in stored]
+                for g in graphs:
+                    if g['name'] in stored:
+                        graph_ids[id(g)] = stored[g['name']]
+
+                if new_graphs:
+                    values = ", ".join(["(?, ?, ?, ?)"] * len(new_graphs))
+                    query = f"""
+                    INSERT INTO Graph (event_id, name, graph_path, description) 
+                    OUTPUT INSERTED.id, INSERTED.name
+                    VALUES {values}
+                    """
+                    params = []
+                    for g in new_graphs:
+                        params.extend((event_id, g['name'], g['filepath'], g['description']))
+                    cursor.execute(query, params)
+                    inserted = {row[1]: int(row[0]) for row in cursor.fetchall()}
+                    for g in new_graphs:
+                        graph_ids[id(g)] = inserted[g['name']]
+                        print(f"Graph ({g['name']}) created for {driver} in {year} {track}")
+                        print(f"Graph ID: {inserted[g['name']]}")
+
+    if errors:
+        raise errors[0]
+    return [graph_ids[id(p)] if isinstance(p, dict) else p for p in pending_graphs]
+
+## Wait for a pending graph to be rendered and store it in the database
+def save_graph(pending):
+    return save_graphs([pending])[0]
 
 ## Data functions
-def race_positions_changes(year, track, driverNum): ##Driver Number
-    event_data = get_event_data(year, track, driver_name)
-    
-    if event_data:
-        # If event exists, check if graph exists
-        graph_data = get_graph_data(event_data[0][0], 'race_positions_changes')
-        if graph_data:
-            print(f"Graph (race_positions_changes) already exists for {driver_name} in {year} {track}")
-            print(f"Graph ID: {graph_data[0][0]}")
-            return graph_data[0][0]
-        else:
-            print(f"Event exists but graph (race_positions_changes) does not exist, creating graph...")
-            event_id = event_data[0][0]  # Usar el event_id existente
-
-    print(f"Event does not exist for {driver_name} in {year} {track}, creating event...")
-
-    race = fastf1.get_session(year, track, 'R')
-    race.load(telemetry=False, weather=False)
-    fig, ax = plt.subplots(figsize=(8.0, 4.9))
-
-    for drv in race.drivers:
-        drv_laps = race.laps.pick_drivers(drv)
-        abb = drv_laps['Driver'].iloc[0]
-        style = fastf1.plotting.get_driver_style(identifier=abb, style=['color', 'linestyle'], session=race)
-        if drv != driverNum:
+## Each start_* function prepares the compact data of a graph and queues its render,
+## the matching public function also waits for it and stores it
+def start_race_positions_changes(year, track, driver, driverNum, load_flags=None, existing=None): ##Driver name and number
+    _, graph_id = find_graph(year, track, driver, 'race_positions_changes', existing)
+    if graph_id is not None:
+        return graph_id
+
+    race = load_graph_tables(year, track, 'race_positions_changes', load_flags)
+    stats = race['stats']
+
+    styles = []
+    for drv in race['drivers'].itertuples():
+        if drv.DriverNumber not in stats['abbreviations']: ##Driver without laps
+            continue
+        abb = drv.Abbreviation
+        style = {'color': drv.Color, 'linestyle': drv.LineStyle}
+        if drv.DriverNumber != driverNum:
             style['color'] = 'blue'
             style['linestyle'] = '-'
-        ax.plot(drv_laps['LapNumber'], drv_laps['Position'], label=abb, **style)
+        styles.append((abb, style))
 
-    ax.set_ylim([20.5, 0.5])
-    ax.set_yticks([1, 5, 10, 15, 20])
-    ax.set_xlabel('Lap')
-    ax.set_ylabel('Position')
-    ax.legend(bbox_to_anchor=(1.0, 1.02))
+    payload = {
+        'laps': plain(stats['laps'][['Driver', 'LapNumber', 'Position']]),
+        'styles': styles,
+    }
 
-    filename = f"race_positions_changes_{driver_name}_{track}_{year}.png"
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    filepath = os.path.join(script_dir, "media", filename)
-
-    drv_laps = race.laps.pick_drivers(driverNum)
-    description = f"{driver_name} driver started in position {drv_laps['Position'].iloc[0]} and finished in position {drv_laps['Position'].iloc[-1]}"
-
-    # Solo insertar evento si no existe
-    if not event_data:
-        query = """
-        INSERT INTO EventF1 (season, gp, driver) 
-        OUTPUT INSERTED.id
-        VALUES (?, ?, ?)
-        """
-        cursor.execute(query, (year, track, driver_name))
-        event_id = int(cursor.fetchone()[0])
-        conn.commit()
+    description = f"{driver} driver started in position {stats['start_position'][driverNum]} and finished in position {stats['finish_position'][driverNum]}"
+    return submit_graph('race_positions_changes', year, track, driver, payload, description)
 
-    query = """
-    INSERT INTO Graph (event_id, name, graph_path, description) 
-    OUTPUT INSERTED.id
-    VALUES (?, ?, ?, ?)
-    """
-    cursor.execute(query, (event_id, 'race_positions_changes', filepath, description))
-    graph_id = int(cursor.fetchone()[0])
-    conn.commit()
-
-    plt.savefig(filepath)
-    plt.close(fig)
-    print(f"Graph (race_positions_changes) created for {driver_name} in {year} {track}")
-    print(f"Graph ID: {graph_id}")
-    return graph_id
-        
-
-def race_laps_times(year, track, driver): ##Driver name
-
-    event_data = get_event_data(year, track, driver)
-    if event_data:
-        graph_data = get_graph_data(event_data[0][0], 'race_laps_times')
-        if graph_data:
-            print(f"Graph (race_laps_times) already exists for {driver} in {year} {track}")
-            print(f"Graph ID: {graph_data[0][0]}")
-            return graph_data[0][0]
-        else:
-            print(f"Event exists but graph (race_laps_times) does not exist, creating graph...")
-            event_id = event_data[0][0]
+def race_positions_changes(year, track, driver, driverNum, load_flags=None): ##Driver name and number
+    return save_graph(start_race_positions_changes(year, track, driver, driverNum, load_flags))
 
-    print(f"Event does not exist for {driver} in {year} {track}, creating event...")
-    race = fastf1.get_session(year, track, 'R')
-    race.load()
-    driver_laps = race.laps.pick_drivers(driver).pick_quicklaps().reset_index()
-    fig, ax = plt.subplots(figsize=(8, 8))
-
-    # Scatterplot of lap times
-    sns.scatterplot(
-        data=driver_laps,
-        x="LapNumber",
-        y="LapTime",
-        ax=ax,
-        hue="Compound",
-        palette=fastf1.plotting.get_compound_mapping(session=race),
-        s=80,
-        linewidth=0,
-        legend='auto'
-    )
-    ax.set_xlabel("Lap Number")
-    ax.set_ylabel("Lap Time")
-
-    # Add trend line
-    lap_numbers = driver_laps["LapNumber"].values
-    lap_times_sec = driver_laps["LapTime"].dt.total_seconds().values
-
-    # Only fit if there are enough laps
-    if len(lap_numbers) > 20:
-        # Fit a 1st degree polynomial (linear trend)
-        z = np.polyfit(lap_numbers, lap_times_sec, 1)
-        p = np.poly1d(z)
-        trend_lap_times_sec = p(lap_numbers)
-        # Convert back to timedelta for plotting
-        trend_lap_times = to_timedelta(trend_lap_times_sec, unit='s')
-        ax.plot(
-            lap_numbers,
-            trend_lap_times,
-            color='white',
-            linestyle='--',
-            linewidth=2,
-        )
-        # Add trend line to legend
-        handles, labels = ax.get_legend_handles_labels()
-
-    # The y-axis increases from bottom to top by default
-    # Since we are plotting time, it makes sense to invert the axis
-    ax.invert_yaxis()
-    plt.suptitle(f"{driver} Laptimes in the {year} {track} Grand Prix")
-
-    plt.grid(color='w', which='major', axis='both')
-    sns.despine(left=True, bottom=True)
-
-    filename = f"race_laps_times_{driver}_{track}_{year}.png"
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    filepath = os.path.join(script_dir, "media", filename)
+
+def start_race_laps_times(year, track, driver, load_flags=None, existing=None): ##Driver name
+    _, graph_id = find_graph(year, track, driver, 'race_laps_times', existing)
+    if graph_id is not None:
+        return graph_id
+
+    race = load_graph_tables(year, track, 'race_laps_times', load_flags)
+    stats = race['stats']
+    laps = stats['laps']
+    driver_laps = laps[(laps['Driver'] == driver) & stats['quick']].reset_index(drop=True)
+
+    payload = {
+        'laps': plain(driver_laps[['LapNumber', 'LapTime', 'Compound']]),
+        'compound_palette': race['compound_palette'],
+        'title': f"{driver} Laptimes in the {year} {track} Grand Prix",
+    }
     description = f"{driver} driver lap times in the {year} {track} Grand Prix"
+    return submit_graph('race_laps_times', year, track, driver, payload, description)
 
-    if not event_data:
-        query = """
-        INSERT INTO EventF1 (season, gp, driver) 
-        OUTPUT INSERTED.id
-        VALUES (?, ?, ?)
-        """
-        cursor.execute(query, (year, track, driver))
-        event_id = int(cursor.fetchone()[0])
-        conn.commit()
+def race_laps_times(year, track, driver, load_flags=None): ##Driver name
+    return save_graph(start_race_laps_times(year, track, driver, load_flags))
 
-    query = """
-    INSERT INTO Graph (event_id, name, graph_path, description) 
-    OUTPUT INSERTED.id
-    VALUES (?, ?, ?, ?)
-    """
-    cursor.execute(query, (event_id, 'race_laps_times', filepath, description))
-    graph_id = int(cursor.fetchone()[0])
-    conn.commit()
-
-    plt.savefig(filepath)
-    plt.close(fig)
-    print(f"Graph (race_laps_times) created for {driver} in {year} {track}")
-    return graph_id
-
-def race_laptimes_distribution(year, track, driverNum): ##Driver number
-    event_data = get_event_data(year, track, driver_name)
-    if event_data:
-        graph_data = get_graph_data(event_data[0][0], 'race_laptimes_distribution')
-        if graph_data:
-            print(f"Graph (race_laptimes_distribution) already exists for {driver_name} in {year} {track}")
-            print(f"Graph ID: {graph_data[0][0]}")
-            return graph_data[0][0]
-        else:
-            print(f"Event exists but graph (race_laptimes_distribution) does not exist, creating graph...")
-            event_id = event_data[0][0]
-
-    print(f"Event does not exist for {driver_name} in {year} {track}, creating event...")
-    race = fastf1.get_session(year, track, 'R')
-    race.load()
-
-    point_finishers = race.drivers[:10]
+
+def start_race_laptimes_distribution(year, track, driver, driverNum, load_flags=None, existing=None): ##Driver name and number
+    _, graph_id = find_graph(year, track, driver, 'race_laptimes_distribution', existing)
+    if graph_id is not None:
+        return graph_id
+
+    race = load_graph_tables(year, track, 'race_laptimes_distribution', load_flags)
+    drivers = race['drivers']
+
+    point_finishers = drivers['DriverNumber'].tolist()[:10]
     if driverNum not in point_finishers:
         point_finishers.append(driverNum)
     print(point_finishers)
-    driver_laps = race.laps.pick_drivers(point_finishers).pick_quicklaps()
-    driver_laps = driver_laps.reset_index()
+    driver_laps = quick_laps_of(race['stats'], point_finishers).reset_index(drop=True)
 
-    finishing_order = [race.get_driver(i)["Abbreviation"] for i in point_finishers]
+    abbreviations = drivers.set_index('DriverNumber')['Abbreviation']
+    finishing_order = [abbreviations[i] for i in point_finishers]
     print(finishing_order)
 
-    fig, ax = plt.subplots(figsize=(10, 5))
-
-    driver_laps["LapTime(s)"] = driver_laps["LapTime"].dt.total_seconds()
-
-    sns.violinplot(data=driver_laps,
-                x="Driver",
-                y="LapTime(s)",
-                hue="Driver",
-                inner=None,
-                density_norm="area",
-                order=finishing_order,
-                palette=fastf1.plotting.get_driver_color_mapping(session=race)
-                )
-
-    sns.swarmplot(data=driver_laps,
-                x="Driver",
-                y="LapTime(s)",
-                order=finishing_order,
-                hue="Compound",
-                palette=fastf1.plotting.get_compound_mapping(session=race),
-                hue_order=["SOFT", "MEDIUM", "HARD"],
-                linewidth=0,
-                size=4,
-                )
-
-    ax.set_xlabel("Driver")
-    ax.set_ylabel("Lap Time (s)")
-    plt.suptitle(f"{year} {track} Grand Prix Lap Time Distributions")
-    sns.despine(left=True, bottom=True)
-
-    filename = f"race_laptimes_distribution_{driver_name}_{track}_{year}.png"
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    filepath = os.path.join(script_dir, "media", filename)
-    description = f"{driver_name} driver lap time distribution in the {year} {track} Grand Prix"
-
-    if not event_data:
-        query = """
-        INSERT INTO EventF1 (season, gp, driver) 
-        OUTPUT INSERTED.id
-        VALUES (?, ?, ?)
-        """
-        cursor.execute(query, (year, track, driver_name))
-        event_id = int(cursor.fetchone()[0])
-        conn.commit()
-
-    query = """
-    INSERT INTO Graph (event_id, name, graph_path, description) 
-    OUTPUT INSERTED.id
-    VALUES (?, ?, ?, ?)
-    """
-    cursor.execute(query, (event_id, 'race_laptimes_distribution', filepath, description))
-    graph_id = int(cursor.fetchone()[0])
-    conn.commit()
-
-    plt.savefig(filepath)
-    plt.close(fig)
-    print(f"Graph (race_laptimes_distribution) created for {driver_name} in {year} {track}")
-    return graph_id
-
-
-def qualy_results(year, track, driver): ##Driver name
-    event_data = get_event_data(year, track, driver)
-    if event_data:
-        graph_data = get_graph_data(event_data[0][0], 'qualy_results')
-        if graph_data:
-            print(f"Graph (qualy_results) already exists for {driver} in {year} {track}")
-            print(f"Graph ID: {graph_data[0][0]}")
-            return graph_data[0][0]
-        else:
-            print(f"Event exists but graph (qualy_results) does not exist, creating graph...")
-            event_id = event_data[0][0]
+    payload = {
+        'laps': plain(driver_laps[['Driver', 'LapTime(s)', 'Compound']]),
+        'finishing_order': finishing_order,
+        'driver_palette': dict(zip(drivers['Abbreviation'], drivers['Color'])),
+        'compound_palette': race['compound_palette'],
+        'title': f"{year} {track} Grand Prix Lap Time Distributions",
+    }
+    description = f"{driver} driver lap time distribution in the {year} {track} Grand Prix"
+    return submit_graph('race_laptimes_distribution', year, track, driver, payload, description)
 
-    print(f"Event does not exist for {driver} in {year} {track}, creating event...")
-    
-    session = fastf1.get_session(year, track, 'Q')
-    session.load()
+def race_laptimes_distribution(year, track, driver, driverNum, load_flags=None): ##Driver name and number
+    return save_graph(start_race_laptimes_distribution(year, track, driver, driverNum, load_flags))
 
-    drivers = pd.unique(session.laps['Driver'])
-    print(drivers)
 
-    list_fastest_laps = list()
-    for drv in drivers:
-        drvs_fastest_lap = session.laps.pick_drivers(drv).pick_fastest()
-        if drvs_fastest_lap is not None:
-            list_fastest_laps.append(drvs_fastest_lap)
+def start_qualy_results(year, track, driver, load_flags=None, existing=None): ##Driver name
+    _, graph_id = find_graph(year, track, driver, 'qualy_results', existing)
+    if graph_id is not None:
+        return graph_id
 
-    fastest_laps = Laps(list_fastest_laps) \
-        .sort_values(by='LapTime') \
-        .reset_index(drop=True)
+    from timple.timedelta import strftimedelta
+    session = load_graph_tables(year, track, 'qualy_results', load_flags)
 
-    pole_lap = fastest_laps.pick_fastest()
-    fastest_laps['LapTimeDelta'] = fastest_laps['LapTime'] - pole_lap['LapTime']
+    ## Fastest lap of every driver, sorted, with the delta to pole
+    fastest_laps = session['fastest_laps']
+    print(fastest_laps['Driver'].tolist())
+    pole_lap = fastest_laps.iloc[0]
 
+    colors = session['drivers'].set_index('Abbreviation')
+    driver_color = None
     team_colors = list()
-    fig, ax = plt.subplots()
-    for index, lap in fastest_laps.iterlaps():
-        if lap['Driver'] == driver:
-            color = fastf1.plotting.get_driver_color(lap['Driver'], session=session)
-
-            ax.barh(index, lap['LapTimeDelta'], color=color, edgecolor='black', hatch='//', zorder=3)
+    for lap in fastest_laps.itertuples():
+        if lap.Driver == driver:
+            driver_color = colors.at[lap.Driver, 'Color']
             continue
-        else:
-            color = fastf1.plotting.get_team_color(lap['Team'], session=session)
-        team_colors.append(color)
-
-    ax.barh(fastest_laps.index, fastest_laps['LapTimeDelta'],
-            color=team_colors, edgecolor='grey')
-    ax.set_yticks(fastest_laps.index)
-    ax.set_yticklabels(fastest_laps['Driver'])
-    ax.invert_yaxis()
-
-    ax.set_axisbelow(True)
-    ax.xaxis.grid(True, which='major', linestyle='--', color='black', zorder=-1000)
+        team_colors.append(colors.at[lap.Driver, 'TeamColor'])
 
     lap_time_string = strftimedelta(pole_lap['LapTime'], '%m:%s.%ms')
 
-    plt.suptitle(f"{session.event['EventName']} {session.event.year} Qualifying\n"
-                f"Fastest Lap: {lap_time_string} ({pole_lap['Driver']})")
-    
-    filename = f"qualy_results_{driver}_{track}_{year}.png"
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    media_dir = os.path.join(script_dir, "media")
-    os.makedirs(media_dir, exist_ok=True)
-    filepath = os.path.join(media_dir, filename)
+    payload = {
+        'fastest_laps': plain(fastest_laps[['Driver', 'LapTimeDelta']]),
+        'driver': driver,
+        'driver_color': driver_color,
+        'team_colors': team_colors,
+        'title': f"{session['event_name']} {year} Qualifying\n"
+                 f"Fastest Lap: {lap_time_string} ({pole_lap['Driver']})",
+    }
     description = f"{driver} driver qualy results in the {year} {track} Grand Prix."
-    
     print(description)
-    if not event_data:
-        query = """
-        INSERT INTO EventF1 (season, gp, driver) 
-        OUTPUT INSERTED.id
-        VALUES (?, ?, ?)
-        """
-        cursor.execute(query, (year, track, driver))
-        event_id = int(cursor.fetchone()[0])
-        conn.commit()
-
-    query = """
-    INSERT INTO Graph (event_id, name, graph_path, description) 
-    OUTPUT INSERTED.id
-    VALUES (?, ?, ?, ?)
-    """
-    cursor.execute(query, (event_id, 'qualy_results', filepath, description))
-    graph_id = int(cursor.fetchone()[0])
-    conn.commit()
-
-    plt.savefig(filepath)
-    plt.close(fig)
-    print(f"Graph (qualy_results) created for {driver} in {year} {track}")
-    return graph_id
-
-def get_full_analysis(year, track, driverName, driverNumber):
-    race_positions_changes(year, track, driverNumber)
-    race_laps_times(year, track, driverName)
-    race_laptimes_distribution(year, track, driverNumber)
-    qualy_results(year, track, driverName)
-
-##race_positions_changes(2025, 'Monaco', driver_number)
-##race_laps_times(2025, 'Monaco', driver_name)
-## time_race_pace(2025, 'Monaco')
-##race_laptimes_distribution(2025, 'Monaco', driver_number)
-## qualy_results(2025, 'Imola', driver_name)
-
-## get_full_analysis(2025, 'Monaco', driver_name, driver_number)
\ No newline at end of file
+    return submit_graph('qualy_results', year, track, driver, payload, description)
+
+def qualy_results(year, track, driver, load_flags=None): ##Driver name
+    return save_graph(start_qualy_results(year, track, driver, load_flags))
+
+def start_race_tyre_degradation(year, track, driver, load_flags=None, existing=None): ##Driver name
+    _, graph_id = find_graph(year, track, driver, 'race_tyre_degradation', existing)
+    if graph_id is not None:
+        return graph_id
+
+    race = load_graph_tables(year, track, 'race_tyre_degradation', load_flags)
+    ## Every stint of the grid is fitted in one pass, the driver's are ranked against them
+    stints = fit_stints(race['stats'])
+    stats = degradation_stats(stints, driver)
+
+    payload = {
+        'stints': plain(stints[['Driver', 'Stint', 'Compound', 'Slope']]),
+        'driver': driver,
+        'compound_palette': race['compound_palette'],
+        'title': f"{year} {track} Grand Prix Tyre Degradation per Stint",
+    }
+    description = describe_degradation(driver, year, track, stats)
+    print(description)
+    return submit_graph('race_tyre_degradation', year, track, driver, payload, description)
+
+def race_tyre_degradation(year, track, driver, load_flags=None): ##Driver name
+    return save_graph(start_race_tyre_degradation(year, track, driver, load_flags))
+
+## Fastest lap the telemetry graph compares the driver's fastest lap with
+def pick_rival_lap(fastest_laps, drivers, driver):
+    teams = drivers.set_index('Abbreviation')['TeamName']
+    others = fastest_laps[fastest_laps['Driver'] != driver]
+    if TELEMETRY_RIVAL == 'teammate' or fastest_laps.iloc[0]['Driver'] == driver:
+        teammates = others[others['Driver'].map(teams) == teams.get(driver)]
+        if not teammates.empty:
+            return teammates.iloc[0], 'teammate'
+    if fastest_laps.iloc[0]['Driver'] != driver:
+        return fastest_laps.iloc[0], 'pole'
+    return others.iloc[0], 'second fastest'
+
+def start_qualy_telemetry(year, track, driver, load_flags=None, existing=None): ##Driver name
+    _, graph_id = find_graph(year, track, driver, 'qualy_telemetry', existing)
+    if graph_id is not None:
+        return graph_id
+
+    import pandas as pd
+    session = load_graph_tables(year, track, 'qualy_telemetry', load_flags)
+    fastest_laps = session['fastest_laps']
+    own_laps = fastest_laps[fastest_laps['Driver'] == driver]
+    if own_laps.empty:
+        raise GraphSkipped(f"{driver} has no timed lap in the {year} {track} qualifying")
+    own_lap = own_laps.iloc[0]
+    rival_lap, rival_kind = pick_rival_lap(fastest_laps, session['drivers'], driver)
+    rival = rival_lap['Driver']
+
+    ## Only the two laps are reduced, and only the first time they are drawn. The session
+    ## with telemetry is loaded outside the session LRU so it is freed once they are stored
+    telemetry_flags = needs_to_load_flags(GRAPH_REQUIREMENTS['qualy_telemetry']['needs'], ('telemetry',))
+    traces = lap_store.get_lap_traces(
+        year, track, 'Q',
+        [(own_lap['DriverNumber'], own_lap['LapNumber']), (rival_lap['DriverNumber'], rival_lap['LapNumber'])],
+        lambda: load_uncached(year, track, 'Q', scope='telemetry', **telemetry_flags)
+    )
+    traces = pd.concat([trace.assign(Driver=d) for trace, d in zip(traces, (driver, rival))], ignore_index=True)
+
+    styles = session['drivers'].set_index('Abbreviation')
+    styles = {d: {'color': styles.at[d, 'Color'], 'linestyle': styles.at[d, 'LineStyle']} for d in (driver, rival)}
+    if styles[driver]['color'] == styles[rival]['color']: ##Teammates, keep them apart on the map
+        styles[rival]['color'] = 'white'
+
+    wins = int((minisector_winners(traces, [driver, rival]) == 0).sum())
+    top_speeds = traces[traces['Channel'] == 'Speed'].groupby('Driver', observed=True)['Value'].max()
+    gap = (own_lap['LapTime'] - rival_lap['LapTime']).total_seconds()
+
+    payload = {
+        'traces': plain(traces),
+        'drivers': [driver, rival],
+        'styles': styles,
+        'title': f"{session['event_name']} {year} Qualifying\n{driver} vs {rival} ({rival_kind}) fastest laps",
+    }
+    description = (
+        f"{driver} driver fastest qualifying lap against {rival} ({rival_kind}) in the {year} {track} Grand Prix: "
+        f"{gap:+.3f}s gap, top speed {top_speeds[driver]:.0f} vs {top_speeds[rival]:.0f} km/h, "
+        f"faster in {wins} of {MINISECTORS} minisectors"
+    )
+    print(description)
+    return submit_graph('qualy_telemetry', year, track, driver, payload, description)
+
+def qualy_telemetry(year, track, driver, load_flags=None): ##Driver name
+    return save_graph(start_qualy_telemetry(year, track, driver, load_flags))
+
+## Compute and store the figures of an event that season reports are built from.
+## Returns them as stored
+def update_event_stats(year, track, driver, driverNum, load_flags=None):
+    tables = {
+        session_type: load_session_tables(year, track, session_type, needs, (load_flags or {}).get(session_type))
+        for session_type, needs in EVENT_STATS_REQUIREMENTS.items()
+    }
+    stats = event_stats(tables['R'], tables['Q'], driverNum)
+    with db_cursor(commit=True) as cursor:
+        event_id = lock_event(cursor, year, track, driver)
+        write_event_stats(cursor, event_id, stats, EVENT_STATS_VERSION)
+    print(f"Event stats stored for {driver} in {year} {track}")
+    return stats
+
+## Build and store the missing graphs of an event. With sessions, e.g. ('Q',) right
+## after qualifying, only the graphs of those sessions are built
+def get_full_analysis(year, track, driverName, driverNumber, sessions=None):
+    ## One query tells which graphs are missing
+    existing = get_event_graph_ids(year, track, driverName)
+    builders = {
+        'race_positions_changes': lambda flags: start_race_positions_changes(year, track, driverName, driverNumber, flags, existing),
+        'race_laps_times': lambda flags: start_race_laps_times(year, track, driverName, flags, existing),
+        'race_laptimes_distribution': lambda flags: start_race_laptimes_distribution(year, track, driverName, driverNumber, flags, existing),
+        'qualy_results': lambda flags: start_qualy_results(year, track, driverName, flags, existing),
+        'race_tyre_degradation': lambda flags: start_race_tyre_degradation(year, track, driverName, flags, existing),
+        'qualy_telemetry': lambda flags: start_qualy_telemetry(year, track, driverName, flags, existing),
+    }
+    if sessions is not None:
+        builders = {name: build for name, build in builders.items() if GRAPH_REQUIREMENTS[name]['session'] in sessions}
+    missing = [name for name in builders if name not in existing[1]]
+    if not missing:
+        print(f"All graphs already exist for {driverName} in {year} {track}")
+        return [{'id': existing[1][name], 'name': name, 'image': None} for name in builders]
+
+    ## Load each session once with the union of what the missing graphs need
+    load_flags = get_session_load_flags(missing)
+    ## Queue every render first so the graphs are drawn in parallel,
+    ## then store all the new rows in one transaction. A graph that can not be
+    ## built is left out so the others are still stored and sent
+    pending = {}
+    errors = []
+    for name in builders:
+        if name not in missing:
+            pending[name] = existing[1][name]
+            continue
+        try:
+            pending[name] = builders[name](load_flags[GRAPH_REQUIREMENTS[name]['session']])
+        except GraphSkipped as e:
+            print(f"Graph ({name}) skipped: {str(e)}")
+        except Exception as e:
+            print(f"Graph ({name}) could not be built for {driverName} in {year} {track}: {str(e)}")
+            errors.append(e)
+    if errors and len(errors) == len(missing): ##Nothing could be built, e.g. a session without data
+        raise errors[0]
+    ## While the graphs render, store the event's row for the season reports. The tables
+    ## are already in memory, and a failure here must not lose the graphs
+    if sessions is None or set(EVENT_STATS_REQUIREMENTS) <= set(sessions):
+        try:
+            update_event_stats(year, track, driverName, driverNumber, load_flags)
+        except Exception as e:
+            print(f"Could not store the event stats of {driverName} in {year} {track}: {str(e)}")
+    graph_ids = save_graphs(list(pending.values()))
+    ## New graphs come back with their image so callers can send them without reading the disk
+    return [
+        {'id': graph_id, 'name': name, 'image': graph.get('image') if isinstance(graph, dict) else None}
+        for (name, graph), graph_id in zip(pending.items(), graph_ids)
+    ]
+
+## Whole seasons are backfilled with: python -m data.backfill --seasons 2025
@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import threading
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+from llm.query_parser import normalize_text
+
+## Bump when the registry files change so older ones are rebuilt instead of read
+REGISTRY_VERSION = 1
+
+## Seconds a season's index is used before checking the schedule for new races
+REFRESH_SECONDS = float(os.getenv('DRIVER_REGISTRY_REFRESH_SECONDS', '3600'))
+
+## Seconds before retrying a race whose results could not be loaded
+RETRY_SECONDS = 600
+
+## Nicknames FastF1 does not know, by driver code
+DRIVER_NICKNAMES = {
+    'PER': ('checo',),
+    'ALO': ('nano', 'el nano'),
+    'ALB': ('alex',),
+    'COL': ('franquito',),
+    'HUL': ('hulk',),
+    'ANT': ('kimi',),
+}
+
+def build_index(drivers):
+    """
+    Hash indexes of the drivers of a season.
+
+    Args:
+        drivers (list): Registry entries
+
+    Returns:
+        dict: With keys names (normalized last name, full name, nickname or,
+            when no one else shares it, first name), codes and numbers, each
+            mapping to the driver's entry
+    """
+    index = {'names': {}, 'codes': {}, 'numbers': {}}
+    first_names = {}
+    for driver in drivers:
+        index['codes'][driver['name']] = driver
+        index['numbers'][driver['number']] = driver
+        aliases = (driver['last_name'], f"{driver['first_name']} {driver['last_name']}") + DRIVER_NICKNAMES.get(driver['name'], ())
+        for alias in aliases:
+            alias = normalize_text(alias)
+            if alias:
+                index['names'][alias] = driver
+        first_names.setdefault(normalize_text(driver['first_name']), []).append(driver)
+    ## First names only identify a driver when no one else shares them
+    for first, matches in first_names.items():
+        if first and len(matches) == 1 and first not in index['names']:
+            index['names'][first] = matches[0]
+    return index
+
+class DriverRegistry:
+    """
+    Drivers of every season: code, number, first and last name and team.
+
+    A season is built from the results of its races, read from FastF1, and
+    kept as a JSON file per season. The file records the rounds already
+    read, so when a race is run only its results are loaded. Each season's
+    aliases are kept in memory as hash indexes (see build_index), so
+    resolving a name is a dictionary lookup.
+
+    Lookups never load results: they use the season as stored and, when it
+    is missing or due a refresh, update it in a background thread (see
+    is_building). refresh updates a season in the caller's thread, for the
+    bot's startup and the command line tools.
+
+    Entries have the shape of the bot's driver info: name is the driver's
+    three letter code and number their race number as a string.
+    """
+    def __init__(self, registry_dir=None):
+        """
+        Args:
+            registry_dir (str): Directory of the season files (default DRIVER_REGISTRY_DIR or data/driver_registry)
+        """
+        self.registry_dir = registry_dir or os.getenv('DRIVER_REGISTRY_DIR', os.path.join(BASE_DIR, 'data', 'driver_registry'))
+        self._indexes = {}
+        self._failed = {}
+        self._building = set()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _path(self, year):
+        return os.path.join(self.registry_dir, f"{int(year)}.json")
+
+    def read(self, year):
+        """Reads a season file, or returns an empty season if it is missing or outdated."""
+        empty = {'version': REGISTRY_VERSION, 'rounds': [], 'drivers': {}}
+        try:
+            with open(self._path(year)) as f:
+                season = json.load(f)
+        except FileNotFoundError:
+            return empty
+        except Exception as e:
+            print(f"Could not read the {year} driver registry, rebuilding: {str(e)}")
+            return empty
+        return season if season.get('version') == REGISTRY_VERSION else empty
+
+    def write(self, year, season):
+        """
+        Writes a season file. Files are replaced atomically, from a temporary
+        file of their own so the bot and the workers can write at once.
+        """
+        os.makedirs(self.registry_dir, exist_ok=True)
+        path = self._path(year)
+        f = tempfile.NamedTemporaryFile('w', dir=self.registry_dir, suffix='.tmp', delete=False)
+        try:
+            with f:
+                json.dump(season, f, indent=2, ensure_ascii=False)
+            os.replace(f.name, path)
+        except BaseException:
+            os.remove(f.name)
+            raise
+
+    def update(self, year):
+        """
+        Adds to a season file the drivers of the races run since it was
+        last updated. Races whose results are not published yet are tried
+        again after RETRY_SECONDS.
+
+        Returns:
+            dict: The season, with rounds read and drivers by code
+        """
+        from data.season_progress import completed_rounds
+        from data.session_provider import load_results
+        season = self.read(year)
+        try:
+            rounds = completed_rounds(year)
+        except Exception as e:
+            print(f"Could not load the {year} schedule, using the stored drivers: {str(e)}")
+            return season
+
+        changed = False
+        for number, track in sorted(rounds.items()):
+            if number in season['rounds']:
+                continue
+            if time.monotonic() - self._failed.get((year, number), -RETRY_SECONDS) < RETRY_SECONDS:
+                continue
+            try:
+                results = load_results(year, track, 'R')
+                if results is None or results.empty:
+                    raise ValueError("no results yet")
+            except Exception as e:
+                print(f"Could not read the drivers of the {year} {track} race: {str(e)}")
+                self._failed[(year, number)] = time.monotonic()
+                continue
+
+            for result in results.itertuples():
+                if not isinstance(result.Abbreviation, str) or not result.Abbreviation:
+                    continue
+                driver = season['drivers'].setdefault(result.Abbreviation, {'rounds': []})
+                driver.update({
+                    'name': result.Abbreviation,
+                    'number': str(result.DriverNumber),
+                    'first_name': str(result.FirstName),
+                    'last_name': str(result.LastName),
+                    'team': str(result.TeamName),
+                })
+                driver['rounds'] = sorted(set(driver['rounds']) | {number})
+            season['rounds'] = sorted(set(season['rounds']) | {number})
+            changed = True
+
+        if changed:
+            self.write(year, season)
+            print(f"Driver registry of {year} updated to {len(season['rounds'])} races, {len(season['drivers'])} drivers")
+        return season
+
+    def index(self, year=None):
+        """
+        Hash indexes of the drivers of a season (see build_index), as stored.
+        A season that is missing or was last updated more than REFRESH_SECONDS
+        ago is updated in the background, so this never waits for FastF1.
+        Without a year, the current season or, before its first race, the
+        previous one.
+        """
+        if year is None:
+            current = datetime.now(timezone.utc).year
+            index = self.index(current)
+            return index if index['codes'] else self.index(current - 1)
+
+        year = int(year)
+        with self._lock:
+            cached = self._indexes.get(year)
+        if cached is None:
+            ## First lookup of the season in this process, the file is read once
+            index = build_index(self.read(year)['drivers'].values())
+            with self._lock:
+                cached = self._indexes.setdefault(year, (index, None))
+        if cached[1] is None or time.monotonic() - cached[1] >= REFRESH_SECONDS:
+            self._refresh_in_background(year)
+        return cached[0]
+
+    def refresh(self, year=None):
+        """
+        Updates a season (see update) and its index in the caller's thread.
+        Without a year, the current season or, before its first race, the
+        previous one.
+
+        Returns:
+            dict: The season's index
+        """
+        if year is None:
+            current = datetime.now(timezone.utc).year
+            index = self.refresh(current)
+            return index if index['codes'] else self.refresh(current - 1)
+
+        year = int(year)
+        ## One update at a time, they write the same files
+        with self._build_lock:
+            index = build_index(self.update(year)['drivers'].values())
+            with self._lock:
+                self._indexes[year] = (index, time.monotonic())
+        return index
+
+    def _refresh_in_background(self, year):
+        with self._lock:
+            if year in self._building:
+                return
+            self._building.add(year)
+
+        def run():
+            try:
+                self.refresh(year)
+            except Exception as e:
+                print(f"Could not update the {year} driver registry: {str(e)}")
+            finally:
+                with self._lock:
+                    self._building.discard(year)
+
+        threading.Thread(target=run, name=f"driver-registry-{year}", daemon=True).start()
+
+    def is_building(self, year=None):
+        """True while a season (by default any) is being updated in the background."""
+        with self._lock:
+            return bool(self._building) if year is None else int(year) in self._building
+
+    def resolve(self, name, year=None):
+        """
+        Finds a driver by name, nickname, code or number, in the season as
+        stored (see index).
+
+        Args:
+            name (str): What the user or the LLM called the driver
+            year (int): Season (default the latest one)
+
+        Returns:
+            dict: The driver's entry, or None if no driver of the season matches
+        """
+        index = self.index(year)
+        text = str(name).strip()
+        return (
+            index['names'].get(normalize_text(text))
+            or index['codes'].get(text.upper())
+            or index['numbers'].get(text.lstrip('#'))
+        )
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+## Shared registry for the whole process
+driver_registry = DriverRegistry()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the driver registry of some seasons")
+    parser.add_argument('seasons', type=int, nargs='+')
+    args = parser.parse_args(argv)
+
+    for year in args.seasons:
+        driver_registry.refresh(year)
+        season = driver_registry.read(year)
+        print(f"{year}: {len(season['rounds'])} races")
+        for driver in sorted(season['drivers'].values(), key=lambda d: (d['team'], d['name'])):
+            print(f"  {driver['name']} #{driver['number']:<3} {driver['first_name']} {driver['last_name']} ({driver['team']}, {len(driver['rounds'])} races)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import threading
+
+## Same threshold as Laps.pick_quicklaps: laps within 107% of the fastest one
+QUICKLAP_THRESHOLD = 1.07
+
+## Columns of session.laps the builders use. IsQuick is only present in laps read from the lap store
+LAP_COLUMNS = ['Driver', 'DriverNumber', 'LapNumber', 'Position', 'LapTime', 'Compound', 'Stint', 'TyreLife', 'Team', 'IsPersonalBest', 'IsQuick']
+
+_lock = threading.Lock()
+
+def compute_lap_stats(laps):
+    """
+    Computes every per-driver lap figure the graph builders need in one
+    grouped pass over the laps, instead of filtering the whole frame again
+    for each driver with pick_drivers.
+
+    Args:
+        laps (DataFrame): Laps of a session (session.laps), or the laps table of the lap store
+
+    Returns:
+        dict: With keys
+            laps: The used columns, plus LapTime(s) in seconds
+            quick: Mask of each driver's quick laps (pick_drivers(drv).pick_quicklaps())
+            best_seconds: Fastest lap time in seconds per driver number
+            abbreviations: Driver abbreviation per driver number
+            start_position, finish_position: Position on the first and last lap per driver number
+            fastest_laps: Fastest personal best lap of each driver (pick_fastest), sorted
+                by LapTime, with LapTimeDelta to the fastest of them
+    """
+    import numpy as np
+    import pandas as pd
+    laps = pd.DataFrame(laps[[c for c in LAP_COLUMNS if c in laps.columns]]).reset_index(drop=True)
+    laps['LapTime(s)'] = laps['LapTime'].dt.total_seconds()
+    by_driver = laps.groupby('DriverNumber', sort=False, observed=True)
+
+    if 'IsQuick' in laps.columns:
+        quick = laps['IsQuick'].to_numpy(dtype=bool)
+    else:
+        seconds = laps['LapTime(s)'].to_numpy()
+        driver_best = by_driver['LapTime(s)'].transform('min').to_numpy()
+        with np.errstate(invalid='ignore'):
+            quick = seconds < driver_best * QUICKLAP_THRESHOLD
+
+    first_laps = by_driver.head(1).set_index('DriverNumber')
+    last_laps = by_driver.tail(1).set_index('DriverNumber')
+
+    personal_bests = laps[(laps['IsPersonalBest'] == True) & laps['LapTime'].notna()] # noqa: E712
+    fastest_laps = laps.loc[personal_bests.groupby('DriverNumber', sort=False, observed=True)['LapTime'].idxmin()]
+    fastest_laps = fastest_laps.sort_values(by='LapTime', kind='stable').reset_index(drop=True)
+    if not fastest_laps.empty:
+        fastest_laps['LapTimeDelta'] = fastest_laps['LapTime'] - fastest_laps['LapTime'].iloc[0]
+
+    return {
+        'laps': laps,
+        'quick': pd.Series(quick, index=laps.index),
+        'best_seconds': by_driver['LapTime(s)'].min(),
+        'abbreviations': first_laps['Driver'],
+        'start_position': first_laps['Position'],
+        'finish_position': last_laps['Position'],
+        'fastest_laps': fastest_laps,
+    }
+
+def get_lap_stats(session):
+    """
+    Returns the lap stats of a loaded session, computing them the first time.
+    They are kept on the session, so every builder working on a session
+    shared by the session provider reuses them.
+    """
+    with _lock:
+        cached = getattr(session, '_f1bot_lap_stats', None)
+        if cached is not None and cached[0] is session.laps:
+            return cached[1]
+    stats = compute_lap_stats(session.laps)
+    with _lock:
+        session._f1bot_lap_stats = (session.laps, stats)
+    return stats
+
+def quick_laps_of(stats, driver_numbers):
+    """
+    Quick laps of several drivers together, with the threshold taken from the
+    fastest of them, like pick_drivers(driver_numbers).pick_quicklaps().
+    """
+    laps = stats['laps']
+    selected = laps['DriverNumber'].isin(driver_numbers)
+    best = stats['best_seconds'].reindex(driver_numbers).min()
+    return laps[selected & (laps['LapTime(s)'] < best * QUICKLAP_THRESHOLD)]
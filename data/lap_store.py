@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import uuid
+import argparse
+import threading
+from collections import OrderedDict
+from data.lap_stats import get_lap_stats, compute_lap_stats
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Bump when the tables change so older files are rebuilt instead of read
+STORE_VERSION = 3
+
+## Key of the event metadata in the Parquet schema of the laps table
+METADATA_KEY = b'f1bot'
+
+## Bump when the reduced telemetry traces change
+TRACE_VERSION = 1
+
+## Columns of the drivers table: session results plus the plotting styles
+DRIVER_COLUMNS = ['DriverNumber', 'Abbreviation', 'TeamName', 'Color', 'LineStyle', 'TeamColor',
+                  'GridPosition', 'Position', 'Points', 'Status']
+
+## Columns stored as categories; lap times are stored as float32 seconds
+CATEGORY_COLUMNS = ('Driver', 'DriverNumber', 'Team', 'Compound')
+
+def write_parquet(table, path):
+    """
+    Writes a Parquet file atomically. The temporary file has a unique name in
+    the same directory, so processes writing the same session at once never
+    share it; the last one to finish replaces the file.
+    """
+    import pyarrow.parquet as pq
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class LapStore:
+    """
+    Keeps the slim per-session tables the graph builders use as Parquet
+    files, so re-renders and new graph types never need the FastF1 session
+    again once an event has been processed.
+
+    Each session has a laps table (driver, lap number, position, lap time,
+    compound, stint, tyre life, personal best and quick-lap flags), a drivers table with the
+    results and plotting colors, and for qualifying the fastest lap of every driver.
+    Drivers, teams and compounds are categorical and times are float32
+    seconds, so an event takes tens of KB instead of the hundreds of MB of
+    a loaded session. Files are memory-mapped when read and the tables of
+    recently used sessions are kept in a small LRU.
+
+    The reduced telemetry of single laps (see data/telemetry.py) is stored
+    next to the tables, one file per lap, so telemetry is only loaded the
+    first time a lap is drawn.
+    """
+    def __init__(self, store_dir=None, max_sessions=None):
+        """
+        Args:
+            store_dir (str): Store directory (default LAP_STORE_DIR or data/lap_store)
+            max_sessions (int): Sessions whose tables are kept in memory
+                (default LAP_STORE_CACHE_SIZE env variable or 32)
+        """
+        self.store_dir = store_dir or os.getenv('LAP_STORE_DIR', os.path.join(BASE_DIR, 'data', 'lap_store'))
+        if max_sessions is None:
+            max_sessions = int(os.getenv('LAP_STORE_CACHE_SIZE', '32'))
+        self.max_sessions = max(1, max_sessions)
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(year, track, session_type):
+        return (int(year), str(track).strip().lower(), str(session_type).strip().upper())
+
+    def session_dir(self, key):
+        year, track, session_type = key
+        return os.path.join(self.store_dir, str(year), track.replace(' ', '_'), session_type)
+
+    def _path(self, key, table):
+        return os.path.join(self.session_dir(key), f"{table}.parquet")
+
+    def get(self, year, track, session_type, load_session):
+        """
+        Returns the tables of a session, from memory, from disk or, when the
+        session was never processed, built from load_session() and stored if
+        they are complete (see incomplete_tables).
+
+        Args:
+            year (int): Season
+            track (str): Event name or location
+            session_type (str): FastF1 session identifier ('R', 'Q', ...)
+            load_session: Function returning the loaded FastF1 session, only
+                called if the session is not in the store
+
+        Returns:
+            dict: Tables (see build_tables) plus 'stats', their compute_lap_stats output
+        """
+        key = self.make_key(year, track, session_type)
+        with self._lock:
+            tables = self._tables.get(key)
+            if tables is not None:
+                self._tables.move_to_end(key)
+                return tables
+
+        tables = self.read(key)
+        if tables is None:
+            print(f"Lap store miss for {key}, building tables from the session...")
+            tables = build_tables(load_session())
+            incomplete = incomplete_tables(tables)
+            if incomplete:
+                ## Served once but neither stored nor kept loaded, so the next request builds them again
+                from data.session_provider import session_provider
+                print(f"Session {key} has incomplete {', '.join(incomplete)}, not storing its tables")
+                session_provider.discard(year, track, session_type)
+                tables['stats'] = compute_lap_stats(tables['laps'])
+                return tables
+            self.write(key, tables)
+            ## Serve what was stored, so both paths give the same dtypes
+            tables = self.read(key) or tables
+        tables['stats'] = compute_lap_stats(tables['laps'])
+
+        with self._lock:
+            self._tables[key] = tables
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_sessions:
+                self._tables.popitem(last=False)
+        return tables
+
+    def read(self, key):
+        """Reads the tables of a session, or returns None if they are missing or outdated."""
+        import pandas as pd
+        import pyarrow.parquet as pq
+        laps_path = self._path(key, 'laps')
+        if not os.path.exists(laps_path):
+            return None
+        try:
+            laps_table = pq.read_table(laps_path, memory_map=True)
+            metadata = json.loads((laps_table.schema.metadata or {}).get(METADATA_KEY, b'{}'))
+            if metadata.get('version') != STORE_VERSION:
+                return None
+            tables = {
+                'laps': laps_table.to_pandas(),
+                'drivers': pq.read_table(self._path(key, 'drivers'), memory_map=True).to_pandas(),
+                'event_name': metadata['event_name'],
+                'round': metadata['round'],
+                'compound_palette': metadata['compound_palette'],
+            }
+            fastest_path = self._path(key, 'fastest_laps')
+            if os.path.exists(fastest_path):
+                tables['fastest_laps'] = pq.read_table(fastest_path, memory_map=True).to_pandas()
+        except Exception as e:
+            print(f"Could not read {laps_path} from the lap store, rebuilding: {str(e)}")
+            return None
+
+        for name, columns in (('laps', ('LapTime',)), ('fastest_laps', ('LapTime', 'LapTimeDelta'))):
+            for column in columns:
+                if name in tables:
+                    tables[name][column] = pd.to_timedelta(tables[name][column].astype('float64'), unit='s')
+        return tables
+
+    def write(self, key, tables):
+        """Writes the tables of a session. Files are replaced atomically."""
+        import pyarrow as pa
+        os.makedirs(self.session_dir(key), exist_ok=True)
+        metadata = {
+            'version': STORE_VERSION,
+            'event_name': tables['event_name'],
+            'round': tables['round'],
+            'compound_palette': tables['compound_palette'],
+        }
+        frames = {'laps': compact(tables['laps']), 'drivers': tables['drivers']}
+        if 'fastest_laps' in tables:
+            frames['fastest_laps'] = compact(tables['fastest_laps'])
+        ## The laps table goes last, it marks the session as stored
+        for name in ('drivers', 'fastest_laps', 'laps'):
+            if name not in frames:
+                continue
+            table = pa.Table.from_pandas(frames[name], preserve_index=False)
+            if name == 'laps':
+                table = table.replace_schema_metadata({
+                    **(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata).encode()
+                })
+            write_parquet(table, self._path(key, name))
+
+    def _trace_path(self, key, driver_number, lap_number):
+        return os.path.join(self.session_dir(key), 'telemetry', f"{driver_number}_{float(lap_number):g}.parquet")
+
+    def get_lap_traces(self, year, track, session_type, laps, load_session):
+        """
+        Returns the reduced telemetry of some laps, from disk or, for laps
+        never drawn, reduced from load_session() and stored.
+
+        Args:
+            year (int): Season
+            track (str): Event name or location
+            session_type (str): FastF1 session identifier ('R', 'Q', ...)
+            laps (list): (driver number, lap number) of each lap
+            load_session: Function returning the session loaded with telemetry,
+                only called if some lap is not in the store
+
+        Returns:
+            list: reduce_lap output of each lap, in order
+        """
+        import pyarrow as pa
+        key = self.make_key(year, track, session_type)
+        traces = [self.read_trace(key, number, lap) for number, lap in laps]
+        missing = [i for i, trace in enumerate(traces) if trace is None]
+        if not missing:
+            return traces
+
+        from data.telemetry import lap_trace
+        print(f"Lap store has no telemetry of {len(missing)} laps of {key}, loading it...")
+        session = load_session()
+        for i in missing:
+            number, lap = laps[i]
+            traces[i] = lap_trace(session, number, lap)
+            path = self._trace_path(key, number, lap)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            table = pa.Table.from_pandas(traces[i], preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}), METADATA_KEY: json.dumps({'version': TRACE_VERSION}).encode()
+            })
+            write_parquet(table, path)
+        return traces
+
+    def read_trace(self, key, driver_number, lap_number):
+        """Reads the reduced telemetry of a lap, or returns None if it is missing or outdated."""
+        import pyarrow.parquet as pq
+        path = self._trace_path(key, driver_number, lap_number)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pq.read_table(path, memory_map=True)
+            metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b'{}'))
+            if metadata.get('version') != TRACE_VERSION:
+                return None
+            return table.to_pandas()
+        except Exception as e:
+            print(f"Could not read {path} from the lap store, rebuilding: {str(e)}")
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+def compact(frame):
+    """Categorical driver, team and compound columns and float32 times in seconds."""
+    frame = frame.copy()
+    for column in frame.columns:
+        if column in CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        elif str(frame[column].dtype).startswith('timedelta'):
+            frame[column] = frame[column].dt.total_seconds().astype('float32')
+        elif column in ('Position', 'LapNumber', 'Stint', 'TyreLife'):
+            frame[column] = frame[column].astype('float32')
+    return frame
+
+def build_tables(session):
+    """
+    Builds the tables of a loaded session: everything the graph builders
+    read from it, including the plotting colors FastF1 derives from it.
+
+    Returns:
+        dict: laps, drivers (in results order), fastest_laps (qualifying
+            only), event_name, round and compound_palette
+    """
+    import pandas as pd
+    import fastf1.plotting
+    stats = get_lap_stats(session)
+    laps = stats['laps'].drop(columns=['LapTime(s)']).assign(IsQuick=stats['quick'].to_numpy())
+
+    drivers = []
+    for number in session.drivers:
+        result = session.get_driver(number)
+        abbreviation = stats['abbreviations'].get(number, result['Abbreviation'])
+        color = line_style = team_color = None
+        if number in stats['abbreviations']: ##FastF1 only styles drivers with laps
+            style = fastf1.plotting.get_driver_style(identifier=abbreviation, style=['color', 'linestyle'], session=session)
+            color, line_style = style['color'], style['linestyle']
+            team_color = fastf1.plotting.get_team_color(result['TeamName'], session=session)
+        drivers.append({
+            'DriverNumber': number,
+            'Abbreviation': abbreviation,
+            'TeamName': result['TeamName'],
+            'Color': color,
+            'LineStyle': line_style,
+            'TeamColor': team_color,
+            'GridPosition': result['GridPosition'],
+            'Position': result['Position'],
+            'Points': result['Points'],
+            'Status': result['Status'],
+        })
+
+    tables = {
+        'laps': laps,
+        'drivers': pd.DataFrame(drivers, columns=DRIVER_COLUMNS).astype(
+            {'GridPosition': 'float32', 'Position': 'float32', 'Points': 'float32'}
+        ),
+        'event_name': str(session.event['EventName']),
+        'round': int(session.event['RoundNumber']),
+        'compound_palette': fastf1.plotting.get_compound_mapping(session=session),
+    }
+    if session.name == 'Qualifying':
+        tables['fastest_laps'] = stats['fastest_laps']
+    return tables
+
+def incomplete_tables(tables):
+    """
+    Names of the tables of a session that are empty or partial, as when the
+    session is loaded before FastF1 has its laps or results. Such tables are
+    not stored, since a stored session is never built again.
+    """
+    incomplete = [name for name in ('laps', 'drivers', 'fastest_laps') if name in tables and tables[name].empty]
+    drivers = tables['drivers']
+    if not drivers.empty and (
+        drivers['Position'].isna().all()
+        or not set(tables['laps']['DriverNumber']) <= set(drivers['DriverNumber'])
+    ):
+        incomplete.append('results')
+    return incomplete
+
+## Shared store for the whole process
+lap_store = LapStore()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the lap store")
+    parser.add_argument('year', type=int)
+    parser.add_argument('track')
+    parser.add_argument('session', nargs='?', default='R')
+    args = parser.parse_args(argv)
+
+    tables = lap_store.read(lap_store.make_key(args.year, args.track, args.session))
+    if tables is None:
+        print("Session not in the lap store")
+        return 1
+    for name in ('laps', 'drivers', 'fastest_laps'):
+        if name in tables:
+            frame = tables[name]
+            print(f"{name}: {len(frame)} rows, {frame.memory_usage(deep=True).sum() / 1024:.1f} KB in memory")
+    print(tables['laps'].head())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+import io
+import os
+import tempfile
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from metrics.metrics import span, collect_spans
+
+## Graph rendering runs in worker processes with the Agg backend. Workers only
+## receive the compact DataFrames and styles a graph needs, never a Session,
+## so pyplot's global state is never shared between threads or requests.
+## Figures are rendered into in-memory buffers; disk copies are only written
+## in the background for archival.
+
+_render_pool = None
+_archive_pool = None
+
+## Output profiles. Telegram recompresses photos, so optimized PNG or JPEG keep
+## uploads small without visible loss
+RENDER_PROFILES = {
+    'png': {'format': 'png', 'extension': 'png', 'pil_kwargs': {'optimize': True}},
+    'jpeg': {'format': 'jpeg', 'extension': 'jpg', 'pil_kwargs': {'optimize': True, 'progressive': True}},
+    'webp': {'format': 'webp', 'extension': 'webp', 'pil_kwargs': {'method': 6}},
+}
+
+def get_render_profile():
+    """
+    Returns the output profile from RENDER_FORMAT (png, jpeg or webp),
+    RENDER_DPI and RENDER_QUALITY (jpeg and webp only).
+    """
+    name = os.getenv('RENDER_FORMAT', 'png').lower()
+    if name == 'jpg':
+        name = 'jpeg'
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown RENDER_FORMAT '{name}', use one of {sorted(RENDER_PROFILES)}")
+    profile = dict(RENDER_PROFILES[name])
+    profile['pil_kwargs'] = dict(profile['pil_kwargs'])
+    if name != 'png':
+        profile['pil_kwargs']['quality'] = int(os.getenv('RENDER_QUALITY', '85'))
+    profile['dpi'] = float(os.getenv('RENDER_DPI', '100'))
+    return profile
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+    import fastf1.plotting
+    fastf1.plotting.setup_mpl(mpl_timedelta_support=True, misc_mpl_mods=False, color_scheme='fastf1') ##Dark mode
+
+def _save(fig):
+    from matplotlib import pyplot as plt
+    profile = get_render_profile()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=profile['format'], dpi=profile['dpi'], pil_kwargs=profile['pil_kwargs'])
+    plt.close(fig)
+    return buffer.getvalue()
+
+def render_race_positions_changes(laps, styles):
+    """
+    Args:
+        laps (DataFrame): Driver, LapNumber and Position of every lap
+        styles (list): (abbreviation, style dict) per driver, in plotting order
+    """
+    from matplotlib import pyplot as plt
+    fig, ax = plt.subplots(figsize=(8.0, 4.9))
+
+    laps_by_driver = dict(tuple(laps.groupby('Driver', sort=False, observed=True)))
+    for abb, style in styles:
+        drv_laps = laps_by_driver.get(abb, laps.iloc[:0])
+        ax.plot(drv_laps['LapNumber'], drv_laps['Position'], label=abb, **style)
+
+    ax.set_ylim([20.5, 0.5])
+    ax.set_yticks([1, 5, 10, 15, 20])
+    ax.set_xlabel('Lap')
+    ax.set_ylabel('Position')
+    ax.legend(bbox_to_anchor=(1.0, 1.02))
+    return _save(fig)
+
+def render_race_laps_times(laps, compound_palette, title):
+    """
+    Args:
+        laps (DataFrame): LapNumber, LapTime and Compound of the driver's quick laps
+        compound_palette (dict): Compound name to color
+        title (str): Figure title
+    """
+    import numpy as np
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+    from pandas import to_timedelta
+    fig, ax = plt.subplots(figsize=(8, 8))
+
+    # Scatterplot of lap times
+    sns.scatterplot(
+        data=laps,
+        x="LapNumber",
+        y="LapTime",
+        ax=ax,
+        hue="Compound",
+        palette=compound_palette,
+        s=80,
+        linewidth=0,
+        legend='auto'
+    )
+    ax.set_xlabel("Lap Number")
+    ax.set_ylabel("Lap Time")
+
+    # Add trend line
+    lap_numbers = laps["LapNumber"].values
+    lap_times_sec = laps["LapTime"].dt.total_seconds().values
+
+    # Only fit if there are enough laps
+    if len(lap_numbers) > 20:
+        # Fit a 1st degree polynomial (linear trend)
+        z = np.polyfit(lap_numbers, lap_times_sec, 1)
+        p = np.poly1d(z)
+        trend_lap_times_sec = p(lap_numbers)
+        # Convert back to timedelta for plotting
+        trend_lap_times = to_timedelta(trend_lap_times_sec, unit='s')
+        ax.plot(
+            lap_numbers,
+            trend_lap_times,
+            color='white',
+            linestyle='--',
+            linewidth=2,
+        )
+
+    # The y-axis increases from bottom to top by default
+    # Since we are plotting time, it makes sense to invert the axis
+    ax.invert_yaxis()
+    fig.suptitle(title)
+
+    ax.grid(color='w', which='major', axis='both')
+    sns.despine(left=True, bottom=True)
+    return _save(fig)
+
+def render_race_laptimes_distribution(laps, finishing_order, driver_palette, compound_palette, title):
+    """
+    Args:
+        laps (DataFrame): Driver, LapTime(s) and Compound of the quick laps
+        finishing_order (list): Driver abbreviations in finishing order
+        driver_palette (dict): Driver abbreviation to color
+        compound_palette (dict): Compound name to color
+        title (str): Figure title
+    """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+    fig, ax = plt.subplots(figsize=(10, 5))
+
+    sns.violinplot(data=laps,
+                x="Driver",
+                y="LapTime(s)",
+                hue="Driver",
+                inner=None,
+                density_norm="area",
+                order=finishing_order,
+                palette=driver_palette,
+                ax=ax
+                )
+
+    sns.swarmplot(data=laps,
+                x="Driver",
+                y="LapTime(s)",
+                order=finishing_order,
+                hue="Compound",
+                palette=compound_palette,
+                hue_order=["SOFT", "MEDIUM", "HARD"],
+                linewidth=0,
+                size=4,
+                ax=ax
+                )
+
+    ax.set_xlabel("Driver")
+    ax.set_ylabel("Lap Time (s)")
+    fig.suptitle(title)
+    sns.despine(left=True, bottom=True)
+    return _save(fig)
+
+def render_qualy_results(fastest_laps, driver, driver_color, team_colors, title):
+    """
+    Args:
+        fastest_laps (DataFrame): Driver and LapTimeDelta of each fastest lap, sorted by lap time
+        driver (str): Abbreviation of the highlighted driver
+        driver_color (str): Color of the highlighted driver
+        team_colors (list): Team colors of the other drivers, in order
+        title (str): Figure title
+    """
+    from matplotlib import pyplot as plt
+    fig, ax = plt.subplots()
+    for index, lap in fastest_laps.iterrows():
+        if lap['Driver'] == driver:
+            ax.barh(index, lap['LapTimeDelta'], color=driver_color, edgecolor='black', hatch='//', zorder=3)
+
+    ax.barh(fastest_laps.index, fastest_laps['LapTimeDelta'],
+            color=team_colors, edgecolor='grey')
+    ax.set_yticks(fastest_laps.index)
+    ax.set_yticklabels(fastest_laps['Driver'])
+    ax.invert_yaxis()
+
+    ax.set_axisbelow(True)
+    ax.xaxis.grid(True, which='major', linestyle='--', color='black', zorder=-1000)
+
+    fig.suptitle(title)
+    return _save(fig)
+
+def render_race_tyre_degradation(stints, driver, compound_palette, title):
+    """
+    Args:
+        stints (DataFrame): Driver, Stint, Compound and Slope of every fitted stint, sorted by Slope
+        driver (str): Abbreviation of the highlighted driver
+        compound_palette (dict): Compound name to color
+        title (str): Figure title
+    """
+    from matplotlib import pyplot as plt
+    from matplotlib.patches import Patch
+    fig, ax = plt.subplots(figsize=(8, max(4.0, 0.25 * len(stints) + 1.5)))
+
+    positions = list(range(len(stints)))
+    colors = [compound_palette.get(compound, 'grey') for compound in stints['Compound']]
+    ax.barh(positions, stints['Slope'], color=colors, edgecolor='grey', zorder=3)
+    for position, slope, name in zip(positions, stints['Slope'], stints['Driver']):
+        if name == driver:
+            ax.barh(position, slope, color='none', edgecolor='black', hatch='//', zorder=4)
+
+    ax.set_yticks(positions)
+    ax.set_yticklabels([f"{name} S{int(stint)}" for name, stint in zip(stints['Driver'], stints['Stint'])])
+    ax.invert_yaxis()
+    ax.axvline(0, color='grey', linewidth=1)
+    ax.set_xlabel("Degradation (s/lap, fuel corrected)")
+    ax.legend(handles=[
+        Patch(color=compound_palette.get(compound, 'grey'), label=compound)
+        for compound in dict.fromkeys(stints['Compound'])
+    ], loc='upper right') ##Sorted by slope, the top right is always free
+
+    ax.set_axisbelow(True)
+    ax.xaxis.grid(True, which='major', linestyle='--', color='black', zorder=-1000)
+    fig.suptitle(title)
+    return _save(fig)
+
+def render_qualy_telemetry(traces, drivers, styles, title):
+    """
+    Args:
+        traces (DataFrame): Driver, Channel, Distance and Value of the reduced
+            telemetry of both laps (see data/telemetry.py)
+        drivers (list): Abbreviations of the highlighted driver and the one compared
+        styles (dict): Driver abbreviation to line style dict
+        title (str): Figure title
+    """
+    import numpy as np
+    from matplotlib import pyplot as plt
+    from matplotlib.collections import LineCollection
+    from data.telemetry import TRACE_CHANNELS, minisector_winners
+    fig = plt.figure(figsize=(12, 8))
+    grid = fig.add_gridspec(len(TRACE_CHANNELS), 2, width_ratios=[2.2, 1], height_ratios=[3, 1.5, 1, 1.5])
+
+    labels = {'Speed': 'Speed (km/h)', 'Throttle': 'Throttle (%)', 'Brake': 'Brake', 'nGear': 'Gear'}
+    channels = dict(tuple(traces.groupby(['Driver', 'Channel'], sort=False, observed=True)))
+    axes = []
+    for row, channel in enumerate(TRACE_CHANNELS):
+        ax = fig.add_subplot(grid[row, 0], sharex=axes[0] if axes else None)
+        for driver in drivers:
+            trace = channels.get((driver, channel))
+            if trace is not None:
+                ax.plot(trace['Distance'], trace['Value'], label=driver, **styles[driver])
+        ax.set_ylabel(labels[channel])
+        if row < len(TRACE_CHANNELS) - 1:
+            ax.tick_params(labelbottom=False)
+        axes.append(ax)
+    axes[0].legend(loc='lower right')
+    axes[-1].set_xlabel('Distance (m)')
+
+    ## Track map of the first driver's lap, each minisector in the color of the faster driver
+    ax = fig.add_subplot(grid[:, 1])
+    winners = minisector_winners(traces, drivers)
+    x = channels[(drivers[0], 'X')].sort_values('Distance')
+    y = channels[(drivers[0], 'Y')].sort_values('Distance')['Value'].to_numpy()
+    distance = x['Distance'].to_numpy()
+    x = x['Value'].to_numpy()
+    points = np.array([x, y]).T.reshape(-1, 1, 2)
+    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    fraction = (distance[:-1] - distance[0]) / max(distance[-1] - distance[0], 1e-9)
+    sector = np.minimum((fraction * len(winners)).astype(int), len(winners) - 1)
+    colors = [styles[drivers[winners[s]]]['color'] for s in sector]
+    ax.add_collection(LineCollection(segments, colors=colors, linewidth=5))
+    ax.axis('equal')
+    ax.axis('off')
+    faster = np.bincount(winners, minlength=2)
+    ax.set_title(f"Fastest minisectors\n{drivers[0]} {faster[0]} - {faster[1]} {drivers[1]}", fontsize='medium')
+
+    fig.suptitle(title)
+    return _save(fig)
+
+def render_season_progress(events, driver, teammates, title):
+    """
+    Args:
+        events (list): Per event, by round: event_name, grid_position, finish_position,
+            teammate_finish_position, pole_gap_pct and pace_percentile (see data/season_progress.py)
+        driver (str): Driver abbreviation
+        teammates (list): Abbreviations of the driver's teammates over the season
+        title (str): Figure title
+    """
+    import numpy as np
+    from matplotlib import pyplot as plt
+    fig, (positions, pace) = plt.subplots(2, 1, figsize=(max(8.0, 0.45 * len(events) + 3), 7), sharex=True,
+                                          gridspec_kw={'height_ratios': [3, 2]})
+
+    def column(name):
+        return np.array([np.nan if e[name] is None else e[name] for e in events], dtype=float)
+
+    rounds = np.arange(len(events))
+    positions.plot(rounds, column('teammate_finish_position'), color='grey', linestyle='--', marker='.',
+                   label=f"Teammate ({', '.join(teammates)})" if teammates else 'Teammate')
+    positions.plot(rounds, column('grid_position'), color='white', linestyle='none', marker='o',
+                   markerfacecolor='none', label='Grid')
+    positions.plot(rounds, column('finish_position'), color='tab:blue', marker='o', label=f"{driver} finish")
+    positions.set_ylim([20.5, 0.5])
+    positions.set_yticks([1, 5, 10, 15, 20])
+    positions.set_ylabel('Position')
+    positions.legend(loc='lower left', fontsize='small')
+
+    pace.bar(rounds, column('pole_gap_pct'), color='tab:orange', label='Quali gap to pole (%)')
+    pace.set_ylabel('Gap to pole (%)')
+    percentile = pace.twinx()
+    percentile.plot(rounds, column('pace_percentile'), color='tab:green', marker='o', label='Race pace percentile')
+    percentile.set_ylim([-5, 105])
+    percentile.set_ylabel('Pace percentile')
+    pace.legend(handles=pace.get_legend_handles_labels()[0] + percentile.get_legend_handles_labels()[0],
+                loc='upper left', fontsize='small')
+
+    pace.set_xticks(rounds)
+    pace.set_xticklabels([e['event_name'].replace(' Grand Prix', '') for e in events], rotation=45, ha='right')
+    fig.suptitle(title)
+    fig.tight_layout()
+    return _save(fig)
+
+RENDERERS = {
+    'race_positions_changes': render_race_positions_changes,
+    'race_laps_times': render_race_laps_times,
+    'race_laptimes_distribution': render_race_laptimes_distribution,
+    'qualy_results': render_qualy_results,
+    'race_tyre_degradation': render_race_tyre_degradation,
+    'qualy_telemetry': render_qualy_telemetry,
+    'season_progress': render_season_progress,
+}
+
+def render_graph(name, payload):
+    with span('render', graph=name):
+        return RENDERERS[name](**payload)
+
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        workers = int(os.getenv('RENDER_WORKERS', str(min(4, os.cpu_count() or 1))))
+        _render_pool = ProcessPoolExecutor(
+            max_workers=max(1, workers),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        ## Analysis workers are themselves pool processes, which exit without running the
+        ## atexit hooks that stop child pools. Finalizers run before the children are joined,
+        ## and this one must run before the pool's queues close theirs (priority 10)
+        multiprocessing.util.Finalize(None, shutdown_render_pool, exitpriority=100)
+    return _render_pool
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=True, cancel_futures=True)
+        _render_pool = None
+
+def submit_render(name, payload):
+    """
+    Queues a graph to be rendered in the render pool.
+
+    Args:
+        name (str): Graph name, a key of RENDERERS
+        payload (dict): Keyword arguments of the renderer
+
+    Returns:
+        concurrent.futures.Future: Resolves to (encoded image bytes, spans of the render)
+    """
+    return get_render_pool().submit(collect_spans, render_graph, name, payload)
+
+def _write_image(image, filepath):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    ## A temporary file of its own, so two processes archiving the same graph never share it
+    f = tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(filepath), suffix='.tmp', delete=False)
+    try:
+        with f:
+            f.write(image)
+        os.replace(f.name, filepath) ##Readers never see a half written file
+    except BaseException:
+        os.remove(f.name)
+        raise
+    return filepath
+
+def _report_archive_error(future, filepath):
+    if future.exception() is not None:
+        print(f"Could not archive {filepath}: {str(future.exception())}")
+
+def archive_image(image, filepath):
+    """
+    Writes a rendered image to disk in a background thread.
+
+    Returns:
+        concurrent.futures.Future: Resolves to filepath once written
+    """
+    global _archive_pool
+    if _archive_pool is None:
+        _archive_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='archive')
+    future = _archive_pool.submit(_write_image, image, filepath)
+    future.add_done_callback(lambda f: _report_archive_error(f, filepath))
+    return future
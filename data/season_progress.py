@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import argparse
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+from db.eventStatsHandler import EVENT_STATS_COLUMNS, get_season_stats
+
+## Bump when the figures of event_stats change so stored rows are computed again
+EVENT_STATS_VERSION = 1
+
+## Seconds a season schedule is reused before asking FastF1 for it again
+SCHEDULE_SECONDS = float(os.getenv('SEASON_SCHEDULE_SECONDS', '3600'))
+
+## Latest events compared with the whole season to tell the trend
+RECENT_EVENTS = int(os.getenv('SEASON_RECENT_EVENTS', '3'))
+
+## Status of the row stored for an event the driver did not take part in, so
+## the event is not computed again on every report
+NOT_PARTICIPATED = 'Did not participate'
+
+_schedules = {}
+_schedules_lock = threading.Lock()
+
+## A season is answered from one small row per event, stored when the event is
+## analyzed (see update_event_stats in data/driver_analysis.py). A report only
+## reads the stored rows; the events missing from it are computed afterwards,
+## in the background (fill_event_stats) or by the backfill
+
+def _number(value, cast=float):
+    if value is None or value != value: ##None or NaN
+        return None
+    return cast(value)
+
+def event_stats(race, qualifying, driver_number):
+    """
+    Figures of one event of a driver, from the lap store tables of its race
+    and qualifying.
+
+    Args:
+        race (dict): Lap store tables of the race
+        qualifying (dict): Lap store tables of the qualifying
+        driver_number (str): Driver number
+
+    Returns:
+        dict: With the EVENT_STATS_COLUMNS of db/eventStatsHandler.py. Gaps are
+            in seconds, positive when the driver is slower; pace_percentile is
+            the share of the other drivers with a slower median race lap (100
+            is the fastest). Figures that do not apply (no teammate, no timed
+            lap) are None. If the driver is not in the results, only round,
+            event_name and status NOT_PARTICIPATED are set
+
+    Raises:
+        ValueError: If the race has no results yet
+    """
+    drivers = race['drivers'].set_index('DriverNumber')
+    if drivers.empty:
+        raise ValueError(f"The {race['event_name']} has no results yet")
+    if driver_number not in drivers.index:
+        stats = dict.fromkeys(EVENT_STATS_COLUMNS)
+        stats.update(round=race['round'], event_name=race['event_name'], status=NOT_PARTICIPATED)
+        return stats
+    own = drivers.loc[driver_number]
+    teammates = drivers[(drivers['TeamName'] == own['TeamName']) & (drivers.index != driver_number)]
+    teammate = teammates.index[0] if not teammates.empty else None
+
+    grid = _number(own['GridPosition'], int)
+    if grid == 0: ##Pit lane start
+        grid = len(drivers)
+    stats = {
+        'round': race['round'],
+        'event_name': race['event_name'],
+        'grid_position': grid,
+        'finish_position': _number(own['Position'], int),
+        'status': own['Status'] if isinstance(own['Status'], str) else None,
+        'points': _number(own['Points']),
+        'teammate': str(drivers.at[teammate, 'Abbreviation']) if teammate is not None else None,
+        'teammate_finish_position': _number(drivers.at[teammate, 'Position'], int) if teammate is not None else None,
+        'teammate_quali_gap': None,
+        'teammate_pace_gap': None,
+        'pole_gap': None,
+        'pole_gap_pct': None,
+        'pace_percentile': None,
+    }
+
+    ## Race pace is the median of each driver's quick laps, without the first lap
+    laps = race['stats']['laps']
+    selected = race['stats']['quick'].to_numpy(dtype=bool) & (laps['LapNumber'] > 1).to_numpy()
+    pace = laps[selected].groupby('DriverNumber', observed=True)['LapTime(s)'].median().dropna()
+    if driver_number in pace.index:
+        if len(pace) > 1:
+            stats['pace_percentile'] = round(100 * float((pace > pace[driver_number]).sum()) / (len(pace) - 1), 1)
+        if teammate in pace.index:
+            stats['teammate_pace_gap'] = round(float(pace[driver_number] - pace[teammate]), 3)
+
+    fastest = qualifying['fastest_laps'].set_index('DriverNumber')['LapTime']
+    if driver_number in fastest.index:
+        pole = fastest.min().total_seconds()
+        own_lap = fastest[driver_number].total_seconds()
+        stats['pole_gap'] = round(own_lap - pole, 3)
+        stats['pole_gap_pct'] = round(100 * (own_lap - pole) / pole, 3)
+        if teammate in fastest.index:
+            stats['teammate_quali_gap'] = round(own_lap - fastest[teammate].total_seconds(), 3)
+    if stats['grid_position'] is None: ##Sessions without grid positions in the results
+        positions = qualifying['drivers'].set_index('DriverNumber')['Position']
+        stats['grid_position'] = _number(positions.get(driver_number), int)
+    return stats
+
+def completed_rounds(year):
+    """
+    Location of every event of a season whose race has been run, by round.
+    Schedules are kept for SCHEDULE_SECONDS.
+    """
+    from datetime import datetime, timezone
+    with _schedules_lock:
+        cached = _schedules.get(year)
+        if cached is not None and time.monotonic() - cached[1] < SCHEDULE_SECONDS:
+            return cached[0]
+
+    import pandas as pd
+    from data.cache import get_event_schedule
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    schedule = get_event_schedule(year)
+    rounds = {
+        int(event['RoundNumber']): event['Location']
+        for _, event in schedule.iterrows()
+        if not pd.isna(event['Session5DateUtc']) and event['Session5DateUtc'] <= now
+    }
+    with _schedules_lock:
+        _schedules[year] = (rounds, time.monotonic())
+    return rounds
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 2) if values else None
+
+def season_summary(events):
+    """
+    Merges the figures of the events of a season.
+
+    Args:
+        events (list): event_stats of each event, sorted by round
+
+    Returns:
+        dict: With keys
+            events, points, best_finish: Over the whole season
+            mean_grid, mean_finish, mean_positions_gained: Averages of the
+                events with a grid and finishing position
+            races_ahead, qualis_ahead: Events finished and qualified ahead of
+                the teammate, out of races_compared and qualis_compared
+            mean_teammate_quali_gap, mean_teammate_pace_gap, mean_pole_gap_pct,
+                mean_pace_percentile: Averages of the gaps and pace
+            recent_pace_percentile: Mean pace percentile of the last RECENT_EVENTS events
+    """
+    finished = [e for e in events if e['grid_position'] is not None and e['finish_position'] is not None]
+    races = [e for e in events if e['finish_position'] is not None and e['teammate_finish_position'] is not None]
+    qualis = [e for e in events if e['teammate_quali_gap'] is not None]
+    return {
+        'events': len(events),
+        'points': round(sum(e['points'] or 0 for e in events), 1),
+        'best_finish': min((e['finish_position'] for e in events if e['finish_position'] is not None), default=None),
+        'mean_grid': _mean([e['grid_position'] for e in events]),
+        'mean_finish': _mean([e['finish_position'] for e in events]),
+        'mean_positions_gained': _mean([e['grid_position'] - e['finish_position'] for e in finished]),
+        'races_ahead': sum(e['finish_position'] < e['teammate_finish_position'] for e in races),
+        'races_compared': len(races),
+        'qualis_ahead': sum(e['teammate_quali_gap'] < 0 for e in qualis),
+        'qualis_compared': len(qualis),
+        'mean_teammate_quali_gap': _mean([e['teammate_quali_gap'] for e in events]),
+        'mean_teammate_pace_gap': _mean([e['teammate_pace_gap'] for e in events]),
+        'mean_pole_gap_pct': _mean([e['pole_gap_pct'] for e in events]),
+        'mean_pace_percentile': _mean([e['pace_percentile'] for e in events]),
+        'recent_pace_percentile': _mean([e['pace_percentile'] for e in events[-RECENT_EVENTS:]]),
+    }
+
+def describe_season(driver, year, summary):
+    """Graph description with the main figures of season_summary, which the summary prompt also gets."""
+    parts = [
+        f"{summary['points']:g} points",
+        f"average grid {summary['mean_grid']} and finish {summary['mean_finish']}",
+        f"ahead of the teammate in {summary['races_ahead']} of {summary['races_compared']} races "
+        f"and {summary['qualis_ahead']} of {summary['qualis_compared']} qualifyings",
+    ]
+    if summary['mean_pole_gap_pct'] is not None:
+        parts.append(f"{summary['mean_pole_gap_pct']:.2f}% off pole on average")
+    if summary['mean_pace_percentile'] is not None:
+        parts.append(f"race pace percentile {summary['mean_pace_percentile']:.0f} "
+                     f"({summary['recent_pace_percentile']:.0f} in the last {min(RECENT_EVENTS, summary['events'])} events)")
+    return f"{driver} driver {year} season after {summary['events']} events: " + ", ".join(parts)
+
+def stored_events(year, driver):
+    """Stored rows of a season computed with the current EVENT_STATS_VERSION, by round."""
+    events = {}
+    for row in get_season_stats(year, driver):
+        if row['version'] == EVENT_STATS_VERSION:
+            events.setdefault(row['round'], row)
+    return events
+
+def missing_rounds(year, events):
+    """(round, location) of the races already run that have no row in events."""
+    try:
+        rounds = completed_rounds(year)
+    except Exception as e:
+        print(f"Could not load the {year} schedule, using the stored events only: {str(e)}")
+        return []
+    return [(number, track) for number, track in sorted(rounds.items()) if number not in events]
+
+def fill_event_stats(year, driver, driver_number):
+    """
+    Computes and stores the rows of the races of a season that have none.
+    Each one reads the race and qualifying from the lap store, or loads them
+    on a miss, so it runs in the background or from the backfill, never
+    while a user waits. Events that can not be computed yet, e.g. because
+    their data is not published, are left for the next call.
+
+    Returns:
+        int: Events stored
+    """
+    from data.driver_analysis import update_event_stats
+    stored = 0
+    for number, track in missing_rounds(year, stored_events(year, driver)):
+        try:
+            update_event_stats(year, track, driver, driver_number)
+            stored += 1
+        except Exception as e:
+            print(f"Could not compute the {year} {track} figures of {driver}: {str(e)}")
+    return stored
+
+def season_report(year, driver, driver_number, render=True):
+    """
+    Progress of a driver over a season, built only from the stored event
+    rows (one query), so it takes milliseconds. Races run without a stored
+    row are listed in missing, for the caller to compute them with
+    fill_event_stats.
+
+    Args:
+        year (int): Season
+        driver (str): Driver abbreviation
+        driver_number (str): Driver number
+        render (bool): Also render the season graph
+
+    Returns:
+        dict: With keys events (event_stats of each event the driver took part
+            in, by round), missing ((round, location) of the races not computed
+            yet), summary (season_summary), description and image (the
+            rendered graph, or None if not rendered or there are no events)
+    """
+    stored = stored_events(year, driver)
+    events = [stored[number] for number in sorted(stored) if stored[number]['status'] != NOT_PARTICIPATED]
+    summary = season_summary(events)
+    report = {
+        'events': events,
+        'missing': missing_rounds(year, stored),
+        'summary': summary,
+        'description': describe_season(driver, year, summary) if events else None,
+        'image': None,
+    }
+    if render and events:
+        from data.render import submit_render
+        from metrics.metrics import merge_spans
+        report['image'], spans = submit_render('season_progress', {
+            'events': [{k: e[k] for k in ('event_name', 'grid_position', 'finish_position',
+                                          'teammate_finish_position', 'pole_gap_pct', 'pace_percentile')}
+                       for e in events],
+            'driver': driver,
+            'teammates': sorted({e['teammate'] for e in events if e['teammate']}),
+            'title': f"{driver} {year} Season Progress",
+        }).result()
+        merge_spans(spans)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the season progress of a driver")
+    parser.add_argument('year', type=int)
+    parser.add_argument('driver', help="Driver code and number, e.g. COL:43")
+    parser.add_argument('--fill', action='store_true', help="First compute the events that have no stored figures")
+    args = parser.parse_args(argv)
+
+    driver, number = args.driver.split(':')
+    if args.fill:
+        print(f"{fill_event_stats(args.year, driver.upper(), number)} events computed")
+    start = time.perf_counter()
+    report = season_report(args.year, driver.upper(), number, render=False)
+    for event in report['events']:
+        print(f"{event['round']:>3} {event['event_name']:<32} grid {event['grid_position']} finish {event['finish_position']} "
+              f"pole gap {event['pole_gap_pct']}% pace percentile {event['pace_percentile']}")
+    print(report['description'] or "No events")
+    if report['missing']:
+        print(f"{len(report['missing'])} races without figures yet, run with --fill to compute them")
+    print(f"Report built in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import os
+import threading
+from collections import OrderedDict
+from data.cache import disk_cache
+from metrics.metrics import span
+
+## Load flags accepted by fastf1's Session.load
+LOAD_FLAGS = ('laps', 'telemetry', 'weather', 'messages')
+
+## Data a graph can declare it needs. Results come with every load, so they
+## do not map to a load flag
+DATA_NEEDS = ('laps', 'results', 'telemetry', 'weather', 'messages')
+
+def needs_to_load_flags(*needs_sets):
+    """
+    Builds Session.load flags that load only the union of the given needs.
+
+    Args:
+        *needs_sets: Iterables of names from DATA_NEEDS
+
+    Returns:
+        dict: Flags for Session.load, every flag set explicitly
+    """
+    wanted = set()
+    for needs in needs_sets:
+        unknown = set(needs) - set(DATA_NEEDS)
+        if unknown:
+            raise ValueError(f"Unknown session data needs: {sorted(unknown)}")
+        wanted.update(needs)
+    return {flag: flag in wanted for flag in LOAD_FLAGS}
+
+class SessionProvider:
+    """
+    Keeps a bounded LRU of loaded FastF1 sessions so every graph builder
+    working on the same event reuses one Session object instead of
+    downloading and parsing the data again.
+
+    Sessions are keyed by (year, event, session type). If a caller needs
+    data that the cached session was not loaded with, the session is
+    reloaded with the union of both sets of flags and replaces the entry.
+    """
+    def __init__(self, max_sessions=None):
+        """
+        Args:
+            max_sessions (int): Maximum number of sessions kept in memory
+                (default SESSION_CACHE_SIZE env variable or 4)
+        """
+        if max_sessions is None:
+            max_sessions = int(os.getenv('SESSION_CACHE_SIZE', '4'))
+        self.max_sessions = max(1, max_sessions)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def make_key(year, track, session_type):
+        return (int(year), str(track).strip().lower(), str(session_type).strip().upper())
+
+    def _key_lock(self, key):
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, year, track, session_type, **load_flags):
+        """
+        Returns a loaded session, loading it only if it is not cached or
+        if the cached copy lacks some of the requested data.
+
+        Args:
+            year (int): Season
+            track (str): Event name or location
+            session_type (str): FastF1 session identifier ('R', 'Q', ...)
+            **load_flags: Flags for Session.load (laps, telemetry, weather, messages).
+                Missing flags default to True, as in FastF1.
+
+        Returns:
+            fastf1.core.Session: Loaded session
+        """
+        key = self.make_key(year, track, session_type)
+        wanted = {flag: bool(load_flags.get(flag, True)) for flag in LOAD_FLAGS}
+
+        ## One lock per key so two builders never load the same session twice,
+        ## while different events can still load concurrently
+        try:
+            with span('session_load', session=key[2]) as labels, self._key_lock(key):
+                with self._lock:
+                    entry = self._sessions.get(key)
+                    if entry is not None:
+                        self._sessions.move_to_end(key)
+
+                if entry is not None:
+                    session, loaded = entry
+                    if all(loaded[flag] or not wanted[flag] for flag in LOAD_FLAGS):
+                        print(f"Session cache hit for {key}")
+                        labels['cache'] = 'memory'
+                        return session
+                    wanted = {flag: loaded[flag] or wanted[flag] for flag in LOAD_FLAGS}
+                    print(f"Session {key} cached without {[f for f in LOAD_FLAGS if wanted[f] and not loaded[f]]}, reloading...")
+                else:
+                    print(f"Session cache miss for {key}, loading...")
+
+                import fastf1
+                disk_cache.enable()
+                session = fastf1.get_session(year, track, session_type)
+                disk_hit = disk_cache.is_cached(session)
+                labels['cache'] = 'disk' if disk_hit else 'miss'
+                session.load(**wanted)
+                disk_cache.record_load(session, disk_hit)
+
+                with self._lock:
+                    self._sessions[key] = (session, wanted)
+                    self._sessions.move_to_end(key)
+                    while len(self._sessions) > self.max_sessions:
+                        evicted, _ = self._sessions.popitem(last=False)
+                        self._drop_key_lock(evicted)
+                        print(f"Session {evicted} evicted from memory cache")
+                return session
+        except Exception:
+            ## A session that failed to load leaves no lock behind
+            with self._lock:
+                if key not in self._sessions:
+                    self._drop_key_lock(key)
+            raise
+
+    def _drop_key_lock(self, key):
+        ## Called with self._lock held. A lock in use stays, its holder is loading the
+        ## session again; at worst a caller that already took the old lock loads it twice
+        lock = self._key_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._key_locks[key]
+
+    def discard(self, year, track, session_type):
+        """Drops a session from memory, e.g. one loaded before its data was complete, so the next get loads it again."""
+        key = self.make_key(year, track, session_type)
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._drop_key_lock(key)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            for key in list(self._key_locks):
+                self._drop_key_lock(key)
+
+## Shared provider for the whole process
+session_provider = SessionProvider()
+
+def load_session(year, track, session_type, **load_flags):
+    return session_provider.get(year, track, session_type, **load_flags)
+
+def load_uncached(year, track, session_type, scope='uncached', **load_flags):
+    """
+    Loads a session outside the session LRU, for one-off reads that must not
+    evict the sessions the analyses are using nor stay in memory after them.
+
+    Args:
+        scope (str): Label of the load in the session_load metric
+        **load_flags: Flags for Session.load, missing ones default to True as in FastF1
+
+    Returns:
+        fastf1.core.Session: Loaded session
+    """
+    import fastf1
+    wanted = {flag: bool(load_flags.get(flag, True)) for flag in LOAD_FLAGS}
+    with span('session_load', session=str(session_type).upper(), scope=scope) as labels:
+        disk_cache.enable()
+        session = fastf1.get_session(year, track, session_type)
+        disk_hit = disk_cache.is_cached(session)
+        labels['cache'] = 'disk' if disk_hit else 'miss'
+        session.load(**wanted)
+        disk_cache.record_load(session, disk_hit)
+        return session
+
+def load_results(year, track, session_type):
+    """
+    Results of a session, loaded without laps, telemetry, weather or messages
+    and outside the session LRU, so reading many events (e.g. for the driver
+    registry) never evicts the sessions the analyses are using.
+
+    Returns:
+        pandas.DataFrame: The session's results
+    """
+    return load_uncached(year, track, session_type, scope='results', **dict.fromkeys(LOAD_FLAGS, False)).results
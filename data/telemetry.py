@@ -0,0 +1,136 @@
+import os
+
+## Samples kept of each trace of a lap. A qualifying lap has hundreds of car data
+## samples per channel; plots look the same with far fewer once reduced with LTTB
+TELEMETRY_POINTS = int(os.getenv('TELEMETRY_POINTS', '200'))
+
+## Samples of the track path used to draw the minisector map
+PATH_POINTS = int(os.getenv('TELEMETRY_PATH_POINTS', '300'))
+
+## Equal parts of the lap compared in the minisector map
+MINISECTORS = int(os.getenv('TELEMETRY_MINISECTORS', '25'))
+
+## Channels plotted against distance
+TRACE_CHANNELS = ('Speed', 'Throttle', 'Brake', 'nGear')
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Keeps the first and last
+    samples and, from each of points - 2 equal buckets in between, the one
+    forming the largest triangle with the sample kept from the previous
+    bucket and the average of the next one, so peaks, braking points and
+    gear changes survive the reduction.
+
+    Args:
+        x (ndarray): Increasing sample positions (e.g. distance)
+        y (ndarray): Sample values
+        points (int): Samples to keep
+
+    Returns:
+        ndarray: Indices of the kept samples, increasing
+    """
+    import numpy as np
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    keep = np.empty(points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    selected = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i == points - 3:
+            next_x, next_y = x[-1], y[-1]
+        else:
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        area = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        keep[i + 1] = selected
+    return keep
+
+def reduce_lap(car, pos, points=None, path_points=None, minisectors=None):
+    """
+    Reduces the telemetry of one lap to what the comparison graph draws.
+
+    Args:
+        car (DataFrame): Car data of the lap with SessionTime, Distance and TRACE_CHANNELS
+        pos (DataFrame): Position data of the lap with SessionTime, X and Y
+        points (int): Samples kept per channel (default TELEMETRY_POINTS)
+        path_points (int): Samples of the track path (default PATH_POINTS)
+        minisectors (int): Parts of the lap (default MINISECTORS)
+
+    Returns:
+        DataFrame: Long table with Channel, Distance and Value (float32). Channels are
+            TRACE_CHANNELS reduced with LTTB, X and Y on an even distance grid, and
+            MinisectorSpeed, the mean speed of each minisector at full resolution
+            (Distance holds the minisector index)
+    """
+    import numpy as np
+    import pandas as pd
+    points = points or TELEMETRY_POINTS
+    path_points = path_points or PATH_POINTS
+    minisectors = minisectors or MINISECTORS
+
+    distance = car['Distance'].fillna(0).to_numpy(dtype='float64')
+    frames = []
+    for channel in TRACE_CHANNELS:
+        values = car[channel].to_numpy(dtype='float64')
+        keep = lttb(distance, values, points)
+        frames.append(pd.DataFrame({'Channel': channel, 'Distance': distance[keep], 'Value': values[keep]}))
+
+    ## The map needs an even spread of points, not the ones LTTB keeps
+    car_time = car['SessionTime'].dt.total_seconds().to_numpy()
+    pos_time = pos['SessionTime'].dt.total_seconds().to_numpy()
+    grid = np.linspace(distance[0], distance[-1], path_points)
+    grid_time = np.interp(grid, distance, car_time)
+    for channel in ('X', 'Y'):
+        values = np.interp(grid_time, pos_time, pos[channel].to_numpy(dtype='float64'))
+        frames.append(pd.DataFrame({'Channel': channel, 'Distance': grid, 'Value': values}))
+
+    fraction = (distance - distance[0]) / max(distance[-1] - distance[0], 1e-9)
+    sector = np.minimum((fraction * minisectors).astype(int), minisectors - 1)
+    speed_sum = np.bincount(sector, car['Speed'].to_numpy(dtype='float64'), minisectors)
+    samples = np.bincount(sector, minlength=minisectors)
+    frames.append(pd.DataFrame({
+        'Channel': 'MinisectorSpeed',
+        'Distance': np.arange(minisectors),
+        'Value': speed_sum / np.maximum(samples, 1),
+    }))
+
+    trace = pd.concat(frames, ignore_index=True)
+    trace['Channel'] = trace['Channel'].astype('category')
+    return trace.astype({'Distance': 'float32', 'Value': 'float32'})
+
+def lap_trace(session, driver_number, lap_number):
+    """
+    Reduced telemetry of one lap of a session loaded with telemetry. Only
+    the car and position data of that lap are sliced and processed.
+    """
+    laps = session.laps
+    lap = laps[(laps['DriverNumber'] == str(driver_number)) & (laps['LapNumber'] == float(lap_number))]
+    if lap.empty:
+        raise ValueError(f"Lap {lap_number:g} of driver {driver_number} not found")
+    lap = lap.iloc[0]
+    return reduce_lap(lap.get_car_data().add_distance(), lap.get_pos_data())
+
+def minisector_winners(traces, drivers):
+    """
+    Driver with the highest mean speed in each minisector.
+
+    Args:
+        traces (DataFrame): Driver, Channel, Distance and Value of both laps
+        drivers (list): The two driver abbreviations
+
+    Returns:
+        ndarray: Index in drivers of the faster driver, per minisector
+    """
+    import numpy as np
+    speeds = [
+        traces[(traces['Driver'] == d) & (traces['Channel'] == 'MinisectorSpeed')].sort_values('Distance')['Value'].to_numpy()
+        for d in drivers
+    ]
+    return np.where(speeds[0] >= speeds[1], 0, 1)
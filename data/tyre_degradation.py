@@ -0,0 +1,136 @@
+import os
+
+## Seconds a lap gets faster for every lap of fuel burnt. Lap times are corrected to
+## the fuel load of the last lap so the fitted slopes only measure the tyres
+FUEL_CORRECTION = float(os.getenv('TYRE_FUEL_CORRECTION_SECONDS', '0.06'))
+
+## Stints with fewer quick laps than this are not fitted
+MIN_STINT_LAPS = int(os.getenv('TYRE_MIN_STINT_LAPS', '5'))
+
+STINT_COLUMNS = ['Driver', 'DriverNumber', 'Stint', 'Compound', 'Laps', 'FirstLap', 'LastLap',
+                 'Slope', 'Intercept', 'Residual', 'MeanLapTime(s)']
+
+def fit_stints(stats, fuel_correction=None, min_laps=None):
+    """
+    Fits the tyre degradation of every stint of the race, for the whole grid
+    at once.
+
+    Each stint is the quick laps of a driver on one set of tyres, without the
+    first lap of the race. Their fuel-corrected lap times are fitted against
+    tyre life with ordinary least squares, y = Intercept + Slope * TyreLife.
+    The sums the fit needs are accumulated for every stint in a single
+    np.bincount pass over the laps, so the cost does not grow with the
+    number of drivers.
+
+    Args:
+        stats (dict): compute_lap_stats output; its laps need Stint and TyreLife
+        fuel_correction (float): Seconds per lap of fuel (default FUEL_CORRECTION)
+        min_laps (int): Shortest stint fitted (default MIN_STINT_LAPS)
+
+    Returns:
+        DataFrame: One row per fitted stint with STINT_COLUMNS, sorted by Slope.
+            Slope is the seconds lost per lap of tyre life and Residual the
+            standard deviation of the laps around the fit
+    """
+    import numpy as np
+    import pandas as pd
+    if fuel_correction is None:
+        fuel_correction = FUEL_CORRECTION
+    if min_laps is None:
+        min_laps = MIN_STINT_LAPS
+
+    laps = stats['laps']
+    if 'Stint' not in laps.columns or 'TyreLife' not in laps.columns:
+        return pd.DataFrame(columns=STINT_COLUMNS)
+    selected = (
+        stats['quick'].to_numpy(dtype=bool)
+        & laps['Stint'].notna().to_numpy()
+        & laps['TyreLife'].notna().to_numpy()
+        & laps['LapTime(s)'].notna().to_numpy()
+        & (laps['LapNumber'] > 1).to_numpy()
+    )
+    laps = laps[selected]
+    if laps.empty:
+        return pd.DataFrame(columns=STINT_COLUMNS)
+
+    groups = laps.groupby(['DriverNumber', 'Stint'], sort=False, observed=True)
+    codes = groups.ngroup().to_numpy()
+    count = codes.max() + 1
+
+    x = laps['TyreLife'].to_numpy(dtype='float64')
+    lap_number = laps['LapNumber'].to_numpy(dtype='float64')
+    y = laps['LapTime(s)'].to_numpy(dtype='float64') - fuel_correction * (lap_number.max() - lap_number)
+
+    n = np.bincount(codes, minlength=count).astype('float64')
+    sum_x = np.bincount(codes, x, count)
+    sum_y = np.bincount(codes, y, count)
+    sum_xx = np.bincount(codes, x * x, count)
+    sum_xy = np.bincount(codes, x * y, count)
+
+    denominator = n * sum_xx - sum_x ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (n * sum_xy - sum_x * sum_y) / denominator, np.nan)
+        intercept = (sum_y - slope * sum_x) / n
+        residuals = y - intercept[codes] - slope[codes] * x
+        residual = np.sqrt(np.bincount(codes, residuals ** 2, count) / np.maximum(n - 2, 1))
+
+    stints = groups.agg(
+        Driver=('Driver', 'first'),
+        Compound=('Compound', 'first'),
+        FirstLap=('LapNumber', 'min'),
+        LastLap=('LapNumber', 'max'),
+    ).reset_index()
+    stints['Laps'] = n.astype(int)
+    stints['Slope'] = slope
+    stints['Intercept'] = intercept
+    stints['Residual'] = residual
+    stints['MeanLapTime(s)'] = sum_y / n
+
+    stints = stints[(stints['Laps'] >= min_laps) & stints['Slope'].notna()]
+    return stints[STINT_COLUMNS].sort_values('Slope', kind='stable').reset_index(drop=True)
+
+def degradation_stats(stints, driver):
+    """
+    Compares the stints of a driver with the rest of the grid.
+
+    Args:
+        stints (DataFrame): fit_stints output
+        driver (str): Driver abbreviation
+
+    Returns:
+        dict: With keys
+            stints: Per stint of the driver, its number, compound, laps, slope
+                (s/lap) and rank among the grid's stints on the same compound
+                (1 is the lowest degradation) out of how many
+            grid_median: Median slope per compound
+    """
+    by_compound = stints.groupby('Compound', observed=True)['Slope']
+    stints = stints.assign(Rank=by_compound.rank(method='min'), Of=by_compound.transform('size'))
+    return {
+        'stints': [
+            {
+                'stint': int(row.Stint),
+                'compound': str(row.Compound),
+                'laps': int(row.Laps),
+                'slope': round(float(row.Slope), 3),
+                'rank': int(row.Rank),
+                'of': int(row.Of),
+            }
+            for row in stints[stints['Driver'] == driver].sort_values('Stint').itertuples()
+        ],
+        'grid_median': {
+            str(compound): round(float(slope), 3)
+            for compound, slope in by_compound.median().items()
+        },
+    }
+
+def describe_degradation(driver, year, track, stats):
+    """Graph description with the figures of degradation_stats, which the summary prompt also gets."""
+    parts = [
+        f"stint {s['stint']} on {s['compound']} ({s['laps']} laps): {s['slope']:+.3f} s/lap, "
+        f"{s['rank']} of {s['of']} {s['compound']} stints (grid median {stats['grid_median'][s['compound']]:+.3f} s/lap)"
+        for s in stats['stints']
+    ]
+    if not parts:
+        return f"{driver} driver has no stint long enough to measure tyre degradation in the {year} {track} Grand Prix"
+    return f"{driver} driver fuel-corrected tyre degradation in the {year} {track} Grand Prix: " + "; ".join(parts)
@@ -1,29 +1,135 @@
-import pyodbc
 import os
+import time
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from metrics.metrics import span
 
 load_dotenv()
 
+## SQLSTATEs pyodbc reports when the connection to SQL Server is lost
+DISCONNECT_SQLSTATES = {'08S01', '08001', '08003', '08004', '08007', 'HYT00', 'HYT01'}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+## pyodbc and SQLAlchemy are imported on first use, so importing this module
+## never needs the ODBC driver or a reachable server
+
+def _connect():
+    import pyodbc
+    return pyodbc.connect(
+        driver='{ODBC Driver 17 for SQL Server}',
+        server=os.getenv('DB_SERVER'),
+        database=os.getenv('DB_NAME'),
+        uid=os.getenv('DB_USERNAME'),
+        pwd=os.getenv('DB_PASSWORD')
+    )
+
+def get_engine():
+    """
+    Returns the process-wide SQLAlchemy engine. Connections are pooled and
+    checked with a ping before each checkout, so a connection dropped by the
+    server is replaced instead of failing the query.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            from sqlalchemy import create_engine
+            from sqlalchemy.pool import QueuePool
+            _engine = create_engine(
+                "mssql+pyodbc://",
+                creator=_connect,
+                poolclass=QueuePool,
+                pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+                max_overflow=int(os.getenv('DB_POOL_MAX_OVERFLOW', '5')),
+                pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+                pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+                pool_pre_ping=True,
+            )
+        return _engine
+
+def is_disconnect(error):
+    import pyodbc
+    return isinstance(error, pyodbc.Error) and bool(error.args) and error.args[0] in DISCONNECT_SQLSTATES
+
 def get_db_connection():
-    try:
-        conn = pyodbc.connect(
-            driver='{ODBC Driver 17 for SQL Server}',
-            server=os.getenv('DB_SERVER'),
-            database=os.getenv('DB_NAME'),
-            uid=os.getenv('DB_USERNAME'),
-            pwd=os.getenv('DB_PASSWORD')
-        )
-        cursor = conn.cursor()
-        return conn, cursor
-    except pyodbc.Error as e:
-        print(f"Error connecting to database: {str(e)}")
-        raise
-
-try:
-    conn, cursor = get_db_connection()
+    """
+    Borrows a connection from the pool. Closing the connection returns it to the pool.
+
+    Returns:
+        tuple: (connection, cursor)
+    """
+    retries = int(os.getenv('DB_RETRIES', '2'))
+    for attempt in range(retries + 1):
+        try:
+            conn = get_engine().raw_connection()
+            cursor = conn.cursor()
+            return conn, cursor
+        except Exception as e:
+            if attempt == retries:
+                print(f"Error connecting to database: {str(e)}")
+                raise
+            print(f"Database connection failed, retrying ({attempt + 1}/{retries}): {str(e)}")
+            time.sleep(0.5 * 2 ** attempt)
 
+@contextmanager
+def db_cursor(commit=False):
+    """
+    Yields a cursor on a pooled connection, committing at the end if asked to
+    and rolling back on error. Connections lost mid-query are discarded from the pool.
+    """
+    with span('db', mode='write' if commit else 'read'):
+        conn, cursor = get_db_connection()
+        try:
+            yield cursor
+            if commit:
+                conn.commit()
+        except Exception as e:
+            if is_disconnect(e):
+                conn.invalidate()
+            else:
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+def run_query(func, commit=False):
+    """
+    Runs func(cursor) on a pooled connection, retrying on a fresh connection
+    if the server drops it. Only use it for idempotent work.
+
+    Returns:
+        Whatever func returns
+    """
+    import pyodbc
+    retries = int(os.getenv('DB_RETRIES', '2'))
+    for attempt in range(retries + 1):
+        try:
+            with db_cursor(commit=commit) as cursor:
+                return func(cursor)
+        except pyodbc.Error as e:
+            if not is_disconnect(e) or attempt == retries:
+                raise
+            print(f"Database connection lost, retrying ({attempt + 1}/{retries}): {str(e)}")
+
+def fetch_all(query, params=()):
+    def fetch(cursor):
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    return run_query(fetch)
+
+def fetch_one(query, params=()):
+    def fetch(cursor):
+        cursor.execute(query, params)
+        return cursor.fetchone()
+    return run_query(fetch)
+
+## Schema of the bot's tables. Each statement only creates or alters what is missing
+SCHEMA_MIGRATIONS = [
     # 1. Events table
-    create_events_table = """
+    """
     IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'EventF1')
     BEGIN
         CREATE TABLE EventF1 (
@@ -34,10 +140,10 @@ try:
         UNIQUE (season, gp, driver)
         );
     END
-    """
+    """,
 
     # 2. Graphs table
-    create_graphs_table = """
+    """
     IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'Graph')
     BEGIN
         CREATE TABLE Graph (
@@ -45,13 +151,22 @@ try:
         event_id INT NOT NULL FOREIGN KEY REFERENCES EventF1(id),
         name NVARCHAR(100) NOT NULL,
         graph_path NVARCHAR(255) NOT NULL,
-        description NVARCHAR(MAX)
+        description NVARCHAR(MAX),
+        telegram_file_id NVARCHAR(255) NULL
         );
     END
+    """,
+
+    # 2.1 Telegram file id column for tables created before uploads were cached
     """
+    IF COL_LENGTH('Graph', 'telegram_file_id') IS NULL
+    BEGIN
+        ALTER TABLE Graph ADD telegram_file_id NVARCHAR(255) NULL;
+    END
+    """,
 
     # 3. Resumes table
-    create_resumes_table = """
+    """
     IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'Resume')
     BEGIN
         CREATE TABLE Resume (
@@ -59,23 +174,85 @@ try:
         event_id INT NOT NULL FOREIGN KEY REFERENCES EventF1(id),
         type NVARCHAR(100) NOT NULL,
         content NVARCHAR(MAX) NOT NULL,
+        input_hash NVARCHAR(64) NULL,
+        model NVARCHAR(100) NULL,
+        created_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
         );
     END
+    """,
+
+    # 3.1 Resume cache columns for tables created before summaries were cached
     """
+    IF COL_LENGTH('Resume', 'input_hash') IS NULL
+    BEGIN
+        ALTER TABLE Resume ADD
+        input_hash NVARCHAR(64) NULL,
+        model NVARCHAR(100) NULL,
+        created_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME();
+    END
+    """,
 
-    cursor.execute(create_events_table)
-    cursor.execute(create_graphs_table)
-    cursor.execute(create_resumes_table)
-    conn.commit()
+    # 4. Jobs table, the queue the analysis workers take their work from
+    """
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'Job')
+    BEGIN
+        CREATE TABLE Job (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        kind NVARCHAR(50) NOT NULL,
+        payload NVARCHAR(MAX) NOT NULL,
+        priority INT NOT NULL DEFAULT 0,
+        status NVARCHAR(20) NOT NULL DEFAULT 'queued',
+        attempts INT NOT NULL DEFAULT 0,
+        max_attempts INT NOT NULL DEFAULT 3,
+        run_after DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        leased_by NVARCHAR(100) NULL,
+        lease_expires_at DATETIME2 NULL,
+        result NVARCHAR(MAX) NULL,
+        last_error NVARCHAR(MAX) NULL,
+        created_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        updated_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+        );
+        CREATE INDEX IX_Job_claim ON Job (status, priority DESC, id) INCLUDE (run_after, lease_expires_at);
+    END
+    """,
+
+    # 5. Event stats table, the per-event figures season reports are built from
+    """
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'EventStats')
+    BEGIN
+        CREATE TABLE EventStats (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        event_id INT NOT NULL UNIQUE FOREIGN KEY REFERENCES EventF1(id),
+        version INT NOT NULL,
+        round INT NOT NULL,
+        event_name NVARCHAR(100) NOT NULL,
+        grid_position INT NULL,
+        finish_position INT NULL,
+        status NVARCHAR(100) NULL,
+        points FLOAT NULL,
+        teammate NVARCHAR(10) NULL,
+        teammate_finish_position INT NULL,
+        teammate_quali_gap FLOAT NULL,
+        teammate_pace_gap FLOAT NULL,
+        pole_gap FLOAT NULL,
+        pole_gap_pct FLOAT NULL,
+        pace_percentile FLOAT NULL,
+        created_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+        );
+    END
+    """,
+]
 
-except pyodbc.Error as e:
-    print(f"Database error: {str(e)}")
-    if conn:
-        conn.rollback()
-    raise
+def init_db():
+    """
+    Creates the tables, and the columns added since they were first created,
+    if they are missing. Runs in one transaction; safe to run on every start.
+    """
+    with db_cursor(commit=True) as cursor:
+        for migration in SCHEMA_MIGRATIONS:
+            cursor.execute(migration)
+    print("Database schema up to date")
 
-finally:
-    if cursor:
-        cursor.close()
-    if conn:
-        conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    ## Usage: python -m db.dbHandler
+    init_db()
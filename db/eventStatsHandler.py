@@ -0,0 +1,38 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+from db.dbHandler import fetch_all
+
+## Figures stored per event, see data/season_progress.py for how each one is computed
+EVENT_STATS_COLUMNS = [
+    'round', 'event_name', 'grid_position', 'finish_position', 'status', 'points',
+    'teammate', 'teammate_finish_position', 'teammate_quali_gap', 'teammate_pace_gap',
+    'pole_gap', 'pole_gap_pct', 'pace_percentile',
+]
+
+## Get the stored figures of every event of a driver in a season, sorted by round.
+## Each row also has the gp of its event and the version it was computed with
+def get_season_stats(season, driver):
+    query = f"""
+    SELECT e.gp, s.version, {', '.join(f's.{c}' for c in EVENT_STATS_COLUMNS)}
+    FROM EventStats s
+    JOIN EventF1 e ON s.event_id = e.id
+    WHERE e.season = ? AND e.driver = ?
+    ORDER BY s.round
+    """
+    return [
+        {'gp': row[0], 'version': row[1], **dict(zip(EVENT_STATS_COLUMNS, row[2:]))}
+        for row in fetch_all(query, (season, driver))
+    ]
+
+## Store the figures of an event, replacing the ones computed before. Runs on the
+## caller's cursor so it joins the transaction that holds the event row
+def write_event_stats(cursor, event_id, stats, version):
+    cursor.execute("DELETE FROM EventStats WHERE event_id = ?", (event_id,))
+    query = f"""
+    INSERT INTO EventStats (event_id, version, {', '.join(EVENT_STATS_COLUMNS)})
+    VALUES ({', '.join('?' for _ in range(len(EVENT_STATS_COLUMNS) + 2))})
+    """
+    cursor.execute(query, (event_id, version, *(stats.get(c) for c in EVENT_STATS_COLUMNS)))
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+from db.dbHandler import db_cursor, fetch_one, fetch_all
+
+## Job priorities, higher runs first
+PRIORITY_INTERACTIVE = 100
+PRIORITY_PREWARM = 50
+PRIORITY_BACKFILL = 0
+
+## A job is 'queued' until a worker claims it, 'running' while leased, and ends as
+## 'done' or, once it has failed max_attempts times, 'dead' (the dead-letter state)
+JOB_STATUSES = ('queued', 'running', 'done', 'dead')
+
+JOB_COLUMNS = ['id', 'kind', 'payload', 'priority', 'status', 'attempts', 'max_attempts', 'leased_by', 'result', 'last_error']
+
+def _job_from_row(row):
+    if not row:
+        return None
+    return {
+        'id': int(row[0]),
+        'kind': row[1],
+        'payload': json.loads(row[2]),
+        'priority': row[3],
+        'status': row[4],
+        'attempts': row[5],
+        'max_attempts': row[6],
+        'leased_by': row[7],
+        'result': json.loads(row[8]) if row[8] else None,
+        'last_error': row[9],
+    }
+
+## Add a job to the queue. Returns its id
+def enqueue_job(kind, payload, priority=PRIORITY_INTERACTIVE, max_attempts=None):
+    if max_attempts is None:
+        max_attempts = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    query = """
+    INSERT INTO Job (kind, payload, priority, max_attempts)
+    OUTPUT INSERTED.id
+    VALUES (?, ?, ?, ?)
+    """
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, (kind, json.dumps(payload), priority, max(1, max_attempts)))
+        return int(cursor.fetchone()[0])
+
+## Lease the next job to a worker: the highest priority queued job whose retry time has come,
+## or a running job whose worker stopped renewing its lease. Rows locked by other workers
+## are skipped, so concurrent workers never claim the same job. Returns None if there is none
+def claim_job(worker_id, lease_seconds, kinds=None):
+    kind_filter = f"AND kind IN ({', '.join('?' for _ in kinds)})" if kinds else ""
+    query = f"""
+    WITH next_job AS (
+        SELECT TOP 1 *
+        FROM Job WITH (UPDLOCK, READPAST, ROWLOCK)
+        WHERE ((status = 'queued' AND run_after <= SYSUTCDATETIME())
+        OR (status = 'running' AND lease_expires_at < SYSUTCDATETIME()))
+        {kind_filter}
+        ORDER BY priority DESC, id
+    )
+    UPDATE next_job
+    SET status = 'running', attempts = attempts + 1, leased_by = ?,
+    lease_expires_at = DATEADD(SECOND, ?, SYSUTCDATETIME()), updated_at = SYSUTCDATETIME()
+    OUTPUT {', '.join(f'INSERTED.{c}' for c in JOB_COLUMNS)}
+    """
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, (*(kinds or ()), worker_id, int(lease_seconds)))
+        return _job_from_row(cursor.fetchone())
+
+## Renew the lease of a running job. Returns False if the worker no longer holds it
+def extend_lease(job_id, worker_id, lease_seconds):
+    query = """
+    UPDATE Job
+    SET lease_expires_at = DATEADD(SECOND, ?, SYSUTCDATETIME()), updated_at = SYSUTCDATETIME()
+    WHERE id = ? AND status = 'running' AND leased_by = ?
+    """
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, (int(lease_seconds), job_id, worker_id))
+        return cursor.rowcount == 1
+
+## Mark a job done with its result. Returns False if the worker no longer holds it
+def complete_job(job_id, worker_id, result=None):
+    query = """
+    UPDATE Job
+    SET status = 'done', result = ?, lease_expires_at = NULL, updated_at = SYSUTCDATETIME()
+    WHERE id = ? AND status = 'running' AND leased_by = ?
+    """
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, (json.dumps(result) if result is not None else None, job_id, worker_id))
+        return cursor.rowcount == 1
+
+## Record a failed attempt. The job is queued again after retry_seconds, doubled on every
+## attempt, or dead-lettered once it has used its attempts. Returns the new status, or None
+## if the worker no longer holds the job
+def fail_job(job_id, worker_id, error, retry_seconds=None):
+    if retry_seconds is None:
+        retry_seconds = float(os.getenv('JOB_RETRY_SECONDS', '30'))
+    query = """
+    UPDATE Job
+    SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+    run_after = DATEADD(SECOND, CAST(? * POWER(2.0, attempts - 1) AS INT), SYSUTCDATETIME()),
+    last_error = ?, leased_by = NULL, lease_expires_at = NULL, updated_at = SYSUTCDATETIME()
+    OUTPUT INSERTED.status
+    WHERE id = ? AND status = 'running' AND leased_by = ?
+    """
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, (retry_seconds, str(error)[:4000], job_id, worker_id))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+## Dead-letter a job without running it again, e.g. when its workers keep dying before finishing it
+def bury_job(job_id, error):
+    query = """
+    UPDATE Job
+    SET status = 'dead', last_error = ?, leased_by = NULL, lease_expires_at = NULL, updated_at = SYSUTCDATETIME()
+    WHERE id = ?
+    """
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, (str(error)[:4000], job_id))
+
+## Get a job by id, or None
+def get_job(job_id):
+    return _job_from_row(fetch_one(f"SELECT {', '.join(JOB_COLUMNS)} FROM Job WHERE id = ?", (job_id,)))
+
+## Queued jobs that will run before this one
+def jobs_ahead(job_id):
+    query = """
+    SELECT COUNT(*)
+    FROM Job j
+    JOIN Job mine ON mine.id = ?
+    WHERE j.status = 'queued'
+    AND (j.priority > mine.priority OR (j.priority = mine.priority AND j.id < mine.id))
+    """
+    row = fetch_one(query, (job_id,))
+    return int(row[0]) if row else 0
+
+## Number of jobs in each status
+def job_counts():
+    counts = {status: 0 for status in JOB_STATUSES}
+    for status, count in fetch_all("SELECT status, COUNT(*) FROM Job GROUP BY status"):
+        counts[status] = int(count)
+    return counts
+
+## Dead jobs, newest first
+def dead_jobs(limit=20):
+    query = f"SELECT TOP {int(limit)} {', '.join(JOB_COLUMNS)} FROM Job WHERE status = 'dead' ORDER BY updated_at DESC"
+    return [_job_from_row(row) for row in fetch_all(query)]
+
+## Queue dead jobs again with fresh attempts, all of them or only job_ids. Returns how many
+def requeue_dead_jobs(job_ids=None):
+    query = """
+    UPDATE Job
+    SET status = 'queued', attempts = 0, run_after = SYSUTCDATETIME(), updated_at = SYSUTCDATETIME()
+    WHERE status = 'dead'
+    """
+    params = ()
+    if job_ids:
+        query += f" AND id IN ({', '.join('?' for _ in job_ids)})"
+        params = tuple(job_ids)
+    with db_cursor(commit=True) as cursor:
+        cursor.execute(query, params)
+        return cursor.rowcount
@@ -0,0 +1,38 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+from db.dbHandler import db_cursor, fetch_one
+
+## Get a cached resume of an event, only if it was generated from the same inputs and model
+def get_resume(season, gp, driver, resume_type, input_hash, model):
+    query = """
+    SELECT TOP 1 r.content
+    FROM Resume r
+    JOIN EventF1 e ON r.event_id = e.id
+    WHERE e.season = ? AND e.gp = ? AND e.driver = ?
+    AND r.type = ? AND r.input_hash = ? AND r.model = ?
+    ORDER BY r.created_at DESC
+    """
+    row = fetch_one(query, (season, gp, driver, resume_type, input_hash, model))
+    return row[0] if row else None
+
+## Store a resume, replacing the ones of the same event and type generated from other inputs
+def save_resume(season, gp, driver, resume_type, content, input_hash, model):
+    with db_cursor(commit=True) as cursor:
+        cursor.execute("SELECT id FROM EventF1 WHERE season = ? AND gp = ? AND driver = ?", (season, gp, driver))
+        row = cursor.fetchone()
+        if not row:
+            print(f"Event does not exist for {driver} in {season} {gp}, resume not cached")
+            return None
+        event_id = row[0]
+
+        cursor.execute("DELETE FROM Resume WHERE event_id = ? AND type = ?", (event_id, resume_type))
+        query = """
+        INSERT INTO Resume (event_id, type, content, input_hash, model)
+        OUTPUT INSERTED.id
+        VALUES (?, ?, ?, ?, ?)
+        """
+        cursor.execute(query, (event_id, resume_type, content, input_hash, model))
+        return int(cursor.fetchone()[0])
@@ -1,21 +1,66 @@
-import ollama
 import re
 import json
+import time
+import hashlib
+from llm.query_parser import QueryParser, MIN_CONFIDENCE
+from metrics.metrics import span, record
+
+# Bump when the summary prompt changes so cached summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
 
 class F1AnalysisLLM:
     """
     Class to handle F1 analysis using a local language model (Ollama).
     This class is responsible for:
     1. Extracting parameters from user questions
-    2. Generating analysis summaries based on data and graphs
+    2. Generating analysis summaries based on data and graphs, whole or streamed
     """
-    def __init__(self, model="mistral"):
+    def __init__(self, model="mistral", query_parser=None):
         """
         Initializes the language model.
         Args:
             model (str): Name of the model to use (default "mistral")
+            query_parser (QueryParser): Local parser tried before the model (default QueryParser())
         """
         self.model = model
+        self.query_parser = query_parser or QueryParser()
+    
+    def parse_query(self, user_message):
+        """
+        Extracts pilot, year and track from the user's question.
+        
+        Process:
+        1. Parses the question with the local parser
+        2. Returns its result if the parser is confident enough
+        3. Otherwise asks the LLM, keeping the fields the parser did find
+        
+        A question about a whole season comes back with track None.
+        
+        Args:
+            user_message (str): User's question about F1
+            
+        Returns:
+            dict: Dictionary with extracted parameters or None if there's an error
+        """
+        with span('llm_extract', method='parser'):
+            params, confidence = self.query_parser.parse(user_message)
+        if confidence >= MIN_CONFIDENCE:
+            return params
+        
+        print(f"Query parser confidence {confidence:.2f}, asking the LLM...")
+        with span('llm_extract', method='llm', model=self.model):
+            llm_params = self.extract_analysis_params(user_message)
+        if not isinstance(llm_params, dict):
+            return None
+        # Deterministic matches are more reliable than the model's guesses
+        llm_params.update({k: v for k, v in params.items() if v is not None})
+        if not llm_params.get('track'):
+            if not self.query_parser.is_season_query(user_message):
+                return None
+            llm_params['track'] = None
+        if not all(llm_params.get(k) for k in ('pilot', 'year')):
+            return None
+        return llm_params
         
     def extract_analysis_params(self, user_message):
         """
@@ -37,7 +82,7 @@ class F1AnalysisLLM:
         Analiza la siguiente pregunta sobre Fórmula 1 y extrae:
         - piloto (nombre o apellido)
         - año/temporada
-        - gran premio/circuito
+        - gran premio/circuito (null si pregunta por toda la temporada)
         
         Pregunta: "{user_message}"
         
@@ -50,6 +95,7 @@ class F1AnalysisLLM:
         """
         
         # Sends the prompt to the model and gets the response
+        import ollama
         response = ollama.chat(model=self.model, messages=[
             {'role': 'user', 'content': prompt}
         ])
@@ -60,23 +106,51 @@ class F1AnalysisLLM:
         except:
             return None
     
-    def generate_analysis_summary(self, analysis_data, graphs_info):
+    def summary_input_hash(self, analysis_data, graphs_info):
         """
-        Generates a detailed analysis summary using the LLM.
+        Hashes everything a summary depends on, so a cached summary is reused
+        only while its event data, graphs and model stay the same.
         
-        Process:
-        1. Builds a prompt with analysis data and graph information
-        2. Sends the prompt to the model requesting a structured analysis
-        3. Returns the generated summary
+        The pilot name is left out because users write it in many ways and the
+        event is already identified by the driver code. Each graph contributes
+        its row id and description, so re-rendering a graph (which stores a
+        new row) invalidates the summary.
         
         Args:
             analysis_data (dict): Analyzed event data
-            graphs_info (dict): Information about generated graphs
+            graphs_info (list): Information about generated graphs
             
         Returns:
-            str: Analysis summary generated by the model
+            str: SHA-256 hex digest
         """
-        prompt = f"""
+        graphs = []
+        for graph in sorted(graphs_info, key=lambda g: g['name']):
+            graphs.append({
+                'id': graph.get('id'),
+                'name': graph['name'],
+                'description': graph['description'],
+            })
+        inputs = {
+            'data': {k: v for k, v in analysis_data.items() if k != 'pilot'},
+            'graphs': graphs,
+            'model': self.model,
+            'prompt_version': SUMMARY_PROMPT_VERSION,
+        }
+        payload = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def summary_prompt(self, analysis_data, graphs_info):
+        """
+        Builds the prompt of the analysis summary.
+        
+        Args:
+            analysis_data (dict): Analyzed event data
+            graphs_info (list): Information about generated graphs
+            
+        Returns:
+            str: Prompt for the model
+        """
+        return f"""
         Genera un análisis detallado del rendimiento del piloto en español basado en:
         
         Datos del evento: {analysis_data}
@@ -89,10 +163,59 @@ class F1AnalysisLLM:
         
         Mantén un tono profesional pero accesible a cualquier persona.
         """
+    
+    def generate_analysis_summary(self, analysis_data, graphs_info):
+        """
+        Generates a detailed analysis summary using the LLM.
+        
+        Process:
+        1. Builds a prompt with analysis data and graph information
+        2. Sends the prompt to the model requesting a structured analysis
+        3. Returns the generated summary
+        
+        Args:
+            analysis_data (dict): Analyzed event data
+            graphs_info (dict): Information about generated graphs
+            
+        Returns:
+            str: Analysis summary generated by the model
+        """
+        prompt = self.summary_prompt(analysis_data, graphs_info)
         
         # Sends the prompt to the model and returns the generated analysis
-        response = ollama.chat(model=self.model, messages=[
-            {'role': 'user', 'content': prompt}
-        ])
+        import ollama
+        with span('llm_summary', model=self.model):
+            response = ollama.chat(model=self.model, messages=[
+                {'role': 'user', 'content': prompt}
+            ])
+        
+        return response['message']['content']
+    
+    def stream_analysis_summary(self, analysis_data, graphs_info):
+        """
+        Generates the same summary as generate_analysis_summary, yielding the
+        text as the model writes it so it can be shown before it is complete.
+        
+        Args:
+            analysis_data (dict): Analyzed event data
+            graphs_info (list): Information about generated graphs
+            
+        Yields:
+            str: Consecutive pieces of the summary
+        """
+        prompt = self.summary_prompt(analysis_data, graphs_info)
         
-        return response['message']['content']
\ No newline at end of file
+        import ollama
+        with span('llm_summary', model=self.model, streamed=True):
+            start = time.perf_counter()
+            first = True
+            for chunk in ollama.chat(model=self.model, messages=[
+                {'role': 'user', 'content': prompt}
+            ], stream=True):
+                content = chunk['message']['content']
+                if not content:
+                    continue
+                if first:
+                    record('llm_first_token', time.perf_counter() - start, model=self.model)
+                    first = False
+                yield content
@@ -0,0 +1,222 @@
+import os
+import re
+import unicodedata
+import time
+import threading
+
+## Colloquial circuit and GP names (Spanish and English) mapped to FastF1's event Location
+CIRCUIT_ALIASES = {
+    'bahrein': 'Sakhir', 'bahrain': 'Sakhir', 'sakhir': 'Sakhir',
+    'arabia saudita': 'Jeddah', 'arabia': 'Jeddah', 'jeddah': 'Jeddah', 'yeda': 'Jeddah',
+    'australia': 'Melbourne', 'melbourne': 'Melbourne', 'albert park': 'Melbourne',
+    'japon': 'Suzuka', 'japan': 'Suzuka', 'suzuka': 'Suzuka',
+    'china': 'Shanghai', 'shanghai': 'Shanghai',
+    'miami': 'Miami',
+    'imola': 'Imola', 'emilia romagna': 'Imola',
+    'monaco': 'Monaco', 'montecarlo': 'Monaco', 'monte carlo': 'Monaco',
+    'canada': 'Montréal', 'montreal': 'Montréal',
+    'espana': 'Barcelona', 'spain': 'Barcelona', 'barcelona': 'Barcelona', 'montmelo': 'Barcelona',
+    'austria': 'Spielberg', 'spielberg': 'Spielberg', 'red bull ring': 'Spielberg',
+    'gran bretana': 'Silverstone', 'inglaterra': 'Silverstone', 'british': 'Silverstone', 'silverstone': 'Silverstone',
+    'hungria': 'Budapest', 'hungary': 'Budapest', 'hungaroring': 'Budapest', 'budapest': 'Budapest',
+    'belgica': 'Spa-Francorchamps', 'belgium': 'Spa-Francorchamps', 'spa': 'Spa-Francorchamps',
+    'holanda': 'Zandvoort', 'paises bajos': 'Zandvoort', 'dutch': 'Zandvoort', 'zandvoort': 'Zandvoort',
+    'italia': 'Monza', 'monza': 'Monza',
+    'azerbaiyan': 'Baku', 'azerbaijan': 'Baku', 'baku': 'Baku',
+    'singapur': 'Marina Bay', 'singapore': 'Marina Bay', 'marina bay': 'Marina Bay',
+    'austin': 'Austin', 'cota': 'Austin', 'estados unidos': 'Austin',
+    'mexico': 'Mexico City', 'hermanos rodriguez': 'Mexico City',
+    'brasil': 'São Paulo', 'brazil': 'São Paulo', 'interlagos': 'São Paulo', 'sao paulo': 'São Paulo',
+    'las vegas': 'Las Vegas', 'vegas': 'Las Vegas',
+    'qatar': 'Lusail', 'lusail': 'Lusail',
+    'abu dhabi': 'Yas Island', 'yas marina': 'Yas Island', 'yas island': 'Yas Island',
+}
+
+YEAR_PATTERN = re.compile(r'\b(19[5-9]\d|20\d\d)\b')
+NUMBER_PATTERN = re.compile(r'(?:#|\bnumero\s+|\bauto\s+)(\d{1,2})\b')
+CODE_PATTERN = re.compile(r'\b([A-Z]{3})\b')
+## Explicit markers of questions about a whole season, on normalized text ("año" becomes "ano")
+SEASON_PATTERN = re.compile(r'\b(temporada|season|campeonato|en el ano)\b')
+
+## Words a season question can have besides the driver, the year and its
+## marker. Any other word may be a circuit the indexes do not know, so the
+## question is left to the LLM instead of being answered as a season
+SEASON_FILLER_WORDS = frozenset('''
+    a al como cual de del dime decime el en es esta este fue ha hasta how in is
+    la las le lo los me mi my of on que so su sus tal the this va vas viene vino
+    what y yendo anda andando ahora ano far doing going year resumen rendimiento
+    performance
+'''.split())
+
+## Longest alias in tokens, used to bound the n-gram scan
+MAX_ALIAS_TOKENS = 4
+
+## Seconds before retrying a season schedule that failed to load
+SCHEDULE_RETRY_SECONDS = 600
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w#]+', ' ', text.lower())
+    return ' '.join(text.split())
+
+class QueryParser:
+    """
+    Deterministic parser for formulaic questions like "Colapinto Monaco 2024".
+
+    Looks up driver names, nicknames, codes and numbers and circuit or GP
+    aliases in hash indexes, so a question is parsed in well under a
+    millisecond. Drivers come from the driver registry of the requested
+    season (the latest one if the question has no year), circuit aliases
+    from the FastF1 event schedule of that season plus CIRCUIT_ALIASES.
+    Every result carries a confidence so callers can fall back to the LLM
+    for free-form questions.
+
+    A question with a driver, a year, an explicit season marker and no
+    other unknown word ("Cómo viene Colapinto en la temporada 2025") asks
+    about the whole season and is returned with track None.
+    """
+    def __init__(self, registry=None):
+        """
+        Args:
+            registry (DriverRegistry): Drivers of each season (default the shared driver_registry)
+        """
+        if registry is None:
+            from data.driver_registry import driver_registry as registry
+        self.registry = registry
+        self._schedule_indexes = {}
+        self._lock = threading.Lock()
+        self.static_circuit_index = {alias: {location} for alias, location in CIRCUIT_ALIASES.items()}
+
+    def _schedule_circuit_index(self, year):
+        with self._lock:
+            cached = self._schedule_indexes.get(year)
+            if cached is not None:
+                index, loaded_at = cached
+                if index is not None or time.monotonic() - loaded_at < SCHEDULE_RETRY_SECONDS:
+                    return index
+
+        index = {}
+        try:
+            from data.cache import get_event_schedule
+            schedule = get_event_schedule(year)
+            locations = set(schedule['Location'])
+            for _, event in schedule.iterrows():
+                event_name = str(event['EventName'])
+                aliases = (event['Location'], event['Country'], event_name,
+                           event_name.replace('Grand Prix', ''))
+                for alias in aliases:
+                    alias = normalize_text(alias)
+                    if alias:
+                        index.setdefault(alias, set()).add(event['Location'])
+            for alias, location in CIRCUIT_ALIASES.items():
+                if location in locations:
+                    index.setdefault(alias, set()).add(location)
+        except Exception as e:
+            print(f"Could not load the {year} event schedule for the query parser: {str(e)}")
+            index = None
+
+        with self._lock:
+            self._schedule_indexes[year] = (index, time.monotonic())
+        return index
+
+    @staticmethod
+    def _find_aliases(tokens, index, used=None):
+        """
+        Returns the values of the longest, non-overlapping aliases found in
+        tokens. The positions of the matched tokens are added to used.
+        """
+        found = []
+        used = set() if used is None else used
+        for size in range(min(MAX_ALIAS_TOKENS, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                span = set(range(start, start + size))
+                if span & used:
+                    continue
+                value = index.get(' '.join(tokens[start:start + size]))
+                if value is not None:
+                    found.append(value)
+                    used |= span
+        return found
+
+    def parse(self, user_message):
+        """
+        Extracts pilot, year and track from a question.
+
+        Args:
+            user_message (str): User's question about F1
+
+        Returns:
+            tuple: (params dict with pilot, year and track, any of them None
+                if not found, track also None for season questions; confidence
+                between 0 and 1)
+        """
+        text = normalize_text(user_message)
+        tokens = text.split()
+        params = {'pilot': None, 'year': None, 'track': None}
+        score = 0.0
+
+        years = set(YEAR_PATTERN.findall(text))
+        if len(years) == 1:
+            params['year'] = int(years.pop())
+            score += 1
+        elif years:
+            score += 0.5
+
+        matched = set()
+        driver_index = self.registry.index(params['year'])
+        drivers = {d['name']: d for d in self._find_aliases(tokens, driver_index['names'], matched)}
+        for code in CODE_PATTERN.findall(str(user_message)):
+            if code in driver_index['codes']:
+                drivers[code] = driver_index['codes'][code]
+        for number in NUMBER_PATTERN.findall(text):
+            if number in driver_index['numbers']:
+                driver = driver_index['numbers'][number]
+                drivers[driver['name']] = driver
+        if len(drivers) == 1:
+            params['pilot'] = next(iter(drivers.values()))['last_name']
+            score += 1
+        elif drivers:
+            score += 0.5
+
+        circuit_index = self.static_circuit_index
+        year_index = self._schedule_circuit_index(params['year']) if params['year'] else None
+        if year_index is not None:
+            circuit_index = year_index
+        locations = set()
+        for aliases in self._find_aliases(tokens, circuit_index, matched):
+            locations |= aliases
+        if len(locations) == 1:
+            params['track'] = locations.pop()
+            ## Static aliases alone can not tell if that season raced there,
+            ## so without the schedule the question goes to the LLM
+            score += 1 if year_index is not None else 0.5
+        elif locations:
+            score += 0.5
+        elif self.is_season_query(user_message) and not self._unknown_words(tokens, matched, drivers):
+            score += 1
+
+        return params, score / 3
+
+    @staticmethod
+    def _unknown_words(tokens, matched, drivers):
+        """Words of a question that are not a matched alias, a driver code or number, a year, a season marker or filler."""
+        codes = {code.lower() for code in drivers}
+        return [
+            token for i, token in enumerate(tokens)
+            if i not in matched
+            and token not in codes
+            and token not in SEASON_FILLER_WORDS
+            and not SEASON_PATTERN.fullmatch(token)
+            and not token.lstrip('#').isdigit()
+            and token not in ('numero', 'auto')
+        ]
+
+    @staticmethod
+    def is_season_query(user_message):
+        """True if the question uses a word of questions about a whole season."""
+        return SEASON_PATTERN.search(normalize_text(user_message)) is not None
+
+## Parser confidence needed to skip the LLM. With the default a question
+## needs a single driver, year and circuit to be answered without the LLM
+MIN_CONFIDENCE = float(os.getenv('QUERY_PARSER_MIN_CONFIDENCE', '0.9'))
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+## Histogram bucket bounds in seconds, from DB round trips to cold FastF1 loads
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRIC_NAME = 'f1bot_stage_seconds'
+
+## Trace of the request being served. When None, spans go straight to the histograms
+_spans = contextvars.ContextVar('f1bot_spans', default=None)
+
+class _Trace:
+    """
+    Spans of one request. Tasks started by the request inherit it and may
+    outlive it (archival, pre-warming); once it is closed their spans go
+    straight to the histograms instead of being lost.
+    """
+    def __init__(self):
+        self.spans = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            if not self.closed:
+                self.spans.append(span)
+                return True
+        return False
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        return self.spans
+
+class Histogram:
+    """Cumulative histogram in the Prometheus sense: counts per upper bound, sum and count."""
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    Keeps one latency histogram per stage and label set, and renders them
+    in the Prometheus text format.
+    """
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, labels=None):
+        key = (stage, tuple(sorted((name, str(value)) for name, value in (labels or {}).items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @staticmethod
+    def _format_labels(pairs):
+        escaped = []
+        for name, value in pairs:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{name}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each stage of a request",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        with self._lock:
+            for (stage, labels), histogram in sorted(self._histograms.items()):
+                pairs = (('stage', stage),) + labels
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{METRIC_NAME}_bucket{self._format_labels(pairs + (('le', bound),))} {count}")
+                lines.append(f"{METRIC_NAME}_bucket{self._format_labels(pairs + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{METRIC_NAME}_sum{self._format_labels(pairs)} {histogram.sum:.6f}")
+                lines.append(f"{METRIC_NAME}_count{self._format_labels(pairs)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+## Shared registry for the whole process
+registry = MetricsRegistry()
+
+def record(stage, seconds, **labels):
+    """Records a finished span in the current request, or in the histograms if there is none or it has ended."""
+    trace = _spans.get()
+    if trace is None or not trace.add({'stage': stage, 'seconds': seconds, 'labels': labels}):
+        registry.observe(stage, seconds, labels)
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Times the block as one stage. Yields the labels so the block can add
+    the ones it only learns while running, like a cache hit or miss.
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield labels
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, status=status, **labels)
+
+def merge_spans(spans):
+    """Records spans collected in another process."""
+    for s in spans:
+        record(s['stage'], s['seconds'], **s['labels'])
+
+def collect_spans(func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) keeping its spans instead of recording them.
+    Used in worker processes, whose spans are merged by the parent.
+
+    Returns:
+        tuple: (result of func, list of spans)
+    """
+    trace = _Trace()
+    token = _spans.set(trace)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _spans.reset(token)
+        trace.close()
+    return result, trace.spans
+
+@contextmanager
+def request_trace(**fields):
+    """
+    Collects every span of a request. When the request ends its spans are
+    recorded in the histograms, together with the request total, and one
+    JSON log line summarizes where the time went. Spans of tasks that are
+    still running then go to the histograms only, not to the log line.
+
+    Yields the fields of the log line so the caller can add to them
+    (e.g. the parsed parameters or status='error').
+    """
+    trace = _Trace()
+    token = _spans.set(trace)
+    start = time.perf_counter()
+    fields.setdefault('status', 'ok')
+    try:
+        yield fields
+    except BaseException as e:
+        fields['status'] = 'error'
+        fields.setdefault('error', str(e))
+        raise
+    finally:
+        _spans.reset(token)
+        spans = trace.close()
+        total = time.perf_counter() - start
+        stages = {}
+        for s in spans:
+            registry.observe(s['stage'], s['seconds'], s['labels'])
+            stages[s['stage']] = stages.get(s['stage'], 0.0) + s['seconds'] * 1000
+        registry.observe('request', total, {'status': fields['status']})
+        line = {
+            'event': 'request',
+            **fields,
+            'total_ms': round(total * 1000, 1),
+            'stages_ms': {stage: round(ms, 1) for stage, ms in stages.items()},
+            'spans': [
+                {'stage': s['stage'], 'ms': round(s['seconds'] * 1000, 1), **s['labels']}
+                for s in spans
+            ],
+        }
+        print(json.dumps(line, default=str, ensure_ascii=False))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass ##Scrapes every few seconds would flood the bot's output
+
+def start_metrics_server(port=None, host=None):
+    """
+    Serves the histograms at http://host:port/metrics from a daemon thread.
+
+    Args:
+        port (int): Port (default METRICS_PORT or 9108, 0 disables the endpoint)
+        host (str): Interface (default METRICS_HOST or 127.0.0.1)
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if disabled
+    """
+    if port is None:
+        port = int(os.getenv('METRICS_PORT', '9108'))
+    if not port:
+        return None
+    host = host or os.getenv('METRICS_HOST', '127.0.0.1')
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"📈 Metrics at http://{host}:{port}/metrics")
+    return server
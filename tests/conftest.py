@@ -0,0 +1,6 @@
+import os
+import sys
+
+## The modules are imported as the bot imports them, from the base directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
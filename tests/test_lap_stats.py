@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fastf1.core import Laps
+
+from data.lap_stats import compute_lap_stats, quick_laps_of
+
+## compute_lap_stats replaces FastF1's per-driver filtering, so it must pick
+## the same laps as pick_drivers(...).pick_quicklaps() and pick_fastest()
+
+DRIVERS = [('1', 'VER', 'Red Bull'), ('11', 'PER', 'Red Bull'), ('43', 'COL', 'Williams'), ('23', 'ALB', 'Williams')]
+
+def make_laps(seed=0, laps_per_driver=30):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for position, (number, code, team) in enumerate(DRIVERS, start=1):
+        base = 90 + position * 0.4
+        best = None
+        for lap in range(1, laps_per_driver + 1):
+            seconds = base + rng.normal(0, 0.3)
+            if lap == 1:
+                seconds += 8 ##Standing start
+            if lap in (12, 13):
+                seconds += 25 ##Pit stop and safety car laps, over 107%
+            lap_time = pd.NaT if lap == 20 and code == 'PER' else pd.Timedelta(seconds=seconds)
+            personal_best = lap_time is not pd.NaT and (best is None or lap_time < best)
+            if personal_best:
+                best = lap_time
+            rows.append({
+                'Driver': code, 'DriverNumber': number, 'LapNumber': float(lap), 'Position': float(position),
+                'LapTime': lap_time, 'Compound': 'MEDIUM' if lap < 13 else 'HARD',
+                'Stint': 1.0 if lap < 13 else 2.0, 'TyreLife': float(lap if lap < 13 else lap - 12),
+                'Team': team, 'IsPersonalBest': personal_best,
+            })
+    ## A deleted lap: the fastest of COL by time, not a personal best
+    deleted = next(i for i, r in enumerate(rows) if r['Driver'] == 'COL' and r['LapNumber'] == 25)
+    rows[deleted].update(LapTime=pd.Timedelta(seconds=85), IsPersonalBest=False)
+    return pd.DataFrame(rows)
+
+@pytest.fixture
+def laps():
+    return make_laps()
+
+def test_quick_laps_match_pick_quicklaps(laps):
+    stats = compute_lap_stats(laps)
+    fastf1_laps = Laps(laps)
+    for number, _, _ in DRIVERS:
+        expected = fastf1_laps.pick_drivers(number).pick_quicklaps()
+        selected = stats['laps'][stats['quick'] & (stats['laps']['DriverNumber'] == number)]
+        assert selected['LapNumber'].tolist() == expected['LapNumber'].tolist()
+
+def test_fastest_laps_match_pick_fastest(laps):
+    stats = compute_lap_stats(laps)
+    fastf1_laps = Laps(laps)
+    fastest = stats['fastest_laps'].set_index('DriverNumber')
+    for number, _, _ in DRIVERS:
+        expected = fastf1_laps.pick_drivers(number).pick_fastest()
+        assert fastest.at[number, 'LapNumber'] == expected['LapNumber']
+        assert fastest.at[number, 'LapTime'] == expected['LapTime']
+    ## The deleted lap is never the fastest
+    assert fastest.at['43', 'LapTime'] > pd.Timedelta(seconds=85)
+
+def test_fastest_laps_sorted_with_delta(laps):
+    fastest = compute_lap_stats(laps)['fastest_laps']
+    assert fastest['LapTime'].is_monotonic_increasing
+    assert fastest['LapTimeDelta'].iloc[0] == pd.Timedelta(0)
+    assert (fastest['LapTimeDelta'] == fastest['LapTime'] - fastest['LapTime'].iloc[0]).all()
+
+def test_quick_laps_of_several_drivers(laps):
+    stats = compute_lap_stats(laps)
+    numbers = ['43', '23', '1']
+    expected = Laps(laps).pick_drivers(numbers).pick_quicklaps()
+    selected = quick_laps_of(stats, numbers)
+    assert sorted(zip(selected['DriverNumber'], selected['LapNumber'])) == \
+        sorted(zip(expected['DriverNumber'], expected['LapNumber']))
+
+def test_positions_and_abbreviations(laps):
+    stats = compute_lap_stats(laps)
+    for position, (number, code, _) in enumerate(DRIVERS, start=1):
+        assert stats['abbreviations'][number] == code
+        assert stats['start_position'][number] == position
+        assert stats['finish_position'][number] == position
+        assert stats['best_seconds'][number] == pytest.approx(laps[laps['DriverNumber'] == number]['LapTime'].min().total_seconds())
+
+def test_stored_quick_flag_is_used(laps):
+    ## Laps read from the lap store carry the flag computed on the full session
+    laps['IsQuick'] = False
+    stats = compute_lap_stats(laps)
+    assert not stats['quick'].any()
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+import data.cache
+from data.driver_registry import build_index
+from llm.query_parser import QueryParser, MIN_CONFIDENCE
+
+DRIVERS = [
+    {'name': 'COL', 'number': '43', 'first_name': 'Franco', 'last_name': 'Colapinto', 'team': 'Alpine'},
+    {'name': 'VER', 'number': '1', 'first_name': 'Max', 'last_name': 'Verstappen', 'team': 'Red Bull Racing'},
+    {'name': 'PER', 'number': '11', 'first_name': 'Sergio', 'last_name': 'Pérez', 'team': 'Red Bull Racing'},
+    {'name': 'HAM', 'number': '44', 'first_name': 'Lewis', 'last_name': 'Hamilton', 'team': 'Ferrari'},
+]
+
+SCHEDULE = pd.DataFrame([
+    {'Location': 'Monaco', 'Country': 'Monaco', 'EventName': 'Monaco Grand Prix'},
+    {'Location': 'São Paulo', 'Country': 'Brazil', 'EventName': 'São Paulo Grand Prix'},
+    {'Location': 'Spa-Francorchamps', 'Country': 'Belgium', 'EventName': 'Belgian Grand Prix'},
+])
+
+class StaticRegistry:
+    """Registry with the same drivers every season."""
+    def __init__(self, drivers):
+        self._index = build_index(drivers)
+
+    def index(self, year=None):
+        return self._index
+
+@pytest.fixture
+def parser(monkeypatch):
+    monkeypatch.setattr(data.cache, 'get_event_schedule', lambda year: SCHEDULE)
+    return QueryParser(registry=StaticRegistry(DRIVERS))
+
+@pytest.mark.parametrize('message, pilot, track', [
+    ("Como le fue a Colapinto en Monaco 2024", 'Colapinto', 'Monaco'),
+    ("colapinto mónaco 2024", 'Colapinto', 'Monaco'),
+    ("Qué tal Checo en Interlagos 2024?", 'Pérez', 'São Paulo'),
+    ("VER Brasil 2024", 'Verstappen', 'São Paulo'),
+    ("como le fue al #43 en spa 2024", 'Colapinto', 'Spa-Francorchamps'),
+    ("Franco en el Gran Premio de Belgica 2024", 'Colapinto', 'Spa-Francorchamps'),
+])
+def test_formulaic_questions_skip_the_llm(parser, message, pilot, track):
+    params, confidence = parser.parse(message)
+    assert params == {'pilot': pilot, 'year': 2024, 'track': track}
+    assert confidence >= MIN_CONFIDENCE
+
+@pytest.mark.parametrize('message', [
+    "Como le fue a Colapinto en Monaco",              ##No year
+    "Colapinto y Verstappen en Monaco 2024",         ##Two drivers
+    "Como le fue en Monaco 2024",                    ##No driver
+    "Colapinto en Monaco 2023 o 2024",               ##Two years
+    "Colapinto en Monaco o Spa 2024",                ##Two circuits
+    "cómo le va a Colapinto en Pepelandia 2024",     ##Unknown circuit
+    "como viene colapinto en 2024",                  ##No explicit season marker
+    "temporada 2024 de colapinto en pepelandia",     ##Season marker but an unknown word
+])
+def test_ambiguous_questions_go_to_the_llm(parser, message):
+    _, confidence = parser.parse(message)
+    assert confidence < MIN_CONFIDENCE
+
+@pytest.mark.parametrize('message', [
+    "Cómo viene Colapinto en la temporada 2024",
+    "como le va a colapinto en el año 2024",
+    "campeonato 2024 de checo",
+])
+def test_season_questions(parser, message):
+    params, confidence = parser.parse(message)
+    assert params['track'] is None and params['year'] == 2024 and params['pilot']
+    assert confidence >= MIN_CONFIDENCE
+    assert QueryParser.is_season_query(message)
+
+def test_common_words_are_not_season_markers():
+    assert not QueryParser.is_season_query("como le va a Colapinto en Interlagos 2024")
+    assert not QueryParser.is_season_query("como viene colapinto")
+
+def test_static_aliases_when_the_schedule_fails(monkeypatch):
+    def fail(year):
+        raise ConnectionError("offline")
+    monkeypatch.setattr(data.cache, 'get_event_schedule', fail)
+    parser = QueryParser(registry=StaticRegistry(DRIVERS))
+    params, confidence = parser.parse("Colapinto Monaco 2024")
+    assert params == {'pilot': 'Colapinto', 'year': 2024, 'track': 'Monaco'}
+    ## The static aliases still find the circuit, but the LLM checks that season raced there
+    assert confidence < MIN_CONFIDENCE
+
+def test_first_names_shared_by_two_drivers_are_not_aliases():
+    index = build_index(DRIVERS + [{'name': 'VES', 'number': '99', 'first_name': 'Max', 'last_name': 'Other', 'team': 'X'}])
+    assert 'max' not in index['names']
+    assert index['names']['franco']['name'] == 'COL'
+    assert index['names']['checo']['name'] == 'PER'
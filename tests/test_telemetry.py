@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from data.telemetry import lttb
+
+def reference_lttb(x, y, points):
+    """Plain loop LTTB with the same buckets as lttb, to check its vectorized areas."""
+    n = len(x)
+    edges = [int(e) for e in np.linspace(1, n - 1, points - 1)]
+    keep = [0]
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i == points - 3:
+            next_x, next_y = x[-1], y[-1]
+        else:
+            following = range(end, edges[i + 2])
+            next_x = sum(x[j] for j in following) / len(following)
+            next_y = sum(y[j] for j in following) / len(following)
+        prev = keep[-1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((x[prev] - next_x) * (y[j] - y[prev]) - (x[prev] - x[j]) * (next_y - y[prev]))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+    keep.append(n - 1)
+    return keep
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('points', [3, 10, 200])
+def test_matches_reference(seed, points):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(0.5, 5.0, 700))
+    y = rng.normal(200, 60, 700)
+    assert lttb(x, y, points).tolist() == reference_lttb(x, y, points)
+
+def test_keeps_ends_and_count():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    keep = lttb(x, y, 120)
+    assert len(keep) == 120
+    assert keep[0] == 0 and keep[-1] == 999
+    assert (np.diff(keep) > 0).all()
+
+def test_keeps_peaks():
+    ## A braking point on a straight must survive the reduction
+    x = np.arange(600, dtype=float)
+    y = np.full(600, 320.0)
+    y[317] = 80.0
+    assert 317 in lttb(x, y, 20)
+
+@pytest.mark.parametrize('points', [1, 2, 50, 60])
+def test_short_traces_are_kept_whole(points):
+    x = np.arange(50, dtype=float)
+    assert lttb(x, x, points).tolist() == list(range(50))
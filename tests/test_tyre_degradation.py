@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.lap_stats import compute_lap_stats
+from data.tyre_degradation import fit_stints
+
+def make_race(noise=0.0, seed=0):
+    """Two drivers, two stints each, with known degradation slopes."""
+    rng = np.random.default_rng(seed)
+    slopes = {('1', 1): 0.05, ('1', 2): 0.02, ('43', 1): 0.08, ('43', 2): 0.04}
+    rows = []
+    for number, code, base in (('1', 'VER', 90.0), ('43', 'COL', 91.0)):
+        for lap in range(1, 41):
+            stint = 1 if lap <= 20 else 2
+            tyre_life = lap if stint == 1 else lap - 20
+            ## Laps are slower with the fuel still to burn, fit_stints must take it out
+            seconds = base + slopes[(number, stint)] * tyre_life + 0.06 * (40 - lap) + rng.normal(0, noise)
+            rows.append({
+                'Driver': code, 'DriverNumber': number, 'LapNumber': float(lap), 'Position': 1.0,
+                'LapTime': pd.Timedelta(seconds=seconds), 'Compound': 'SOFT' if stint == 1 else 'HARD',
+                'Stint': float(stint), 'TyreLife': float(tyre_life), 'Team': code, 'IsPersonalBest': False,
+            })
+    return pd.DataFrame(rows), slopes
+
+def test_recovers_fuel_corrected_slopes():
+    laps, slopes = make_race()
+    stints = fit_stints(compute_lap_stats(laps), fuel_correction=0.06)
+    assert len(stints) == 4
+    for row in stints.itertuples():
+        assert row.Slope == pytest.approx(slopes[(row.DriverNumber, int(row.Stint))], abs=1e-9)
+        assert row.Residual == pytest.approx(0, abs=1e-6)
+    assert stints['Slope'].is_monotonic_increasing
+
+def test_matches_polyfit_per_stint():
+    laps, _ = make_race(noise=0.2)
+    stats = compute_lap_stats(laps)
+    stints = fit_stints(stats, fuel_correction=0.06, min_laps=1)
+    selected = stats['laps'][stats['quick'] & (stats['laps']['LapNumber'] > 1)]
+    last_lap = selected['LapNumber'].max()
+    for row in stints.itertuples():
+        stint = selected[(selected['DriverNumber'] == row.DriverNumber) & (selected['Stint'] == row.Stint)]
+        y = stint['LapTime(s)'] - 0.06 * (last_lap - stint['LapNumber'])
+        slope, intercept = np.polyfit(stint['TyreLife'], y, 1)
+        assert row.Laps == len(stint)
+        assert row.Slope == pytest.approx(slope)
+        assert row.Intercept == pytest.approx(intercept)
+
+def test_skips_short_stints_and_first_lap():
+    laps, _ = make_race()
+    stints = fit_stints(compute_lap_stats(laps), min_laps=20)
+    ## The first stints lose lap 1, so only the 20 lap second stints are left
+    assert sorted(stints['Stint'].tolist()) == [2.0, 2.0]
+    assert (stints['FirstLap'] == 21).all()
+
+def test_no_stint_columns():
+    laps, _ = make_race()
+    stints = fit_stints(compute_lap_stats(laps.drop(columns=['Stint', 'TyreLife'])))
+    assert stints.empty
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+
+from bot.workers import BoundedExecutor, QueueFullError, SingleFlight
+
+def test_single_flight_runs_concurrent_calls_once():
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.run('key', work, 21) for _ in range(5)))
+        assert not flight.is_running('key')
+        return results
+
+    assert asyncio.run(main()) == [42] * 5
+    assert calls == [21]
+
+def test_single_flight_shares_exceptions_and_forgets_the_key():
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("no data")
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.run('key', fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        ## A later call runs the work again
+        with pytest.raises(ValueError):
+            await flight.run('key', fail)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+def test_single_flight_keys_are_independent():
+    async def work(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(flight.run('a', work, 1), flight.run('b', work, 2))
+
+    assert asyncio.run(main()) == [1, 2]
+
+def test_bounded_executor_queues_and_rejects():
+    release = threading.Event()
+
+    async def main():
+        executor = BoundedExecutor('test', max_workers=1, max_queue=1)
+        try:
+            first = asyncio.ensure_future(executor.run(release.wait, 5))
+            await asyncio.sleep(0.05)
+            assert executor.running == 1 and executor.is_busy() and not executor.is_full()
+
+            second = asyncio.ensure_future(executor.run(lambda: 'second'))
+            await asyncio.sleep(0.05)
+            assert executor.queue_depth == 1 and executor.is_full()
+            with pytest.raises(QueueFullError):
+                await executor.run(lambda: 'third')
+
+            release.set()
+            assert await first is True
+            assert await second == 'second'
+            assert executor.running == 0 and executor.queue_depth == 0 and not executor.is_busy()
+        finally:
+            release.set()
+            executor.shutdown()
+
+    asyncio.run(main())
+
+def test_bounded_executor_propagates_exceptions():
+    def fail():
+        raise RuntimeError("boom")
+
+    async def main():
+        executor = BoundedExecutor('test', max_workers=2, max_queue=0)
+        try:
+            with pytest.raises(RuntimeError):
+                await executor.run(fail)
+            assert executor.running == 0
+        finally:
+            executor.shutdown()
+
+    asyncio.run(main())